@@ -0,0 +1,41 @@
+import os
+import time
+
+import django
+
+
+def setup_django():
+    """
+    Configures Django with the test project settings so the benchmarks can
+    run standalone (python -m benchmarks.<name>).
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    django.setup()
+
+
+def setup_database():
+    """
+    Switches the default database to an in-memory SQLite and creates the
+    tables. Must be called before the first query.
+    """
+    from django.conf import settings
+    from django.core.management import call_command
+    settings.DATABASES['default']['NAME'] = ':memory:'
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def measure(func, iterations):
+    """
+    Runs func() the given number of times and returns the average cost of
+    one call in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def report(name, results):
+    print(name)
+    for label, value in results:
+        print('  {:<40} {:>10.2f} us/event'.format(label, value))
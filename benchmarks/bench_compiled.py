@@ -0,0 +1,63 @@
+"""
+Per-event serialization cost of the cached DRF serializer against the
+compiled serializer ('serializer_backend': 'compiled'), on a narrow and
+on a wide model.
+
+    python -m benchmarks.bench_compiled
+"""
+import uuid
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal
+
+from benchmarks.base import setup_django, measure, report
+
+ITERATIONS = 5000
+
+
+def main():
+    setup_django()
+    from kombu.utils import json
+
+    from django_events_sourcing.dispatcher import serialize_model
+    from django_events_sourcing.registry import ModelConfig
+    from tests.test_app.models import StatusModel, WideModel
+
+    status = StatusModel(
+        id=1, status='created', int_field=10, char_field='test',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+    )
+    wide = WideModel(
+        id=1, model1_id=2, int_field=1, big_int_field=2 ** 40,
+        small_int_field=-3, positive_int_field=4, priority=2,
+        float_field=1.5, decimal_field=Decimal('12.5'), bool_field=True,
+        null_bool_field=None, char_field='char', kind='b',
+        text_field='text', email_field='a@b.com', slug_field='slug',
+        url_field='http://a.b', ip_field='127.0.0.1',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1, 10, 30),
+        null_dt_field=None, date_field=date(2019, 1, 2),
+        time_field=time(10, 30), duration_field=timedelta(hours=1),
+        json_field={'a': [1, 2]},
+    )
+
+    for instance in (status, wide):
+        model = type(instance)
+        label = model._meta.label
+        drf = ModelConfig(model, {'model': label})
+        compiled = ModelConfig(
+            model, {'model': label, 'serializer_backend': 'compiled'}
+        )
+        assert json.dumps(serialize_model(instance, drf)) == \
+            json.dumps(serialize_model(instance, compiled))
+        report('serialize {} ({} fields)'.format(
+            model.__name__, len(model._meta.concrete_fields)
+        ), [
+            ('cached DRF serializer',
+             measure(lambda: serialize_model(instance, drf), ITERATIONS)),
+            ('compiled serializer',
+             measure(lambda: serialize_model(instance, compiled),
+                     ITERATIONS)),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Bytes on the wire and encoding CPU per event for every encoding and
+compression, on a small and on a multi-KB payload. This is the body
+handed to the broker, before the AMQP framing.
+
+    python -m benchmarks.bench_encoding
+"""
+from benchmarks.base import setup_django, measure
+
+ITERATIONS = 2000
+
+SMALL = {'id': 1, 'status': 'created', 'int_field': 10, 'char_field': 'test',
+         'uuid_field': '0b52fd4d-11f9-4f8b-a3a5-9bd1b0d4b84d',
+         'dt_field': '2019-01-01T00:00:00'}
+LARGE = dict(SMALL, items=[
+    {'id': index, 'name': 'item {}'.format(index), 'price': '10.50',
+     'tags': ['a', 'b', 'c']}
+    for index in range(60)
+])
+
+CONFIGURATIONS = [
+    ('json', None), ('compact_json', None), ('msgpack', None),
+    ('json', 'zlib'), ('compact_json', 'zlib'), ('compact_json', 'lzma'),
+    ('compact_json', 'bzip2'), ('msgpack', 'zlib'),
+]
+
+
+def main():
+    setup_django()
+    from kombu import compression, serialization
+
+    from django_events_sourcing.encoding import get_encoder
+
+    for name, payload in (('small', SMALL), ('large', LARGE)):
+        print('{} payload'.format(name))
+        for encoding, compression_method in CONFIGURATIONS:
+            try:
+                encoder = get_encoder(encoding, compression_method, 0)
+            except ValueError:
+                print('  {:<28} not installed'.format(encoding))
+                continue
+
+            def encode():
+                # What kombu does to the body before publishing it.
+                if encoder is None:
+                    body = serialization.dumps(payload, 'json')[2]
+                    options = {}
+                else:
+                    body, options = encoder.encode(payload)
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                if 'compression' in options:
+                    body = compression.compress(
+                        body, options['compression'])[0]
+                return body
+
+            print('  {:<28} {:>8} bytes {:>10.2f} us/event'.format(
+                encoding if compression_method is None
+                else '{} + {}'.format(encoding, compression_method),
+                len(encode()), measure(encode, ITERATIONS)
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Outbox throughput: cost of writing the events in the model transaction
+and events/sec published by relay_outbox to kombu's memory transport.
+
+    python -m benchmarks.bench_outbox
+"""
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.base import setup_django, setup_database
+
+EVENTS = 20000
+BATCH_SIZES = (100, 500, 2000)
+
+
+def main():
+    setup_django()
+    setup_database()
+    from django.db import transaction
+    from django.test.utils import override_settings
+
+    from django_events_sourcing.models import EventOutbox
+    from django_events_sourcing.outbox import relay_outbox
+    from tests.test_app.models import Model1
+
+    with override_settings(EVENTS_SOURCING_BACKEND='outbox'):
+        start = time.perf_counter()
+        with transaction.atomic():
+            for i in range(EVENTS):
+                Model1.objects.create(
+                    int_field=i, char_field='test', uuid_field=uuid.uuid4(),
+                    dt_field=datetime(2019, 1, 1)
+                )
+        elapsed = time.perf_counter() - start
+    print('outbox write ({} saves in one transaction)'.format(EVENTS))
+    print('  {:<40} {:>10.2f} us/save'.format(
+        'save + outbox insert', elapsed / EVENTS * 1e6))
+
+    print('relay to memory://')
+    for batch_size in BATCH_SIZES:
+        EventOutbox.objects.update(sent_at=None)
+        start = time.perf_counter()
+        relayed = 0
+        while True:
+            sent = relay_outbox('memory://', batch_size=batch_size)
+            relayed += sent
+            if sent < batch_size:
+                break
+        elapsed = time.perf_counter() - start
+        print('  {:<40} {:>10.0f} events/s'.format(
+            'batch_size={}'.format(batch_size), relayed / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+End to end dispatch pipeline benchmark, from the model save (or the
+dispatch_event call) to the message delivered to kombu's memory transport.
+It runs offline and reports events/sec and latency per operation as JSON,
+so the results of two releases can be compared:
+
+    python -m benchmarks.bench_pipeline --output current.json
+    python -m benchmarks.bench_pipeline --compare baseline.json
+
+--compare exits with status 1 when the throughput of a scenario dropped
+more than --tolerance (10% by default) against the baseline.
+"""
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, date, time as dt_time, timedelta
+from decimal import Decimal
+
+from benchmarks.base import setup_django, setup_database
+
+MODEL1_CUSTOM = {
+    'model': 'test_app.Model1',
+    'serializer': 'tests.test_app.serializers.Model1Serializer'
+}
+MODEL1_AUTO = {'model': 'test_app.Model1'}
+STATUS_MODEL = {'model': 'test_app.StatusModel', 'status_field': 'status'}
+WIDE_MODEL = {'model': 'test_app.WideModel'}
+WIDE_MODEL_COMPILED = {
+    'model': 'test_app.WideModel', 'serializer_backend': 'compiled'
+}
+
+TRANSACTION_SIZE = 100
+BULK_SIZE = 500
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def new_model1(**kwargs):
+    from tests.test_app.models import Model1
+    return Model1(
+        int_field=10, char_field='test', uuid_field=uuid.uuid4(),
+        dt_field=datetime(2019, 1, 1), **kwargs
+    )
+
+
+def new_status_model():
+    from tests.test_app.models import StatusModel
+    return StatusModel(
+        status='created', int_field=10, char_field='test',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+    )
+
+
+def new_wide_model(**kwargs):
+    from tests.test_app.models import WideModel
+    return WideModel(
+        model1_id=None, int_field=1, big_int_field=2 ** 40,
+        small_int_field=-3, positive_int_field=4, priority=2,
+        float_field=1.5, decimal_field=Decimal('12.5'), bool_field=True,
+        null_bool_field=None, char_field='char' * 20, kind='b',
+        text_field='text ' * 100, email_field='a@b.com', slug_field='slug',
+        url_field='http://a.b', ip_field='127.0.0.1',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1, 10, 30),
+        null_dt_field=None, date_field=date(2019, 1, 2),
+        time_field=dt_time(10, 30), duration_field=timedelta(hours=1),
+        json_field={'a': list(range(20))}, **kwargs
+    )
+
+
+# Each scenario returns a list of operations, each publishing
+# events_per_op events. Operations are timed one by one, at least one is
+# run whatever the number of events asked for.
+
+def save_single(events):
+    def op():
+        new_model1().save()
+    return [op] * events, 1
+
+
+def save_transaction(events):
+    from django.db import transaction
+
+    def op():
+        with transaction.atomic():
+            for _ in range(TRANSACTION_SIZE):
+                new_model1().save()
+    return [op] * max(1, events // TRANSACTION_SIZE), TRANSACTION_SIZE
+
+
+def save_status_model(events):
+    def op():
+        new_status_model().save()
+    return [op] * events, 1
+
+
+def bulk_create(events):
+    from tests.test_app.models import Model1
+
+    def op():
+        Model1.objects.bulk_create([new_model1() for _ in range(BULK_SIZE)])
+    return [op] * max(1, events // BULK_SIZE), BULK_SIZE
+
+
+def dispatch_instance(factory):
+    def scenario(events):
+        from django_events_sourcing.dispatcher import dispatch_event
+        instance = factory(id=1)
+
+        def op():
+            dispatch_event(instance, 'updated')
+        return [op] * events, 1
+    return scenario
+
+
+SCENARIOS = [
+    # name, MODELS_CRUD_EVENT, extra settings, scenario, threads
+    ('save_single', [MODEL1_CUSTOM], {}, save_single, 1),
+    ('save_transaction', [MODEL1_CUSTOM],
+     {'EVENTS_SOURCING_DISPATCH_ON_COMMIT': True}, save_transaction, 1),
+    ('save_status_model', [STATUS_MODEL], {}, save_status_model, 1),
+    ('bulk_create', [MODEL1_CUSTOM], {}, bulk_create, 1),
+    ('dispatch_custom_serializer', [MODEL1_CUSTOM], {},
+     dispatch_instance(new_model1), 1),
+    ('dispatch_auto_serializer', [MODEL1_AUTO], {},
+     dispatch_instance(new_model1), 1),
+    ('dispatch_wide', [WIDE_MODEL], {},
+     dispatch_instance(new_wide_model), 1),
+    ('dispatch_wide_compiled', [WIDE_MODEL_COMPILED], {},
+     dispatch_instance(new_wide_model), 1),
+    ('dispatch_threads_1', [MODEL1_CUSTOM], {},
+     dispatch_instance(new_model1), 1),
+    ('dispatch_threads_n', [MODEL1_CUSTOM], {},
+     dispatch_instance(new_model1), None),
+]
+
+
+def run_operations(operations):
+    latencies = []
+    for op in operations:
+        start = time.perf_counter()
+        op()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_scenario(scenario, events, threads):
+    operations, events_per_op = scenario(events)
+    per_thread = [operations[index::threads] for index in range(threads)]
+    results = [None] * threads
+
+    def worker(index):
+        results[index] = run_operations(per_thread[index])
+
+    start = time.perf_counter()
+    if threads == 1:
+        worker(0)
+    else:
+        workers = [
+            threading.Thread(target=worker, args=(index,))
+            for index in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for result in results for latency in result]
+    published = len(latencies) * events_per_op
+    return {
+        'events': published,
+        'threads': threads,
+        'events_per_op': events_per_op,
+        'seconds': elapsed,
+        'events_per_sec': published / elapsed,
+        'latency_us': {
+            'p50': percentile(latencies, 50) * 1e6,
+            'p90': percentile(latencies, 90) * 1e6,
+            'p99': percentile(latencies, 99) * 1e6,
+            'max': max(latencies) * 1e6,
+        },
+    }
+
+
+def delivered(connection, queue):
+    count = 0
+    while queue(connection.default_channel).get(no_ack=True) is not None:
+        count += 1
+    return count
+
+
+def run(events, threads, only=None):
+    from django.test.utils import override_settings
+    from kombu import Connection, Queue
+
+    from django_events_sourcing.senders.kombu import get_exchange
+
+    connection = Connection('memory://')
+    queue = Queue(
+        'bench_pipeline', exchange=get_exchange('test_service'),
+        routing_key='#'
+    )
+    queue(connection.default_channel).declare()
+
+    results = {}
+    for name, models, extra, scenario, scenario_threads in SCENARIOS:
+        if only and name not in only:
+            continue
+        with override_settings(
+                AMQP_URI='memory://', MODELS_CRUD_EVENT=models, **extra):
+            result = run_scenario(scenario, events, scenario_threads or threads)
+        result['delivered'] = delivered(connection, queue)
+        assert result['delivered'] == result['events'], result
+        results[name] = result
+        print('{:<28} {:>10.0f} events/s  p50 {:>8.1f}us  p99 {:>8.1f}us'
+              .format(name, result['events_per_sec'],
+                      result['latency_us']['p50'],
+                      result['latency_us']['p99']), file=sys.stderr)
+    connection.release()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return list of the scenarios whose throughput regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        change = result['events_per_sec'] / previous['events_per_sec'] - 1
+        print('{:<28} {:>+8.1%}'.format(name, change), file=sys.stderr)
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--events', type=int, default=5000,
+                        help='Events published per scenario.')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Threads of the dispatch_threads_n scenario.')
+    parser.add_argument('--scenario', action='append',
+                        help='Run only this scenario (repeatable).')
+    parser.add_argument('--output', help='Write the JSON results here.')
+    parser.add_argument('--compare', help='JSON results of a baseline run.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed throughput drop against --compare.')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    setup_database()
+    import django
+    import kombu
+
+    report = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'kombu': kombu.__version__,
+        'events': args.events,
+        'scenarios': run(args.events, args.threads, args.scenario),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report['scenarios'], baseline, args.tolerance)
+        if regressions:
+            print('Throughput regressed: {}'.format(', '.join(regressions)),
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
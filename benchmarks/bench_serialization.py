@@ -0,0 +1,48 @@
+"""
+Per-event serialization cost: building a serializer class and discovering
+its fields on every event (the behavior before the serializer cache)
+against the cached serializer used by dispatch_event.
+
+    python -m benchmarks.bench_serialization
+"""
+import uuid
+from datetime import datetime
+
+from benchmarks.base import setup_django, measure, report
+
+ITERATIONS = 5000
+
+
+def main():
+    setup_django()
+    from rest_framework import serializers
+
+    from django_events_sourcing.dispatcher import serialize_model
+    from django_events_sourcing.registry import get_model_config
+    from tests.test_app.models import StatusModel
+
+    instance = StatusModel(
+        id=1, status='created', int_field=10, char_field='test',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+    )
+    model_config = get_model_config(StatusModel)
+
+    def uncached():
+        serializer = type(
+            'NoClassSerializer', (serializers.ModelSerializer,),
+            {'Meta': type('Meta', (), {'model': StatusModel,
+                                       'fields': '__all__'})})
+        return serializer(instance=instance).data
+
+    def cached():
+        return serialize_model(instance, model_config)
+
+    assert uncached() == cached()
+    report('serialize StatusModel (auto serializer)', [
+        ('new class per event', measure(uncached, ITERATIONS)),
+        ('cached serializer', measure(cached, ITERATIONS)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ASYNC_PUBLISHER_OPTIONS = {
+    'max_workers': 1,
+    'shutdown_timeout': 5.0,
+}
+
+
+def get_calling_event_loop():
+    """
+    Returns the running event loop that called the current thread through
+    sync_to_async (e.g. Model.asave()), or None when the current thread
+    wasn't called from async code.
+    """
+    local = SyncToAsync.threadlocal
+    loop = getattr(local, 'main_event_loop', None)
+    if loop is None or getattr(local, 'main_event_loop_pid', None) != \
+            os.getpid():
+        return None
+    if loop.is_closed() or not loop.is_running():
+        return None
+    return loop
+
+
+def offload_to_async():
+    """
+    Whether the events published by the current thread must be handed to
+    the async publisher instead of blocking it, see
+    settings.EVENTS_SOURCING_ASYNC_OFFLOAD.
+    """
+    return getattr(settings, 'EVENTS_SOURCING_ASYNC_OFFLOAD', False) and \
+        get_calling_event_loop() is not None
+
+
+class AsyncPublisher:
+    """
+    Publishes events for async code from a dedicated thread pool, so the
+    event loop (and the thread running sync_to_async calls) never waits for
+    the broker or its confirms.
+
+    The worker threads reuse the pooled broker connections, which stay open
+    between publishes.
+    """
+
+    def __init__(self, send_events, max_workers=1, shutdown_timeout=5.0):
+        self.send_events = send_events
+        self.max_workers = max_workers
+        self.shutdown_timeout = shutdown_timeout
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        self.max_workers,
+                        thread_name_prefix='events-sourcing-async'
+                    )
+        return self._executor
+
+    async def publish(self, events):
+        """
+        Publishes a list of events and waits for it without blocking the
+        event loop. Failures are raised like send_events does.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._get_executor(), self.send_events, events
+        )
+
+    def submit(self, events):
+        """
+        Publishes a list of events in the background, without waiting.
+        Failures are logged.
+
+        :return concurrent.futures.Future
+        """
+        future = self._get_executor().submit(self.send_events, events)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        exc = future.exception()
+        if exc is not None:
+            logger.error('Failed to publish events', exc_info=exc)
+
+    def flush(self, timeout=None):
+        """
+        Waits until the events submitted so far were published.
+
+        :param timeout: Max seconds to wait, None waits forever
+        :return True if every submitted event was published
+        """
+        with self._lock:
+            pending = set(self._pending)
+        _, not_done = wait(pending, timeout)
+        return not not_done
+
+    def shutdown(self, timeout=None):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if not self.flush(timeout):
+            logger.warning('Events async publisher did not stop in time')
+        executor.shutdown(wait=False)
+
+
+_async_publisher = None
+_async_publisher_lock = threading.Lock()
+
+
+def get_async_publisher(send_events):
+    """
+    Returns the AsyncPublisher of the current process, configured with
+    settings.EVENTS_SOURCING_ASYNC_PUBLISHER.
+
+    :param send_events: Callable that publishes a list of events
+    :return AsyncPublisher
+    """
+    global _async_publisher
+    if _async_publisher is None:
+        with _async_publisher_lock:
+            if _async_publisher is None:
+                options = dict(DEFAULT_ASYNC_PUBLISHER_OPTIONS)
+                options.update(getattr(
+                    settings, 'EVENTS_SOURCING_ASYNC_PUBLISHER', {}
+                ))
+                _async_publisher = AsyncPublisher(send_events, **options)
+    return _async_publisher
+
+
+def shutdown_async_publisher():
+    """
+    Waits for the submitted events and stops the async publisher, if it
+    was started.
+    """
+    global _async_publisher
+    publisher, _async_publisher = _async_publisher, None
+    if publisher is not None:
+        publisher.shutdown(publisher.shutdown_timeout)
+
+
+def _reset_after_fork():
+    # The executor threads don't survive a fork.
+    global _async_publisher, _async_publisher_lock
+    _async_publisher = None
+    _async_publisher_lock = threading.Lock()
+
+
+atexit.register(shutdown_async_publisher)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_async_publisher(setting, **kwargs):
+    if setting == 'EVENTS_SOURCING_ASYNC_PUBLISHER':
+        shutdown_async_publisher()
@@ -5,5 +5,12 @@ class DjangoEventsSourcingConfig(AppConfig):
     name = 'django_events_sourcing'
 
     def ready(self):
-        from django_events_sourcing.register import register_models
+        from django_events_sourcing.instrumentation import \
+            configure_instrument
+        from django_events_sourcing.registry import build_registry
+        from django_events_sourcing.register import register_models, \
+            register_change_tracking
+        configure_instrument()
+        build_registry()
         register_models()
+        register_change_tracking()
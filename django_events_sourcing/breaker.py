@@ -0,0 +1,61 @@
+import threading
+import time
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stops calling the broker after failure_threshold consecutive failures.
+
+    Once open, calls are refused until reset_timeout seconds went by. Then
+    a single call is let through (half open): the circuit closes if it
+    succeeds and opens again for another reset_timeout if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return True if the broker can be called
+        """
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and \
+                    time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """
+        :return True if this failure opened the circuit
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or (
+                    self.state == STATE_CLOSED and
+                    self.failures >= self.failure_threshold):
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    @property
+    def is_open(self):
+        return self.state != STATE_CLOSED
@@ -0,0 +1,122 @@
+import threading
+import weakref
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from django_events_sourcing.coalescing import coalesce_events
+
+_local = threading.local()
+
+
+class _PendingEvent:
+    """
+    on_commit() callback registered for every buffered event.
+
+    Django drops the callbacks registered inside a savepoint when that
+    savepoint is rolled back, so only the events that survived up to the
+    final commit are ever called.
+    """
+    __slots__ = ('buffer', 'event', '__weakref__')
+
+    def __init__(self, buffer, event):
+        self.buffer = buffer
+        self.event = event
+
+    def __call__(self):
+        self.buffer.committed(self)
+
+
+class TransactionBuffer:
+    """
+    Holds the events produced inside the current transaction of one
+    database alias and sends them all at once after the commit.
+
+    Each event registers its own on_commit() callback, which gives us
+    Django's savepoint handling for free. The buffer only keeps weak
+    references to the callbacks: the ones Django dropped with a rolled back
+    savepoint (or transaction) are gone, so the last callback still alive
+    knows every surviving event was collected and flushes them.
+    """
+
+    def __init__(self, using, send_events):
+        self.using = using
+        self.send_events = send_events
+        self.events = []
+        self._pending = weakref.WeakSet()
+
+    def add(self, event):
+        if not self._pending:
+            # The callbacks of the previous transaction all ran or were
+            # dropped with its rollback.
+            self.events = []
+        callback = _PendingEvent(self, event)
+        self._pending.add(callback)
+        transaction.on_commit(callback, using=self.using)
+
+    def committed(self, callback):
+        self._pending.discard(callback)
+        self.events.append(callback.event)
+        if not self._pending:
+            self.flush()
+
+    def flush(self):
+        events, self.events = self.events, []
+        events = coalesce_events(events)
+        if events:
+            self.send_events(events)
+
+
+def in_transaction(using=None):
+    """
+    Returns True if there's an atomic block open on the given alias.
+    """
+    return transaction.get_connection(using).in_atomic_block
+
+
+def get_transaction_buffer(using, send_events):
+    """
+    Returns the TransactionBuffer of the current thread for a database
+    alias, creating it if needed.
+
+    :param using: Database alias
+    :param send_events: Callable that publishes a list of events
+    :return TransactionBuffer
+    """
+    using = using or DEFAULT_DB_ALIAS
+    try:
+        buffers = _local.buffers
+    except AttributeError:
+        buffers = _local.buffers = {}
+    buffer = buffers.get(using)
+    if buffer is None:
+        buffer = buffers[using] = TransactionBuffer(using, send_events)
+    return buffer
+
+
+@contextmanager
+def collect_events():
+    """
+    Captures every event dispatched by the current thread inside the block
+    instead of publishing it. The captured events are available in the
+    yielded list; the caller decides what to do with them.
+    """
+    try:
+        collectors = _local.collectors
+    except AttributeError:
+        collectors = _local.collectors = []
+    events = []
+    collectors.append(events)
+    try:
+        yield events
+    finally:
+        collectors.pop()
+
+
+def get_collector():
+    """
+    Returns the list of the innermost active collect_events() block, or
+    None when events are not being collected.
+    """
+    collectors = getattr(_local, 'collectors', None)
+    return collectors[-1] if collectors else None
@@ -0,0 +1,108 @@
+from django_events_sourcing.events import Event
+
+DEFAULT_COALESCE_RULES = {
+    # Fold the updates of an object created in the same unit of work into
+    # its created event.
+    'absorb_updates': True,
+    # Drop both events of an object created and deleted in the same unit of
+    # work.
+    'drop_transient': False,
+}
+
+
+def get_coalesce_rules(model_data):
+    """
+    Returns the coalescing rules of a MODELS_CRUD_EVENT entry, or None if
+    its events must not be coalesced.
+
+    :param model_data: dict
+    :return dict
+    """
+    coalesce = model_data.get('coalesce')
+    if not coalesce:
+        return None
+    rules = dict(DEFAULT_COALESCE_RULES)
+    if isinstance(coalesce, dict):
+        rules.update(coalesce)
+    return rules
+
+
+def _merge(previous, event, rules):
+    """
+    Merges an event into the previous event kept for the same object.
+
+    :return (merged, keep_event): merged replaces previous (None removes
+        it), keep_event tells if event must still be appended.
+    """
+    model_config = event.model_config
+    is_status_model = model_config.get_status is not None
+
+    if event.action == 'updated':
+        if previous.action == 'deleted':
+            return previous, True
+        if previous.action == 'created' and not rules['absorb_updates']:
+            return previous, True
+        if is_status_model and previous.event_name != event.event_name:
+            # Status transitions are always kept.
+            return previous, True
+        payload = event.payload
+        if event.delta:
+            payload = dict(previous.payload)
+            payload.update(event.payload)
+        # A full payload replacing a delta one is not a delta anymore.
+        return Event(
+            model_config, previous.event_name, payload, event.pk,
+            previous.action, previous.delta and event.delta
+        ), False
+
+    if event.action == 'deleted' and not is_status_model:
+        if previous.action == 'updated':
+            return None, True
+        if previous.action == 'created' and rules['drop_transient']:
+            return None, False
+
+    return previous, True
+
+
+def coalesce_events(events):
+    """
+    Collapses the events produced for the same object (model, pk) inside a
+    unit of work, for the models configured with 'coalesce':
+
+    - Consecutive updates are replaced by the last one.
+    - Updates are folded into the created event of the same unit of work
+      (absorb_updates).
+    - Updates followed by a delete are dropped, the delete carries the
+      final state.
+    - A created event followed by a delete removes both (drop_transient).
+    - For status_field models, only updates that keep the same status are
+      collapsed, every status transition is kept.
+
+    Merged events take the position of the last event of the object, so
+    the final state comes after the events of the objects it may reference.
+    Delta payloads are merged into the payload they're folded into.
+
+    :param events: list of Event
+    :return list of Event
+    """
+    result = []
+    last = {}
+    for event in events:
+        rules = event.model_config.coalesce
+        if rules is None or event.pk is None:
+            result.append(event)
+            continue
+        key = (event.model_config.model, event.pk)
+        index = last.get(key)
+        if index is not None and result[index] is not None:
+            merged, keep_event = _merge(result[index], event, rules)
+            if not keep_event:
+                result[index] = None
+                if merged is not None:
+                    last[key] = len(result)
+                    result.append(merged)
+                continue
+            result[index] = merged
+        last[key] = len(result)
+        result.append(event)
+    return [event for event in result if event is not None]
@@ -0,0 +1,237 @@
+import datetime
+import decimal
+import keyword
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.timezone import get_current_timezone
+from rest_framework import ISO_8601, fields, relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+SERIALIZER_DRF = 'drf'
+SERIALIZER_COMPILED = 'compiled'
+
+# DRF to_representation implementations that are a single expression.
+INLINE_CONVERTERS = {
+    fields.IntegerField.to_representation: 'int({value})',
+    fields.CharField.to_representation: 'str({value})',
+    fields.FloatField.to_representation: 'float({value})',
+}
+
+
+def _uuid_converter(field):
+    if field.uuid_format == 'hex_verbose':
+        return 'str({value})'
+    return None
+
+
+def _boolean_converter(field):
+    to_representation = field.to_representation
+
+    def convert(value):
+        if value is True or value is False:
+            return value
+        return to_representation(value)
+    return convert
+
+
+def _choice_converter(field):
+    choices = field.choice_strings_to_values
+    to_representation = field.to_representation
+
+    def convert(value):
+        # Enum members (e.g. TextChoices) are subclasses and go through DRF.
+        if type(value) is str or type(value) is int:
+            return choices.get(str(value), value)
+        return to_representation(value)
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601 or \
+            hasattr(field, 'timezone'):
+        return None
+    to_representation = field.to_representation
+
+    def convert(value):
+        if type(value) is not datetime.datetime:
+            return to_representation(value)
+        aware = value.utcoffset() is not None
+        if settings.USE_TZ:
+            if not aware:
+                return to_representation(value)
+            try:
+                value = value.astimezone(get_current_timezone())
+            except OverflowError:
+                return to_representation(value)
+        elif aware:
+            return to_representation(value)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return None
+    to_representation = field.to_representation
+
+    def convert(value):
+        if type(value) is datetime.date:
+            return value.isoformat()
+        return to_representation(value)
+    return convert
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(
+        field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if not coerce_to_string or field.localize or \
+            getattr(field, 'normalize_output', False) or \
+            field.decimal_places is None:
+        return None
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    max_digits = field.max_digits
+    rounding = field.rounding
+    to_representation = field.to_representation
+
+    def convert(value):
+        if type(value) is not decimal.Decimal:
+            return to_representation(value)
+        context = decimal.getcontext().copy()
+        if max_digits is not None:
+            context.prec = max_digits
+        return '{:f}'.format(
+            value.quantize(exponent, rounding=rounding, context=context)
+        )
+    return convert
+
+
+# DRF to_representation implementations that depend on the field options.
+# The factories return an expression, a callable or None to call the field.
+CONVERTER_FACTORIES = {
+    fields.UUIDField.to_representation: _uuid_converter,
+    fields.BooleanField.to_representation: _boolean_converter,
+    fields.ChoiceField.to_representation: _choice_converter,
+    fields.DateTimeField.to_representation: _datetime_converter,
+    fields.DateField.to_representation: _date_converter,
+    fields.DecimalField.to_representation: _decimal_converter,
+}
+
+
+def _get_model_attname(model, field):
+    """
+    Returns the attname of the concrete model field read by a serializer
+    field, or None when the field must be read through DRF.
+    """
+    if len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.many_to_many:
+        return None
+    field_class = type(field)
+    if model_field.is_relation:
+        # Only plain primary key fields, whose value is the attname value.
+        if field_class.to_representation is not \
+                relations.PrimaryKeyRelatedField.to_representation or \
+                field_class.get_attribute is not \
+                relations.RelatedField.get_attribute or \
+                not field.use_pk_only_optimization() or \
+                field.pk_field is not None:
+            return None
+    elif field_class.get_attribute is not fields.Field.get_attribute:
+        return None
+    return model_field.attname
+
+
+def _get_converter(field):
+    to_representation = type(field).to_representation
+    if to_representation is \
+            relations.PrimaryKeyRelatedField.to_representation:
+        # The value read is already the primary key of the related object.
+        return '{value}'
+    converter = INLINE_CONVERTERS.get(to_representation)
+    if converter is None:
+        factory = CONVERTER_FACTORIES.get(to_representation)
+        if factory is not None:
+            converter = factory(field)
+    return converter
+
+
+def compile_serializer(model, serializer):
+    """
+    Generates a function that returns the same representation as
+    serializer.to_representation(instance) without going through DRF for
+    the fields it knows.
+
+    Concrete model fields are read directly from the instance and converted
+    with the expression (or precomputed converter) equivalent to their DRF
+    field. Any other field (nested serializers, method fields, custom
+    fields...) is still read and converted by its DRF field.
+
+    :param model: Django Model class
+    :param serializer: Serializer instance
+    :return function or None if the serializer overrides to_representation
+    """
+    if type(serializer).to_representation is not \
+            serializers.Serializer.to_representation:
+        return None
+
+    namespace = {'SkipField': SkipField, 'PKOnlyObject': PKOnlyObject}
+    lines = ['def serialize(instance):', '    ret = {}']
+    for index, field in enumerate(serializer.fields.values()):
+        if field.write_only:
+            continue
+        key = repr(field.field_name)
+        field_ref = 'field_{}'.format(index)
+        namespace[field_ref] = field
+        attname = _get_model_attname(model, field)
+        if attname is None:
+            lines.extend([
+                '    try:',
+                '        value = {}.get_attribute(instance)'.format(field_ref),
+                '    except SkipField:',
+                '        pass',
+                '    else:',
+                '        ret[{}] = None if (value.pk if isinstance('
+                'value, PKOnlyObject) else value) is None else '
+                '{}.to_representation(value)'.format(key, field_ref),
+            ])
+            continue
+
+        if attname.isidentifier() and not keyword.iskeyword(attname):
+            lines.append('    value = instance.{}'.format(attname))
+        else:
+            lines.append('    value = getattr(instance, {!r})'.format(attname))
+        converter = _get_converter(field)
+        if converter is None:
+            expression = '{}.to_representation(value)'.format(field_ref)
+        elif callable(converter):
+            converter_ref = 'convert_{}'.format(index)
+            namespace[converter_ref] = converter
+            expression = '{}(value)'.format(converter_ref)
+        else:
+            expression = converter.format(value='value')
+        lines.append('    ret[{}] = None if value is None else {}'.format(
+            key, expression
+        ))
+    lines.append('    return ret')
+
+    source = '\n'.join(lines)
+    code = compile(
+        source, '<compiled serializer {}>'.format(model._meta.label), 'exec'
+    )
+    exec(code, namespace)
+    serialize = namespace['serialize']
+    serialize.source = source
+    return serialize
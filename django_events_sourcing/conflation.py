@@ -0,0 +1,321 @@
+import atexit
+import heapq
+import logging
+import os
+import threading
+import time
+from itertools import count
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from django_events_sourcing.events import Event
+from django_events_sourcing.instrumentation import get_instrument, \
+    model_label
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFLATION_OPTIONS = {
+    'max_keys': 100000,
+    'shutdown_timeout': 5.0,
+}
+
+
+class _Window:
+    __slots__ = ('seq', 'deadline', 'duration', 'name', 'held')
+
+    def __init__(self, seq, deadline, duration, name):
+        self.seq = seq
+        self.deadline = deadline
+        self.duration = duration
+        self.name = name
+        self.held = None
+
+
+def _conflation_name(event):
+    # Updates of a status_field model are only conflated while the status
+    # doesn't change.
+    if event.model_config.get_status is None:
+        return None
+    return event.event_name
+
+
+def _merge(held, event):
+    if not event.delta:
+        return event
+    payload = dict(held.payload)
+    payload.update(event.payload)
+    return Event(
+        event.model_config, event.event_name, payload, event.pk,
+        event.action, held.delta
+    )
+
+
+class Conflator:
+    """
+    Publishes at most one update per object (model, pk) every conflate_ms
+    for the models configured with it.
+
+    The first event of an object is published right away and opens a
+    window. Updates received during the window replace each other and
+    only the latest state is published when it expires, which opens the
+    next window. Other events (deletes, status transitions) are not
+    conflated: they're returned to the caller right after the held update
+    of their object, once the conflation thread finished publishing the
+    previous one, so the order of its events is kept and the caller sees
+    their failures.
+
+    At most max_keys objects have an open window, events of other objects
+    are published right away once it's reached.
+    """
+
+    def __init__(self, publish, max_keys=100000, shutdown_timeout=5.0):
+        self.publish = publish
+        self.max_keys = max_keys
+        self.shutdown_timeout = shutdown_timeout
+        self.conflated = 0
+        self.overflow = 0
+        self._windows = {}
+        self._deadlines = []
+        # Objects whose held update is being published by the thread.
+        self._in_flight = frozenset()
+        self._seq = count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _ensure_started(self):
+        if self._thread is None:
+            thread = threading.Thread(
+                target=self._run, name='events-sourcing-conflation',
+                daemon=True
+            )
+            thread.start()
+            self._thread = thread
+
+    def _open_window(self, key, event, now):
+        duration = event.model_config.conflate_ms / 1000
+        window = _Window(
+            next(self._seq), now + duration, duration,
+            _conflation_name(event)
+        )
+        self._windows[key] = window
+        heapq.heappush(self._deadlines, (window.deadline, window.seq, key))
+
+    def conflate(self, events):
+        """
+        Holds the updates of the objects with an open window.
+
+        :param events: list of Event
+        :return list of Event to publish now
+        """
+        instrument = get_instrument()
+        now = time.monotonic()
+        result = []
+        with self._condition:
+            for event in events:
+                if event.model_config.conflate_ms is None or event.pk is None:
+                    result.append(event)
+                    continue
+                key = (event.model_config.model, event.pk)
+                window = self._windows.get(key)
+                if window is None:
+                    if event.action != 'deleted':
+                        if len(self._windows) >= self.max_keys:
+                            self.overflow += 1
+                            if instrument is not None:
+                                instrument.incr(
+                                    'conflation_overflow',
+                                    model=model_label(key[0])
+                                )
+                        else:
+                            self._open_window(key, event, now)
+                    result.append(event)
+                    continue
+
+                if event.action == 'updated' and \
+                        _conflation_name(event) == window.name:
+                    if window.held is None:
+                        window.held = event
+                    else:
+                        window.held = _merge(window.held, event)
+                        self.conflated += 1
+                        if instrument is not None:
+                            instrument.incr(
+                                'conflated', model=model_label(key[0])
+                            )
+                    continue
+
+                # Published by the caller, after the held update the thread
+                # may be publishing.
+                while key in self._in_flight:
+                    self._condition.wait()
+                window = self._windows.get(key)
+                if window is None:
+                    result.append(event)
+                    continue
+                if window.held is not None:
+                    result.append(window.held)
+                    window.held = None
+                result.append(event)
+                if event.action == 'deleted':
+                    del self._windows[key]
+                else:
+                    window.name = _conflation_name(event)
+            self._ensure_started()
+            self._condition.notify()
+        return result
+
+    def _take_due(self):
+        """
+        Takes the held updates of the windows that expired, which are
+        reopened.
+        """
+        events = []
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, seq, key = heapq.heappop(self._deadlines)
+            window = self._windows.get(key)
+            if window is None or window.seq != seq:
+                continue
+            if window.held is None:
+                del self._windows[key]
+                continue
+            events.append(window.held)
+            window.held = None
+            window.seq = next(self._seq)
+            window.deadline = now + window.duration
+            heapq.heappush(
+                self._deadlines, (window.deadline, window.seq, key)
+            )
+        return events
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopping:
+                        break
+                    timeout = None
+                    if self._deadlines:
+                        timeout = self._deadlines[0][0] - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    self._condition.wait(timeout)
+                events = self._take_due()
+                self._in_flight = frozenset(
+                    (event.model_config.model, event.pk) for event in events
+                )
+                stopping = self._stopping
+            if events:
+                try:
+                    self.publish(events)
+                except Exception:
+                    logger.exception(
+                        'Failed to publish %d conflated events', len(events)
+                    )
+                finally:
+                    with self._condition:
+                        self._in_flight = frozenset()
+                        self._condition.notify_all()
+            if stopping:
+                return
+
+    def flush(self):
+        """
+        Publishes the held updates now, in the calling thread, and closes
+        every window.
+        """
+        with self._condition:
+            events = [
+                window.held for window in self._windows.values()
+                if window.held is not None
+            ]
+            self._windows.clear()
+            self._deadlines.clear()
+        if events:
+            self.publish(events)
+
+    def stop(self, timeout=None):
+        """
+        Publishes the held updates and stops the conflation thread.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """
+        :return dict with the number of open windows (keys, bounded by
+        max_keys), held updates and the conflated and overflow counters
+        """
+        with self._condition:
+            return {
+                'keys': len(self._windows),
+                'max_keys': self.max_keys,
+                'held': sum(
+                    1 for window in self._windows.values()
+                    if window.held is not None
+                ),
+                'conflated': self.conflated,
+                'overflow': self.overflow,
+            }
+
+
+_conflator = None
+_conflator_lock = threading.Lock()
+
+
+def get_conflator(publish):
+    """
+    Returns the Conflator of the current process, configured with
+    settings.EVENTS_SOURCING_CONFLATION.
+
+    :param publish: Callable that publishes a list of events
+    :return Conflator
+    """
+    global _conflator
+    if _conflator is None:
+        with _conflator_lock:
+            if _conflator is None:
+                options = dict(DEFAULT_CONFLATION_OPTIONS)
+                options.update(getattr(
+                    settings, 'EVENTS_SOURCING_CONFLATION', {}
+                ))
+                _conflator = Conflator(publish, **options)
+    return _conflator
+
+
+def shutdown_conflator():
+    """
+    Publishes the held updates and stops the conflation thread, if it was
+    started.
+    """
+    global _conflator
+    conflator, _conflator = _conflator, None
+    if conflator is not None:
+        conflator.stop(conflator.shutdown_timeout)
+
+
+def _reset_after_fork():
+    # The conflation thread doesn't survive a fork, and the parent
+    # publishes its own held updates.
+    global _conflator, _conflator_lock
+    _conflator = None
+    _conflator_lock = threading.Lock()
+
+
+atexit.register(shutdown_conflator)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_conflator(setting, **kwargs):
+    if setting == 'EVENTS_SOURCING_CONFLATION':
+        shutdown_conflator()
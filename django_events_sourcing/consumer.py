@@ -0,0 +1,362 @@
+import logging
+import socket
+import time
+
+import amqp
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction, DEFAULT_DB_ALIAS, InterfaceError, \
+    OperationalError
+from django.utils.module_loading import import_string
+from kombu import Connection, Consumer, Queue
+
+from django_events_sourcing.replay import SNAPSHOT_SUFFIX
+from django_events_sourcing.senders.kombu import get_exchange
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSUMER_BATCH_SIZE = 1000
+DEFAULT_CONSUMER_BATCH_TIMEOUT = 1.0
+DEFAULT_RECONNECT_INTERVAL = 1.0
+
+# Errors of the database itself, not of the messages being applied.
+DATABASE_ERRORS = (OperationalError, InterfaceError)
+
+ACTION_UPSERT = 'upsert'
+ACTION_DELETE = 'delete'
+
+
+class Projection:
+    """
+    Applies the events of one model of another service (published by this
+    library) to a local read model.
+
+    Created, updated, snapshot and status events upsert the row with the
+    payload fields that match a field of the read model (after renaming
+    them with fields), deleted events delete it. Payloads that don't carry
+    every required field of the read model (e.g. delta updates) only
+    update the rows it already has, the others are skipped.
+
+    :param model: Read model class or 'app_label.Model' label
+    :param service_name: Service publishing the events
+    :param event_name_prefix: Prefix of the event names (e.g. model1)
+    :param statuses: Statuses of a status_field model, whose events are
+        named <prefix>__<status>
+    :param fields: dict renaming payload keys to read model field names
+    :param transform: Callable returning the payload to apply, or None to
+        skip the event
+    """
+
+    def __init__(self, model, service_name, event_name_prefix, statuses=(),
+                 fields=None, transform=None):
+        if isinstance(model, str):
+            model = apps.get_model(model)
+        self.model = model
+        self.service_name = service_name
+        self.event_name_prefix = event_name_prefix
+        self.statuses = tuple(statuses)
+        self.fields = fields or {}
+        self.transform = transform
+
+        self.pk_name = model._meta.pk.name
+        # Fields a row can't be inserted without.
+        self.required_attnames = frozenset(
+            field.attname for field in model._meta.concrete_fields
+            if not field.primary_key and not field.null and
+            not field.has_default()
+        )
+        # Payload keys are field names, foreign keys carry the related pk.
+        self.attnames = {
+            field.name: field.attname for field in model._meta.concrete_fields
+        }
+        self.attnames.update({
+            field.attname: field.attname
+            for field in model._meta.concrete_fields
+        })
+        self.actions = {
+            '{}__{}'.format(event_name_prefix, suffix): ACTION_UPSERT
+            for suffix in ('created', 'updated', SNAPSHOT_SUFFIX) +
+            self.statuses
+        }
+        self.actions['{}__deleted'.format(event_name_prefix)] = ACTION_DELETE
+
+    @property
+    def routing_keys(self):
+        return list(self.actions)
+
+    def to_values(self, payload):
+        """
+        :return dict of read model attname -> value, None to skip it
+        """
+        if self.transform is not None:
+            payload = self.transform(payload)
+            if payload is None:
+                return None
+        values = {}
+        for key, value in payload.items():
+            attname = self.attnames.get(self.fields.get(key, key))
+            if attname is not None:
+                values[attname] = value
+        return values
+
+    def reduce(self, events):
+        """
+        Reduces the events of a batch to the final state of each row.
+
+        :param events: list of (event_name, payload), in order
+        :return (dict of pk -> values to upsert, set of pks to delete)
+        """
+        upserts = {}
+        deletes = set()
+        pk_attname = self.model._meta.pk.attname
+        for event_name, payload in events:
+            values = self.to_values(payload)
+            if values is None or values.get(pk_attname) is None:
+                continue
+            pk = values[pk_attname]
+            if self.actions[event_name] == ACTION_DELETE:
+                upserts.pop(pk, None)
+                deletes.add(pk)
+                continue
+            deletes.discard(pk)
+            previous = upserts.get(pk)
+            if previous is not None:
+                previous.update(values)
+            else:
+                upserts[pk] = values
+        return upserts, deletes
+
+    def apply(self, events, using=DEFAULT_DB_ALIAS):
+        """
+        Applies a batch of events with one bulk delete, and per set of
+        fields one bulk_create(update_conflicts=True) of the complete rows
+        or one bulk_update() of the partial ones.
+
+        :param events: list of (event_name, payload), in order
+        :param using: Database alias of the read model
+        """
+        upserts, deletes = self.reduce(events)
+        manager = self.model._base_manager.db_manager(using)
+        if deletes:
+            manager.filter(pk__in=deletes).delete()
+        # Rows are grouped by the fields they carry, so delta payloads
+        # don't overwrite the fields they don't hold.
+        groups = {}
+        for values in upserts.values():
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+        pk_attname = self.model._meta.pk.attname
+        for attnames, rows in groups.items():
+            update_fields = [
+                attname for attname in attnames if attname != pk_attname
+            ]
+            objs = [self.model(**values) for values in rows]
+            if not self.required_attnames.issubset(attnames):
+                # Can't be inserted, only the existing rows are updated.
+                updated = manager.bulk_update(objs, update_fields) \
+                    if update_fields else 0
+                if updated < len(objs):
+                    logger.warning(
+                        'Skipped %d partial %s events of rows not projected '
+                        'yet', len(objs) - updated, self.event_name_prefix
+                    )
+            elif update_fields:
+                manager.bulk_create(
+                    objs, update_conflicts=True, unique_fields=[self.pk_name],
+                    update_fields=update_fields
+                )
+            else:
+                manager.bulk_create(objs, ignore_conflicts=True)
+
+
+class ProjectionConsumer:
+    """
+    Consumes the events of several projections from one queue and applies
+    them in batches: up to batch_size messages (or what arrived within
+    batch_timeout seconds) are grouped by projection and applied in one
+    transaction, and acked once it committed.
+
+    If applying a batch fails, it is split in halves applied separately
+    until the messages that can't be applied on their own are found. Those
+    are rejected (dead-lettered when the queue has a dead letter exchange)
+    and the others acked. Database errors requeue the batch and are
+    raised. The consumer reconnects when the broker connection is lost.
+
+    :param projections: list of Projection
+    :param amqp_uri: URI to connect to AMQP
+    :param queue_name: Name of the durable queue bound to the exchanges
+    :param batch_size: Max messages per batch, also the prefetch count
+    :param batch_timeout: Max seconds to wait to fill a batch
+    :param using: Database alias of the read models
+    :param reconnect_interval: Seconds to wait before reconnecting
+    """
+
+    def __init__(self, projections, amqp_uri, queue_name,
+                 batch_size=DEFAULT_CONSUMER_BATCH_SIZE,
+                 batch_timeout=DEFAULT_CONSUMER_BATCH_TIMEOUT,
+                 using=DEFAULT_DB_ALIAS,
+                 reconnect_interval=DEFAULT_RECONNECT_INTERVAL):
+        self.projections = projections
+        self.amqp_uri = amqp_uri
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.using = using
+        self.reconnect_interval = reconnect_interval
+        self.applied = 0
+        self.rejected = 0
+        self._by_key = {}
+        for projection in projections:
+            for routing_key in projection.routing_keys:
+                self._by_key[(projection.service_name, routing_key)] = \
+                    projection
+        self._messages = []
+
+    def get_queues(self):
+        queues = []
+        for projection in self.projections:
+            exchange = get_exchange(projection.service_name)
+            queues.extend(
+                Queue(self.queue_name, exchange=exchange,
+                      routing_key=routing_key, durable=True)
+                for routing_key in projection.routing_keys
+            )
+        return queues
+
+    def _on_message(self, body, message):
+        self._messages.append(message)
+
+    def apply_batch(self, messages):
+        """
+        Applies the events of a list of messages in one transaction.
+        Messages of unknown routing keys are skipped.
+        """
+        events = {}
+        for message in messages:
+            delivery_info = message.delivery_info
+            service_name = delivery_info['exchange'].rsplit('.events', 1)[0]
+            routing_key = delivery_info['routing_key']
+            projection = self._by_key.get((service_name, routing_key))
+            if projection is None:
+                continue
+            events.setdefault(projection, []).append(
+                (routing_key, message.payload)
+            )
+        with transaction.atomic(using=self.using):
+            for projection, projection_events in events.items():
+                projection.apply(projection_events, self.using)
+
+    def _apply(self, messages):
+        """
+        Applies a list of messages, bisecting it when it fails to find the
+        messages that can't be applied.
+
+        :return list of the messages that failed on their own
+        """
+        try:
+            self.apply_batch(messages)
+            return []
+        except DATABASE_ERRORS:
+            raise
+        except Exception:
+            if len(messages) == 1:
+                logger.exception(
+                    'Rejecting %s message that could not be applied',
+                    messages[0].delivery_info.get('routing_key')
+                )
+                return messages
+        middle = len(messages) // 2
+        return self._apply(messages[:middle]) + self._apply(messages[middle:])
+
+    def _ack(self, messages):
+        if isinstance(messages[-1].channel, amqp.Channel):
+            # Deliveries of a channel are acked in order, one ack covers
+            # the whole batch. Virtual transports ignore multiple.
+            messages[-1].ack(multiple=True)
+        else:
+            for message in messages:
+                message.ack()
+
+    def consume_batch(self, connection):
+        """
+        Waits for one batch of messages and applies it.
+
+        :return Number of messages applied
+        """
+        deadline = time.monotonic() + self.batch_timeout
+        while len(self._messages) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                connection.drain_events(timeout=remaining)
+            except socket.timeout:
+                break
+        messages, self._messages = self._messages, []
+        if not messages:
+            return 0
+        try:
+            poison = self._apply(messages)
+        except Exception:
+            for message in messages:
+                message.requeue()
+            raise
+        for message in poison:
+            message.reject()
+        if poison:
+            messages = [
+                message for message in messages
+                if not any(message is rejected for rejected in poison)
+            ]
+            self.rejected += len(poison)
+        if messages:
+            self._ack(messages)
+        self.applied += len(messages)
+        return len(messages)
+
+    def run(self, max_batches=None, stop=None):
+        """
+        Consumes and applies batches until stop() returns True, or
+        max_batches batches were consumed, reconnecting when the broker
+        connection is lost.
+        """
+        batches = 0
+        while True:
+            connection = Connection(self.amqp_uri)
+            try:
+                with connection, Consumer(
+                        connection, queues=self.get_queues(),
+                        callbacks=[self._on_message],
+                        prefetch_count=self.batch_size):
+                    while max_batches is None or batches < max_batches:
+                        if stop is not None and stop():
+                            break
+                        self.consume_batch(connection)
+                        batches += 1
+                return self.applied
+            except (connection.recoverable_connection_errors +
+                    connection.recoverable_channel_errors) as exc:
+                # The messages not acked are redelivered by the broker.
+                self._messages = []
+                logger.warning(
+                    'Broker connection lost, reconnecting in %ss: %s',
+                    self.reconnect_interval, exc
+                )
+                time.sleep(self.reconnect_interval)
+
+
+def get_projections():
+    """
+    Builds the projections of settings.EVENTS_SOURCING_PROJECTIONS, a list
+    of dicts with the Projection arguments.
+
+    :return list of Projection
+    """
+    projections = []
+    for projection_data in getattr(settings, 'EVENTS_SOURCING_PROJECTIONS',
+                                   []):
+        projection_data = dict(projection_data)
+        transform = projection_data.pop('transform', None)
+        if isinstance(transform, str):
+            transform = import_string(transform)
+        projections.append(Projection(transform=transform, **projection_data))
+    return projections
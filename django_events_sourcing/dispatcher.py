@@ -1,60 +1,576 @@
-from importlib import import_module
-
-import re
+from contextlib import contextmanager
+from itertools import groupby
+from operator import attrgetter
+from time import perf_counter
 
+import amqp
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from rest_framework import serializers
+from django.db.models import QuerySet, prefetch_related_objects
 
-from django_events_sourcing.utils import load_model_configurations
-from django_events_sourcing.senders.kombu import dispatch
+from django_events_sourcing import registry
+from django_events_sourcing.aio import get_async_publisher, offload_to_async
+from django_events_sourcing.buffering import get_transaction_buffer, \
+    in_transaction, get_collector, collect_events
+from django_events_sourcing.coalescing import coalesce_events
+from django_events_sourcing.conflation import get_conflator
+from django_events_sourcing.events import Event
+from django_events_sourcing.instrumentation import get_instrument, \
+    model_label
+from django_events_sourcing.outbox import write_outbox
+from django_events_sourcing.publisher import get_publisher
+from django_events_sourcing.registry import get_model_config, \
+    ModelConfig, BACKEND_BACKGROUND, BACKEND_OUTBOX
+from django_events_sourcing.senders.kombu import dispatch, dispatch_many, \
+    DELIVERY_CONFIRM, DELIVERY_ASYNC_CONFIRM
+from django_events_sourcing.senders.sidecar import get_sidecar_client
+from django_events_sourcing.signals import event_confirmed, event_failed
+from django_events_sourcing.spool import get_broker_guard
+from django_events_sourcing.suppression import is_suppressed
+from django_events_sourcing.tracking import PAYLOAD_DELTA, \
+    get_changed_fields, serialize_delta, refresh_snapshot, \
+    has_relevant_changes
 
 
 def slug_model_name(instance):
-    return re.sub('(?<!^)(?=[A-Z])', '_', type(instance).__name__).lower()
+    return registry.slug_model_name(type(instance))
+
+
+def get_amqp_uri():
+    try:
+        return settings.AMQP_URI
+    except AttributeError:
+        # Fall back to old method of getting it
+        return settings.NAMEKO_CONFIG.get("AMQP_URI")
 
 
-def get_event_name(instance, model_data, action):
-    event_name = model_data.get("event_name_prefix")
-    if event_name is None:
-        event_name = slug_model_name(instance)
+def as_model_config(instance, model_config):
+    """
+    Accepts a MODELS_CRUD_EVENT entry where a ModelConfig is expected, as
+    get_event_name and serialize_model used to take the raw dict.
+    """
+    if not isinstance(model_config, dict):
+        return model_config
+    registered = get_model_config(type(instance))
+    if registered is not None and registered.data == model_config:
+        return registered
+    return ModelConfig(type(instance), model_config)
+
+
+def get_event_name(instance, model_config, action):
+    model_config = as_model_config(instance, model_config)
     if action == 'deleted':
-        event_name += '__deleted'
-    elif not model_data.get('status_field') and action == 'created':
-        event_name += '__created'
-    elif not model_data.get('status_field'):
-        event_name += '__updated'
-    else:
-        event_name += '__{}'.format(
-            getattr(instance, model_data['status_field']))
-    return event_name
+        return model_config.deleted_event
+    if model_config.get_status is None:
+        if action == 'created':
+            return model_config.created_event
+        return model_config.updated_event
+    return '{}__{}'.format(
+        model_config.event_name_prefix, model_config.get_status(instance))
 
 
-def serialize_model(instance, model_data):
-    serializer_cls = model_data.get('serializer')
-    if serializer_cls:
-        serializer_module, serializer = serializer_cls.rsplit('.', 1)
-        serializer = getattr(import_module(serializer_module), serializer)
-    else:
-        serializer = type('NoClassSerializer', (serializers.ModelSerializer,),
-                          {'Meta': type('Meta', (), {'model': type(instance),
-                                                     'fields': '__all__'})})
-    serializer = serializer(instance=instance)
+def serialize_model(instance, model_config):
+    model_config = as_model_config(instance, model_config)
+    if model_config.compiled_serializer is not None:
+        return model_config.compiled_serializer(instance)
+    if model_config.cache_serializer:
+        return model_config.get_serializer().to_representation(instance)
+    serializer = model_config.serializer_class(instance=instance)
     return serializer.data
 
 
-def dispatch_event(instance, action):
-    model_data = load_model_configurations(type(instance))
-    if model_data is None:
+def serialize_models(instances, model_config):
+    """
+    Serializes a list of instances of one model with a many=True
+    serializer.
+
+    :return list of dict
+    """
+    if model_config.compiled_serializer is not None:
+        serialize = model_config.compiled_serializer
+        return [serialize(instance) for instance in instances]
+    if model_config.cache_serializer:
+        return model_config.get_list_serializer().to_representation(
+            instances
+        )
+    return model_config.serializer_class(instances, many=True).data
+
+
+def with_relations(queryset, model_config):
+    """
+    Applies the select_related and prefetch_related of a model config to
+    a queryset.
+    """
+    if model_config.select_related:
+        queryset = queryset.select_related(*model_config.select_related)
+    if model_config.prefetch_related:
+        queryset = queryset.prefetch_related(*model_config.prefetch_related)
+    return queryset
+
+
+def fetch_related(instances, model_config, using=None):
+    """
+    Re-fetches a list of saved instances in one query with their relations,
+    so serializing them doesn't query each relation per instance. Instances
+    that can't be re-fetched (not saved or deleted) get their relations
+    prefetched in place.
+
+    :return list of instances, in the order of instances
+    """
+    manager = model_config.model._base_manager.db_manager(using)
+    pks = [instance.pk for instance in instances if instance.pk is not None]
+    fetched = with_relations(manager.all(), model_config).in_bulk(pks) \
+        if pks else {}
+    result = [fetched.get(instance.pk, instance) for instance in instances]
+    missing = [
+        instance for instance, loaded in zip(instances, result)
+        if loaded is instance
+    ]
+    if missing:
+        prefetch_related_objects(
+            missing, *model_config.select_related,
+            *model_config.prefetch_related
+        )
+    return result
+
+
+def confirm_callback(events):
+    """
+    Returns the on_confirm callback of the async_confirm delivery mode for
+    a list of events, which sends the event_confirmed or event_failed
+    signal.
+    """
+    def on_confirm(index, exc):
+        event = events[index]
+        if exc is None:
+            event_confirmed.send(sender=event.model_config.model, event=event)
+        else:
+            event_failed.send(
+                sender=event.model_config.model, event=event, exception=exc
+            )
+    return on_confirm
+
+
+def delivery_options(events):
+    """
+    :return the dispatch()/dispatch_many() arguments of the encoder and
+    delivery mode of the events, left out when they're the defaults.
+    """
+    event = events[0]
+    kwargs = {}
+    if event.encoder is not None:
+        kwargs['encoder'] = event.encoder
+    if event.delivery_mode != DELIVERY_CONFIRM:
+        kwargs['delivery_mode'] = event.delivery_mode
+        if event.delivery_mode == DELIVERY_ASYNC_CONFIRM:
+            kwargs['on_confirm'] = confirm_callback(events)
+    return kwargs
+
+
+def group_events(events):
+    """
+    Splits a list of events into the lists of consecutive events of the
+    same service, encoding and delivery mode, published as one batch.
+    """
+    return [
+        list(group) for _, group in groupby(
+            events,
+            key=attrgetter('service_name', 'encoder', 'delivery_mode'))
+    ]
+
+
+def send_event_group(events):
+    """
+    Publishes a list of events of the same service, encoding and delivery
+    mode with one dispatch_many call.
+
+    :param events: list of Event
+    :return list of (event, exception) that failed, without the events
+    dropped because their exchange doesn't exist
+    """
+    client = get_sidecar_client()
+    if client is not None:
+        client.send(events)
+        return []
+    failed = dispatch_many(
+        events[0].service_name,
+        [(event.event_name, event.payload) for event in events],
+        get_amqp_uri(), **delivery_options(events)
+    )
+    return [
+        (events[index], exc) for index, exc in failed
+        if not isinstance(exc, amqp.exceptions.NotFound)
+    ]
+
+
+def send_events(events):
+    """
+    Publishes a list of events in order, batching consecutive events of the
+    same service (encoding and delivery mode) into one dispatch_many call.
+
+    Like dispatch(), events sent to an exchange that doesn't exist are
+    dropped. Any other failure is raised after the batch was sent, unless
+    the circuit breaker is enabled: then the events that failed are
+    spooled.
+
+    :param events: list of Event
+    """
+    guard = get_broker_guard(send_event_group, group_events)
+    if guard is not None:
+        guard.publish(events)
+        return
+    client = get_sidecar_client()
+    if client is not None:
+        client.send(events)
         return
-    event_name = get_event_name(instance, model_data, action)
-    serialized_model = serialize_model(instance, model_data)
+    error = None
+    for group in group_events(events):
+        for _, exc in send_event_group(group):
+            if error is None:
+                error = exc
+    if error is not None:
+        raise error
 
-    try:
-        amqp_uri = settings.AMQP_URI
-    except AttributeError:
-        # Fall back to old method of getting it
-        amqp_uri = settings.NAMEKO_CONFIG.get("AMQP_URI")
 
-    dispatch(
-        model_data.get('service_name', settings.SERVICE_NAME), event_name, serialized_model, amqp_uri
+def hand_off_events(events, using=None):
+    """
+    Hands the events of the background and outbox backends over to them.
+
+    :param events: list of Event
+    :param using: Database alias of the outbox table
+    :return list of Event to be published synchronously
+    """
+    sync_events = []
+    outbox_events = []
+    for event in events:
+        if event.model_config.backend == BACKEND_BACKGROUND:
+            get_publisher(send_events).submit(event)
+        elif event.model_config.backend == BACKEND_OUTBOX:
+            outbox_events.append(event)
+        else:
+            sync_events.append(event)
+    if outbox_events:
+        write_outbox(outbox_events, using)
+    return sync_events
+
+
+def publish_conflated(events):
+    """
+    Publishes the events released by the conflation thread.
+    """
+    sync_events = hand_off_events(events)
+    if sync_events:
+        send_events(sync_events)
+
+
+def conflate(events):
+    """
+    Holds back the updates of the models configured with conflate_ms.
+
+    :param events: list of Event
+    :return list of Event to publish now
+    """
+    for event in events:
+        if event.model_config.conflate_ms is not None:
+            return get_conflator(publish_conflated).conflate(events)
+    return events
+
+
+def publish_events(events, using=None):
+    """
+    Hands a list of events to the backend configured for their models.
+    Events published synchronously are sent as one batch, by the async
+    publisher when the current thread was called from async code and
+    EVENTS_SOURCING_ASYNC_OFFLOAD is enabled.
+
+    :param events: list of Event
+    :param using: Database alias of the outbox table
+    """
+    sync_events = hand_off_events(conflate(events), using)
+    if not sync_events:
+        return
+    if offload_to_async():
+        get_async_publisher(send_events).submit(sync_events)
+    else:
+        send_events(sync_events)
+
+
+def publish_event(event, using=None):
+    """
+    Hands a single event to the backend configured for its model.
+
+    :param event: Event
+    :param using: Database alias of the outbox table
+    """
+    if event.model_config.conflate_ms is not None:
+        publish_events([event], using)
+        return
+    backend = event.model_config.backend
+    if backend == BACKEND_BACKGROUND:
+        get_publisher(send_events).submit(event)
+    elif backend == BACKEND_OUTBOX:
+        write_outbox([event], using)
+    elif offload_to_async():
+        get_async_publisher(send_events).submit([event])
+    elif get_broker_guard(send_event_group, group_events) is not None or \
+            get_sidecar_client() is not None:
+        send_events([event])
+    else:
+        dispatch(
+            event.service_name, event.event_name, event.payload,
+            get_amqp_uri(), **delivery_options([event])
+        )
+
+
+def route_events(events, using=None):
+    """
+    Holds back the events that must not be published yet: everything while
+    an events collector is active, and the events of models dispatched on
+    commit while a transaction is open. Outbox events are never held back,
+    they are written in the caller's transaction.
+
+    :param events: list of Event
+    :param using: Database alias
+    :return list of Event to be published now
+    """
+    collector = get_collector()
+    if collector is not None:
+        collector.extend(events)
+        return []
+    ready = []
+    for event in events:
+        model_config = event.model_config
+        if model_config.dispatch_on_commit and \
+                model_config.backend != BACKEND_OUTBOX and \
+                in_transaction(using):
+            get_transaction_buffer(using, publish_events).add(event)
+        else:
+            ready.append(event)
+    return ready
+
+
+def lookup_model_config(model):
+    """
+    get_model_config() measured by the configured instrument.
+    """
+    instrument = get_instrument()
+    if instrument is None:
+        return get_model_config(model)
+    start = perf_counter()
+    model_config = get_model_config(model)
+    instrument.observe(
+        'lookup', perf_counter() - start, model=model_label(model)
+    )
+    return model_config
+
+
+def build_event(instance, model_config, action, update_fields=None):
+    instrument = get_instrument()
+    if instrument is None:
+        return _build_event(instance, model_config, action, update_fields)
+    start = perf_counter()
+    event = _build_event(instance, model_config, action, update_fields)
+    instrument.observe(
+        'serialize', perf_counter() - start,
+        model=model_label(model_config.model), event=event.event_name
+    )
+    return event
+
+
+def _build_event(instance, model_config, action, update_fields=None):
+    event_name = get_event_name(instance, model_config, action)
+    if action == 'updated' and \
+            model_config.update_payload == PAYLOAD_DELTA:
+        changed_fields = get_changed_fields(
+            instance, model_config, update_fields
+        )
+        if changed_fields is not None:
+            return Event(
+                model_config, event_name,
+                serialize_delta(instance, model_config, changed_fields),
+                instance.pk, action, delta=True
+            )
+    return Event(
+        model_config, event_name, serialize_model(instance, model_config),
+        instance.pk, action
+    )
+
+
+def build_events(instances, model_config, action, update_fields=None,
+                 using=None, fetched=False):
+    """
+    Builds the events of several instances of one model.
+
+    Models with select_related or prefetch_related are serialized together:
+    the instances are re-fetched with their relations (unless fetched says
+    they were loaded with them) and serialized with a many=True serializer,
+    so the number of queries doesn't grow with the number of instances.
+    Other models build one event per instance.
+
+    :param fetched: Whether the instances were loaded with with_relations()
+    :return list of Event
+    """
+    if not model_config.batch_serialize:
+        return [
+            build_event(instance, model_config, action, update_fields)
+            for instance in instances
+        ]
+    start = perf_counter()
+    loaded = instances if fetched else fetch_related(
+        instances, model_config, using
     )
+    event_names = [
+        get_event_name(instance, model_config, action)
+        for instance in instances
+    ]
+    events = [None] * len(instances)
+    full = []
+    for index, instance in enumerate(instances):
+        if action == 'updated' and \
+                model_config.update_payload == PAYLOAD_DELTA:
+            changed_fields = get_changed_fields(
+                instance, model_config, update_fields
+            )
+            if changed_fields is not None:
+                events[index] = Event(
+                    model_config, event_names[index],
+                    serialize_delta(loaded[index], model_config,
+                                    changed_fields),
+                    instance.pk, action, delta=True
+                )
+                continue
+        full.append(index)
+    payloads = serialize_models(
+        [loaded[index] for index in full], model_config
+    )
+    for index, payload in zip(full, payloads):
+        events[index] = Event(
+            model_config, event_names[index], payload, instances[index].pk,
+            action
+        )
+
+    instrument = get_instrument()
+    if instrument is not None:
+        # Reported per event, like build_event().
+        elapsed = (perf_counter() - start) / len(events)
+        label = model_label(model_config.model)
+        for event in events:
+            instrument.observe(
+                'serialize', elapsed, model=label, event=event.event_name
+            )
+    return events
+
+
+def _route_instance_event(instance, action, using=None, update_fields=None):
+    if is_suppressed(instance):
+        return []
+    model_config = lookup_model_config(type(instance))
+    if model_config is None:
+        return []
+    if action == 'updated' and model_config.filters_fields and \
+            not has_relevant_changes(instance, model_config, update_fields):
+        # Only ignored fields changed, nothing is serialized.
+        refresh_snapshot(instance, model_config, update_fields)
+        return []
+    event = build_event(instance, model_config, action, update_fields)
+    if model_config.track_changes and action != 'deleted':
+        refresh_snapshot(instance, model_config, update_fields)
+    return route_events([event], using)
+
+
+def dispatch_event(instance, action, using=None, update_fields=None):
+    for event in _route_instance_event(
+            instance, action, using, update_fields):
+        publish_event(event, using)
+
+
+def _prepare_event(instance, action, using=None, update_fields=None):
+    return hand_off_events(conflate(
+        _route_instance_event(instance, action, using, update_fields)
+    ), using)
+
+
+async def adispatch_event(instance, action, using=None, update_fields=None):
+    """
+    Async version of dispatch_event() for async views and tasks.
+
+    The event is serialized and routed in a sync_to_async thread, since the
+    serializer may query the database, and it is published by the async
+    publisher's threads, so the event loop never waits for the broker.
+    Events held for a transaction or an event_batch() are published when it
+    ends, like dispatch_event() does.
+
+    :param instance: Model instance
+    :param action: created, updated or deleted
+    :param using: Database alias
+    :param update_fields: Fields written by the save
+    """
+    events = await sync_to_async(_prepare_event)(
+        instance, action, using, update_fields
+    )
+    if events:
+        await get_async_publisher(send_events).publish(events)
+
+
+def dispatch_instances(instances, action, using=None, update_fields=None):
+    """
+    Dispatches the events of several instances of the same model at once,
+    publishing them as one batch.
+
+    :param instances: Iterable of instances of one model. A QuerySet is
+        loaded with the relations of the model.
+    :param action: created, updated or deleted
+    :param using: Database alias
+    :param update_fields: Fields written by a bulk_update()
+    """
+    fetched = isinstance(instances, QuerySet)
+    if fetched:
+        model_config = lookup_model_config(instances.model)
+        if model_config is None:
+            return
+        instances = with_relations(instances, model_config)
+    instances = [
+        instance for instance in instances if not is_suppressed(instance)
+    ]
+    if not instances:
+        return
+    if not fetched:
+        model_config = lookup_model_config(type(instances[0]))
+        if model_config is None:
+            return
+    if action == 'updated' and model_config.filters_fields:
+        relevant = []
+        for instance in instances:
+            if has_relevant_changes(instance, model_config, update_fields):
+                relevant.append(instance)
+            else:
+                refresh_snapshot(instance, model_config, update_fields)
+        instances = relevant
+        if not instances:
+            return
+    events = build_events(
+        instances, model_config, action, update_fields, using, fetched
+    )
+    if model_config.track_changes and action != 'deleted':
+        for instance in instances:
+            refresh_snapshot(instance, model_config, update_fields)
+    publish_events(route_events(events, using), using)
+
+
+@contextmanager
+def event_batch(using=None):
+    """
+    Holds the events dispatched by the current thread inside the block and
+    publishes them together when it exits, coalescing the events of the
+    models configured with 'coalesce'. Events are discarded if the block
+    raises.
+
+    It can be nested in a transaction: models dispatched on commit still
+    wait for the commit.
+
+    :param using: Database alias
+    """
+    with collect_events() as events:
+        yield
+    events = coalesce_events(events)
+    publish_events(route_events(events, using), using)
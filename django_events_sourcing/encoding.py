@@ -0,0 +1,88 @@
+from functools import lru_cache
+
+from kombu import compression, serialization
+from kombu.utils import json
+
+ENCODING_JSON = 'json'
+ENCODING_COMPACT_JSON = 'compact_json'
+ENCODING_MSGPACK = 'msgpack'
+
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+
+def _dumps_compact_json(payload):
+    # Same content type as json, consumers decode it the same way.
+    return 'application/json', 'utf-8', json.dumps(
+        payload, separators=(',', ':')
+    )
+
+
+class Encoder:
+    """
+    Encodes event payloads before they are published.
+
+    The payload is serialized with a kombu serializer (json, msgpack or any
+    serializer registered in kombu) or with the compact json encoder, and
+    compressed with a kombu compression method when the serialized body is
+    at least compression_threshold bytes long. The content type, content
+    encoding and compression headers are set like kombu does, so kombu
+    based consumers (e.g. Nameko) decode the messages transparently.
+    """
+
+    def __init__(self, encoding=ENCODING_JSON, compression_method=None,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD):
+        self.encoding = encoding
+        self.compression = compression_method
+        self.compression_threshold = compression_threshold
+        if encoding == ENCODING_COMPACT_JSON:
+            self._dumps = _dumps_compact_json
+        else:
+            self._dumps = lambda payload: serialization.dumps(
+                payload, serializer=encoding
+            )
+        # Fails early when the serializer or compression isn't available
+        # (e.g. msgpack not installed).
+        self._dumps({})
+        if compression_method is not None:
+            compression.get_encoder(compression_method)
+
+    def encode(self, payload):
+        """
+        :param payload: Serializable payload
+        :return (body, dict of Producer.publish() options)
+        """
+        content_type, content_encoding, body = self._dumps(payload)
+        options = {
+            'content_type': content_type,
+            'content_encoding': content_encoding,
+        }
+        if self.compression is not None and \
+                len(body) >= self.compression_threshold:
+            options['compression'] = self.compression
+        return body, options
+
+    def __repr__(self):
+        return '<Encoder: {} {} {}>'.format(
+            self.encoding, self.compression, self.compression_threshold
+        )
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding=ENCODING_JSON, compression_method=None,
+                compression_threshold=DEFAULT_COMPRESSION_THRESHOLD):
+    """
+    Returns the Encoder of a configuration, or None for plain json without
+    compression, which is left to kombu's default serializer.
+
+    :param encoding: json, compact_json, msgpack or a kombu serializer name
+    :param compression_method: kombu compression (zlib, gzip, bzip2, lzma...)
+    :param compression_threshold: Min size in bytes of compressed bodies
+    :return Encoder
+    """
+    if encoding == ENCODING_JSON and compression_method is None:
+        return None
+    try:
+        return Encoder(encoding, compression_method, compression_threshold)
+    except (serialization.SerializerNotInstalled, KeyError) as exc:
+        raise ValueError('Invalid encoding {!r} / compression {!r}: {}'.format(
+            encoding, compression_method, exc))
@@ -0,0 +1,40 @@
+class Event:
+    """
+    An event ready to be published: the model configuration that produced
+    it, its name (used as routing key) and the serialized payload.
+
+    pk and action identify the model change, they're used to coalesce the
+    events of the same object. delta is True when the payload only holds
+    the changed fields.
+    """
+    __slots__ = (
+        'model_config', 'event_name', 'payload', 'pk', 'action', 'delta'
+    )
+
+    def __init__(self, model_config, event_name, payload, pk=None,
+                 action=None, delta=False):
+        self.model_config = model_config
+        self.event_name = event_name
+        self.payload = payload
+        self.pk = pk
+        self.action = action
+        self.delta = delta
+
+    @property
+    def service_name(self):
+        return self.model_config.service_name
+
+    @property
+    def exchange(self):
+        return self.model_config.exchange
+
+    @property
+    def encoder(self):
+        return self.model_config.encoder
+
+    @property
+    def delivery_mode(self):
+        return self.model_config.delivery_mode
+
+    def __repr__(self):
+        return '<Event: {}>'.format(self.event_name)
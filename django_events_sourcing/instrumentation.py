@@ -0,0 +1,306 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets: 1-2-5 steps from 1us to 100s for
+# durations, powers of two from 16B to 16MB for sizes.
+DURATION_BOUNDS = tuple(
+    base * 10 ** exponent
+    for exponent in range(-6, 2) for base in (1, 2, 5)
+) + (100,)
+SIZE_BOUNDS = tuple(2 ** exponent for exponent in range(4, 25))
+
+SIZE_METRICS = {'payload_size'}
+
+DEFAULT_STATS_OPTIONS = {
+    'path': None,  # Directory the StatsInstrument exports its stats to
+    'interval': 10.0,  # Min seconds between two exports
+}
+
+
+class Instrument:
+    """
+    Receives the measures taken while events are dispatched. Subclass it
+    and set settings.EVENTS_SOURCING_INSTRUMENT to its dotted path to send
+    them to a metrics system.
+
+    Counters: published, failed, retries, not_found, dropped, and
+    lane_published, lane_failed, lane_dropped labeled by lane for the
+    partitioned background publisher, spooled and circuit_opened for the
+    circuit breaker, conflated and conflation_overflow for conflate_ms.
+    Histograms: lookup, serialize, publish and confirm_wait in seconds,
+    payload_size in bytes.
+
+    Labels are model (app_label.ModelName), service and event (event name).
+    """
+
+    def incr(self, metric, value=1, **labels):
+        pass
+
+    def observe(self, metric, value, **labels):
+        pass
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the given percentile,
+        capped by the max value observed.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count, 'sum': self.sum, 'min': self.min,
+            'max': self.max, 'p50': self.percentile(50),
+            'p90': self.percentile(90), 'p99': self.percentile(99),
+        }
+
+    def get_state(self):
+        return {
+            'buckets': self.buckets, 'count': self.count, 'sum': self.sum,
+            'min': self.min, 'max': self.max,
+        }
+
+    def merge(self, state):
+        """
+        Adds the observations of the state of another Histogram with the
+        same bounds.
+        """
+        self.buckets = [
+            mine + theirs
+            for mine, theirs in zip(self.buckets, state['buckets'])
+        ]
+        self.count += state['count']
+        self.sum += state['sum']
+        for name, pick in (('min', min), ('max', max)):
+            value = state[name]
+            if value is not None:
+                current = getattr(self, name)
+                setattr(self, name,
+                        value if current is None else pick(current, value))
+
+
+class StatsInstrument(Instrument):
+    """
+    Keeps counters and histograms in memory, per metric and labels.
+
+    With a path, the stats are also exported at most every interval
+    seconds (and at exit) to <path>/<pid>.json, where the events_stats
+    management command reads and merges the stats of every process.
+
+    :param path: Directory to export the stats to, defaults to
+        settings.EVENTS_SOURCING_STATS['path']
+    :param interval: Min seconds between two exports
+    """
+
+    def __init__(self, path=None, interval=None):
+        options = get_stats_options()
+        self.path = path if path is not None else options['path']
+        self.interval = interval if interval is not None \
+            else options['interval']
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._next_export = time.monotonic() + self.interval
+        self.counters = {}
+        self.histograms = {}
+
+    def incr(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.path is not None and time.monotonic() >= self._next_export:
+            self.export()
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._get_histogram(key).observe(value)
+        if self.path is not None and time.monotonic() >= self._next_export:
+            self.export()
+
+    def _get_histogram(self, key):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(
+                SIZE_BOUNDS if key[0] in SIZE_METRICS else DURATION_BOUNDS
+            )
+        return histogram
+
+    def get_state(self):
+        """
+        :return dict with the raw counters and histogram buckets, that
+            merge() adds to another StatsInstrument
+        """
+        with self._lock:
+            return {
+                'counters': [
+                    [metric, dict(labels), value]
+                    for (metric, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [metric, dict(labels), histogram.get_state()]
+                    for (metric, labels), histogram in
+                    self.histograms.items()
+                ],
+            }
+
+    def merge(self, state):
+        with self._lock:
+            for metric, labels, value in state['counters']:
+                key = (metric, tuple(sorted(labels.items())))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for metric, labels, histogram_state in state['histograms']:
+                key = (metric, tuple(sorted(labels.items())))
+                self._get_histogram(key).merge(histogram_state)
+
+    def export(self):
+        """
+        Writes the stats of this process to <path>/<pid>.json.
+        """
+        # Only one thread exports, the others keep dispatching.
+        if not self._export_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_export = time.monotonic() + self.interval
+            os.makedirs(self.path, exist_ok=True)
+            path = os.path.join(self.path, '{}.json'.format(os.getpid()))
+            # Written aside and renamed, so readers never see a partial
+            # file.
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as stats_file:
+                json.dump(self.get_state(), stats_file)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception('Could not export the stats to %s', self.path)
+        finally:
+            self._export_lock.release()
+
+    def snapshot(self):
+        """
+        :return dict with the counters and histograms, sorted by metric
+        """
+        with self._lock:
+            return {
+                'counters': [
+                    {'metric': metric, 'labels': dict(labels),
+                     'value': value}
+                    for (metric, labels), value in sorted(
+                        self.counters.items())
+                ],
+                'histograms': [
+                    dict({'metric': metric, 'labels': dict(labels)},
+                         **histogram.as_dict())
+                    for (metric, labels), histogram in sorted(
+                        self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def get_stats_options():
+    options = dict(DEFAULT_STATS_OPTIONS)
+    options.update(getattr(settings, 'EVENTS_SOURCING_STATS', {}))
+    return options
+
+
+def read_exported_stats(path):
+    """
+    Merges the stats exported by the StatsInstrument of every process to
+    a directory.
+
+    :param path: Directory the stats were exported to
+    :return StatsInstrument holding the sum of the stats
+    """
+    instrument = StatsInstrument(path=path)
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.json'):
+            with open(os.path.join(path, name)) as stats_file:
+                instrument.merge(json.load(stats_file))
+    return instrument
+
+
+_instrument = None
+
+
+def get_instrument():
+    """
+    Returns the configured Instrument, or None when instrumentation is
+    disabled so callers can skip taking the measures at all.
+    """
+    return _instrument
+
+
+def configure_instrument():
+    """
+    Installs the Instrument configured in
+    settings.EVENTS_SOURCING_INSTRUMENT (a dotted path to an Instrument
+    class or an instance).
+    """
+    global _instrument
+    instrument = getattr(settings, 'EVENTS_SOURCING_INSTRUMENT', None)
+    if isinstance(instrument, str):
+        instrument = import_string(instrument)()
+    _instrument = instrument
+    return _instrument
+
+
+def model_label(model):
+    return getattr(getattr(model, '_meta', None), 'label', model.__name__)
+
+
+def export_stats():
+    if isinstance(_instrument, StatsInstrument) and \
+            _instrument.path is not None:
+        _instrument.export()
+
+
+@receiver(setting_changed)
+def _reset_instrument(setting, **kwargs):
+    if setting in ('EVENTS_SOURCING_INSTRUMENT', 'EVENTS_SOURCING_STATS'):
+        configure_instrument()
+
+
+atexit.register(export_stats)
@@ -0,0 +1,61 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_events_sourcing.dispatcher import get_amqp_uri
+from django_events_sourcing.senders.sidecar import SidecarPublisher, \
+    SidecarError, get_sidecar_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Publishes the events sent by the local workers through the '
+        'sidecar Unix socket (EVENTS_SOURCING_SENDER = "sidecar").'
+    )
+
+    def add_arguments(self, parser):
+        options = get_sidecar_options()
+        parser.add_argument(
+            '--socket', default=options['path'],
+            help='Path of the Unix socket to listen on.'
+        )
+        parser.add_argument(
+            '--connections', type=int, default=options['connections'],
+            help='Number of publishing threads and broker connections.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=options['batch_size'],
+            help='Max number of events published per batch.'
+        )
+        parser.add_argument(
+            '--max-queue-size', type=int, default=options['max_queue_size'],
+            help='Max number of queued events.'
+        )
+        parser.add_argument(
+            '--shutdown-timeout', type=float, default=10.0,
+            help='Seconds to publish the queued events when stopping.'
+        )
+
+    def handle(self, *args, **options):
+        publisher = SidecarPublisher(
+            options['socket'], get_amqp_uri(),
+            connections=options['connections'],
+            batch_size=options['batch_size'],
+            max_queue_size=options['max_queue_size'],
+            socket_mode=get_sidecar_options()['socket_mode'],
+        )
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        try:
+            publisher.start()
+        except SidecarError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write('Listening on {}.'.format(options['socket']))
+        stop.wait()
+        if not publisher.stop(options['shutdown_timeout']):
+            self.stderr.write('Some queued events were not published.')
+        stats = publisher.stats()
+        self.stdout.write('Published {} events.'.format(stats['published']))
@@ -0,0 +1,95 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_events_sourcing.instrumentation import get_instrument, \
+    get_stats_options, read_exported_stats, SIZE_METRICS
+
+
+def format_labels(labels):
+    return ' '.join(
+        '{}={}'.format(name, value) for name, value in sorted(labels.items())
+    )
+
+
+def format_value(metric, value):
+    if value is None:
+        return '-'
+    if metric in SIZE_METRICS:
+        return '{:.0f}B'.format(value)
+    return '{:.3f}ms'.format(value * 1000)
+
+
+class Command(BaseCommand):
+    help = (
+        'Dumps the dispatch stats exported by the StatsInstrument of every '
+        'process to EVENTS_SOURCING_STATS["path"], or without a path the '
+        'stats of the current process (call it with call_command from the '
+        'process publishing the events).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json', action='store_true', help='Output the stats as JSON.'
+        )
+        parser.add_argument(
+            '--path', default=get_stats_options()['path'],
+            help='Directory the stats were exported to.'
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Clear the stats of the current process after dumping them.'
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] is not None:
+            stats = self.read_exported(options)
+        else:
+            instrument = get_instrument()
+            if not hasattr(instrument, 'snapshot'):
+                raise CommandError(
+                    'EVENTS_SOURCING_INSTRUMENT does not keep stats, set it '
+                    'to django_events_sourcing.instrumentation.'
+                    'StatsInstrument.'
+                )
+            stats = instrument.snapshot()
+            if options['reset']:
+                instrument.reset()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        self.stdout.write('Counters')
+        for counter in stats['counters']:
+            self.stdout.write('  {:<14} {:<60} {:>10}'.format(
+                counter['metric'], format_labels(counter['labels']),
+                counter['value']
+            ))
+        self.stdout.write('Histograms')
+        for histogram in stats['histograms']:
+            metric = histogram['metric']
+            self.stdout.write(
+                '  {:<14} {:<60} count={} p50={} p90={} p99={} '
+                'max={}'.format(
+                    metric, format_labels(histogram['labels']),
+                    histogram['count'],
+                    *[format_value(metric, histogram[key])
+                      for key in ('p50', 'p90', 'p99', 'max')]
+                )
+            )
+
+    def read_exported(self, options):
+        if options['reset']:
+            # The processes export their totals, they would write them
+            # back at their next export.
+            raise CommandError(
+                '--reset can not clear the stats exported by other '
+                'processes.'
+            )
+        if not os.path.isdir(options['path']):
+            raise CommandError(
+                'No stats were exported to {}.'.format(options['path'])
+            )
+        return read_exported_stats(options['path']).snapshot()
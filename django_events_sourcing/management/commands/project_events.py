@@ -0,0 +1,54 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_events_sourcing.consumer import ProjectionConsumer, \
+    get_projections, DEFAULT_CONSUMER_BATCH_SIZE, \
+    DEFAULT_CONSUMER_BATCH_TIMEOUT
+from django_events_sourcing.dispatcher import get_amqp_uri
+
+
+class Command(BaseCommand):
+    help = (
+        'Consumes the events of the projections in '
+        'EVENTS_SOURCING_PROJECTIONS and applies them to their read models '
+        'in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', required=True,
+            help='Name of the queue bound to the projected events.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_CONSUMER_BATCH_SIZE,
+            help='Max number of messages applied per transaction.'
+        )
+        parser.add_argument(
+            '--batch-timeout', type=float,
+            default=DEFAULT_CONSUMER_BATCH_TIMEOUT,
+            help='Max seconds to wait to fill a batch.'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database of the read models.'
+        )
+
+    def handle(self, *args, **options):
+        projections = get_projections()
+        if not projections:
+            raise CommandError('EVENTS_SOURCING_PROJECTIONS is empty.')
+        consumer = ProjectionConsumer(
+            projections, get_amqp_uri(), options['queue'],
+            batch_size=options['batch_size'],
+            batch_timeout=options['batch_timeout'],
+            using=options['database'],
+        )
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        self.stdout.write('Consuming from {}.'.format(options['queue']))
+        applied = consumer.run(stop=stop.is_set)
+        self.stdout.write('Applied {} events.'.format(applied))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from django_events_sourcing.dispatcher import get_amqp_uri
+from django_events_sourcing.outbox import relay_outbox, prune_outbox
+
+
+class Command(BaseCommand):
+    help = 'Publishes the events stored in the EventOutbox table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows published per batch.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to sleep when there are no pending rows.'
+        )
+        parser.add_argument(
+            '--prune-after', type=int, default=None,
+            help='Delete rows sent more than this number of seconds ago.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Publish the pending rows and exit.'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias of the outbox table.'
+        )
+
+    def handle(self, *args, **options):
+        amqp_uri = get_amqp_uri()
+        batch_size = options['batch_size']
+        using = options['database']
+        total = 0
+        while True:
+            sent = relay_outbox(amqp_uri, batch_size=batch_size, using=using)
+            total += sent
+            if sent < batch_size:
+                if options['prune_after'] is not None:
+                    prune_outbox(options['prune_after'], using=using)
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write('Relayed {} events.'.format(total))
@@ -0,0 +1,152 @@
+import json
+import os
+from argparse import ArgumentTypeError
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.replay import replay_events, \
+    DEFAULT_REPLAY_CHUNK_SIZE, SNAPSHOT_SUFFIX
+
+
+def parse_filter(value):
+    try:
+        lookup, value = value.split('=', 1)
+    except ValueError:
+        raise ArgumentTypeError(
+            'Invalid filter {!r}, expected lookup=value.'.format(value)
+        )
+    if lookup.endswith('__in'):
+        value = value.split(',')
+    elif lookup.endswith('__isnull'):
+        value = value.lower() in ('1', 'true', 'yes')
+    return lookup, value
+
+
+def parse_since(value):
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ArgumentTypeError('Invalid date {!r}.'.format(value))
+        since = datetime(date.year, date.month, date.day)
+    if settings.USE_TZ and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def read_checkpoint(path, label):
+    if not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint['model'] != label:
+        raise CommandError('Checkpoint {} belongs to {}.'.format(
+            path, checkpoint['model']))
+    return checkpoint['pk']
+
+
+def write_checkpoint(path, label, pk, published):
+    # Written aside and renamed, so a crash never leaves a partial file.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump({'model': label, 'pk': pk, 'published': published},
+                  checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Publishes the current state of every row of a model as snapshot '
+        'events, to rebuild the projections of a consumer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model label (app_label.Model).')
+        parser.add_argument(
+            '--filter', action='append', default=[], type=parse_filter,
+            help='Only replay rows matching lookup=value (repeatable).'
+        )
+        parser.add_argument(
+            '--since', type=parse_since,
+            help='Only replay rows whose --since-field is at least this '
+                 'date or datetime.'
+        )
+        parser.add_argument(
+            '--since-field', default='updated_at',
+            help='Field compared with --since.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_REPLAY_CHUNK_SIZE,
+            help='Number of rows read, serialized and published at once.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Number of publishing threads, 0 publishes inline.'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=None,
+            help='Max events published per second.'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File storing the last replayed pk. The replay resumes '
+                 'after it when the file exists.'
+        )
+        parser.add_argument(
+            '--after-pk', help='Only replay rows after this pk.'
+        )
+        parser.add_argument(
+            '--suffix', default=SNAPSHOT_SUFFIX,
+            help='Event name suffix (e.g. model1__snapshot).'
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to read the rows from.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+        model_config = get_model_config(model)
+        if model_config is None:
+            raise CommandError('{} is not in MODELS_CRUD_EVENT.'.format(
+                model._meta.label))
+        label = model._meta.label
+
+        queryset = model._default_manager.using(options['database']).filter(
+            **dict(options['filter'])
+        )
+        if options['since'] is not None:
+            queryset = queryset.filter(**{
+                options['since_field'] + '__gte': options['since']
+            })
+
+        after_pk = options['after_pk']
+        checkpoint_path = options['checkpoint']
+        on_checkpoint = None
+        if checkpoint_path:
+            checkpoint_pk = read_checkpoint(checkpoint_path, label)
+            if checkpoint_pk is not None:
+                after_pk = checkpoint_pk
+                self.stdout.write('Resuming after pk {}.'.format(after_pk))
+
+            def on_checkpoint(pk, published):
+                write_checkpoint(checkpoint_path, label, str(pk), published)
+
+        published = replay_events(
+            queryset, model_config, chunk_size=options['chunk_size'],
+            workers=options['workers'], rate=options['rate'],
+            after_pk=after_pk, suffix=options['suffix'],
+            on_checkpoint=on_checkpoint
+        )
+        self.stdout.write('Replayed {} {} events.'.format(
+            published, label))
@@ -0,0 +1,131 @@
+import threading
+
+from django.conf import settings
+from django.db import models, transaction
+
+from django_events_sourcing.buffering import collect_events
+from django_events_sourcing.dispatcher import dispatch_instances, \
+    publish_events, route_events
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.suppression import is_model_suppressed
+from django_events_sourcing.tracking import has_relevant_changes
+
+DEFAULT_BULK_CHUNK_SIZE = 500
+
+_local = threading.local()
+
+
+def get_chunk_size():
+    return getattr(
+        settings, 'EVENTS_SOURCING_BULK_CHUNK_SIZE', DEFAULT_BULK_CHUNK_SIZE
+    )
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class EventsQuerySetMixin:
+    """
+    QuerySet mixin that dispatches the created/updated/deleted (or status)
+    events of bulk operations, which don't send post_save/post_delete.
+
+    Instances are serialized in chunks of EVENTS_SOURCING_BULK_CHUNK_SIZE
+    and every chunk is published as one batch. Nothing is collected for
+    the models suppressed with suppress_events().
+    """
+
+    def _dispatches_events(self, update_fields=None):
+        model_config = get_model_config(self.model)
+        if model_config is None or is_model_suppressed(self.model):
+            return False
+        if update_fields is not None and model_config.filters_fields:
+            # Updates of ignored fields only don't fetch the rows at all.
+            return has_relevant_changes(None, model_config, update_fields)
+        return True
+
+    def _dispatch_chunks(self, instances, action, update_fields=None):
+        for chunk in chunked(instances, get_chunk_size()):
+            dispatch_instances(
+                chunk, action, using=self.db, update_fields=update_fields
+            )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        dispatches = self._dispatches_events()
+        if dispatches and (kwargs.get('ignore_conflicts') or
+                           kwargs.get('update_conflicts')):
+            # The objects skipped or updated on conflict can't be told
+            # apart from the created ones.
+            raise ValueError(
+                "bulk_create() can't dispatch the events of "
+                "ignore_conflicts or update_conflicts, wrap it in "
+                "suppress_events() and dispatch them explicitly."
+            )
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if dispatches:
+            self._for_write = True
+            self._dispatch_chunks(objs, 'created')
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        # bulk_update() runs its queries through update(), which must not
+        # dispatch the events again.
+        _local.in_bulk_update = True
+        try:
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+        finally:
+            _local.in_bulk_update = False
+        if self._dispatches_events(fields):
+            self._for_write = True
+            self._dispatch_chunks(objs, 'updated', fields)
+        return rows
+
+    def update(self, **kwargs):
+        # Sliced and combined querysets are left to Django, which refuses
+        # to update them.
+        if getattr(_local, 'in_bulk_update', False) or \
+                self.query.is_sliced or self.query.combinator or \
+                not self._dispatches_events(list(kwargs)):
+            return super().update(**kwargs)
+
+        self._for_write = True
+        using = self.db
+        with transaction.atomic(using=using, savepoint=False):
+            # The rows are locked, so exactly the rows read are updated and
+            # get an event, whatever changes concurrently.
+            pks = list(self.select_for_update().values_list('pk', flat=True))
+            rows = 0
+            manager = self.model._base_manager.db_manager(using)
+            for chunk in chunked(pks, get_chunk_size()):
+                rows += manager.filter(pk__in=chunk).update(**kwargs)
+                dispatch_instances(
+                    manager.filter(pk__in=chunk).order_by('pk'), 'updated',
+                    using=using, update_fields=list(kwargs)
+                )
+        return rows
+
+    def delete(self):
+        if not self._dispatches_events():
+            return super().delete()
+
+        # Django sends post_delete for every deleted object (including the
+        # cascaded ones), collect those events and publish them in batches.
+        self._for_write = True
+        using = self.db
+        with collect_events() as events:
+            result = super().delete()
+        for chunk in chunked(events, get_chunk_size()):
+            publish_events(route_events(chunk, using), using)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class EventsQuerySet(EventsQuerySetMixin, models.QuerySet):
+    pass
+
+
+EventsManager = models.Manager.from_queryset(EventsQuerySet)
@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class EventOutbox(models.Model):
+    """
+    Event written in the same transaction as the model change that
+    produced it, waiting to be published by the relay_events command.
+    """
+    id = models.BigAutoField(primary_key=True)
+    service_name = models.CharField(max_length=255)
+    # Label of the model, to publish the row with its encoder and delivery
+    # mode.
+    model = models.CharField(max_length=255, blank=True, default='')
+    event_name = models.CharField(max_length=255)
+    payload = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'event outbox'
+        verbose_name_plural = 'events outbox'
+
+    def __str__(self):
+        return self.event_name
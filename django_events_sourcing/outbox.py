@@ -0,0 +1,133 @@
+from datetime import timedelta
+from itertools import groupby
+
+import amqp
+from django.apps import apps
+from django.db import transaction, connections, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from kombu.utils import json
+
+from django_events_sourcing.models import EventOutbox
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.senders.kombu import dispatch_many, \
+    DELIVERY_CONFIRM, DELIVERY_ASYNC_CONFIRM
+
+
+def write_outbox(events, using=None):
+    """
+    Stores events in the EventOutbox table. Called inside the transaction
+    of the model change, so the events are only visible to the relay once
+    that transaction commits.
+
+    :param events: list of Event
+    :param using: Database alias
+    """
+    EventOutbox.objects.using(using or DEFAULT_DB_ALIAS).bulk_create([
+        EventOutbox(
+            service_name=event.service_name,
+            model=event.model_config.model._meta.label,
+            event_name=event.event_name, payload=json.dumps(event.payload)
+        )
+        for event in events
+    ])
+
+
+def get_publish_options(label):
+    """
+    Returns the encoder and delivery mode of the model of an outbox row,
+    the defaults when it is not in MODELS_CRUD_EVENT anymore. Rows are only
+    marked as sent once published, so async_confirm models are confirmed.
+
+    :param label: 'app_label.Model' label, empty for older rows
+    :return (Encoder or None, delivery mode)
+    """
+    model_config = None
+    if label:
+        try:
+            model_config = get_model_config(apps.get_model(label))
+        except LookupError:
+            pass
+    if model_config is None:
+        return None, DELIVERY_CONFIRM
+    delivery_mode = model_config.delivery_mode
+    if delivery_mode == DELIVERY_ASYNC_CONFIRM:
+        delivery_mode = DELIVERY_CONFIRM
+    return model_config.encoder, delivery_mode
+
+
+def relay_outbox(amqp_uri, batch_size=500, using=None):
+    """
+    Publishes one batch of pending outbox rows, in pk order, and marks them
+    as sent.
+
+    The batch stops at the first row that failed to publish: it and the
+    rows after it stay pending and are retried by the next batch, so
+    events are published at least once and in order.
+
+    Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED when the backend
+    supports it, so several relays can run in parallel without publishing
+    the same rows twice. Parallel relays don't keep the order of the events
+    of an object though. Rows sent to an exchange that doesn't exist
+    are dropped, like dispatch() does. Rows are published with the encoder
+    and delivery mode of their model.
+
+    :param amqp_uri: URI to connect to AMQP
+    :param batch_size: Max number of rows to publish
+    :param using: Database alias
+    :return Number of rows marked as sent
+    """
+    using = using or DEFAULT_DB_ALIAS
+    with transaction.atomic(using=using):
+        queryset = EventOutbox.objects.using(using).filter(
+            sent_at__isnull=True
+        ).order_by('pk')
+        if connections[using].features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        rows = list(queryset.values_list(
+            'pk', 'service_name', 'model', 'event_name', 'payload'
+        )[:batch_size])
+
+        options = {}
+        sent = []
+        for (service_name, label), group in groupby(
+                rows, key=lambda row: (row[1], row[2])):
+            group = list(group)
+            if label not in options:
+                options[label] = get_publish_options(label)
+            encoder, delivery_mode = options[label]
+            failed = [
+                index for index, exc in dispatch_many(
+                    service_name,
+                    [(event_name, json.loads(payload))
+                     for _, _, _, event_name, payload in group],
+                    amqp_uri, encoder=encoder, delivery_mode=delivery_mode
+                )
+                if not isinstance(exc, amqp.exceptions.NotFound)
+            ]
+            if failed:
+                # The rows after a failure are left pending too, so they're
+                # published again after it and keep their order.
+                sent.extend(row[0] for row in group[:failed[0]])
+                break
+            sent.extend(row[0] for row in group)
+
+        if sent:
+            EventOutbox.objects.using(using).filter(pk__in=sent).update(
+                sent_at=timezone.now()
+            )
+    return len(sent)
+
+
+def prune_outbox(older_than, using=None):
+    """
+    Deletes the rows that were sent more than older_than seconds ago.
+
+    :param older_than: Age in seconds
+    :param using: Database alias
+    :return Number of deleted rows
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = EventOutbox.objects.using(
+        using or DEFAULT_DB_ALIAS
+    ).filter(sent_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,364 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from django_events_sourcing.instrumentation import get_instrument, \
+    model_label
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_SYNC = 'sync'
+
+DEFAULT_PUBLISHER_OPTIONS = {
+    'lanes': 1,
+    'max_queue_size': 10000,
+    'batch_size': 100,
+    'overflow': OVERFLOW_BLOCK,
+    'block_timeout': 1.0,
+    'shutdown_timeout': 5.0,
+}
+
+_STOP = object()
+
+
+class BackgroundPublisher:
+    """
+    Publishes events from a daemon thread fed by a bounded queue.
+
+    The thread drains the queue in batches and hands each batch to
+    send_events, which reuses the pooled broker connections between
+    batches. When the queue is full, the overflow policy decides what
+    happens to a new event:
+
+    - block: wait up to block_timeout for a free slot, then drop the event.
+    - drop_oldest: discard the oldest queued event to make room.
+    - sync: publish the event in the calling thread.
+
+    lane is the index of the publisher in a PartitionedPublisher, it
+    labels the metrics of its thread.
+    """
+
+    def __init__(self, send_events, max_queue_size=10000, batch_size=100,
+                 overflow=OVERFLOW_BLOCK, block_timeout=1.0,
+                 shutdown_timeout=5.0, lane=None):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST,
+                            OVERFLOW_SYNC):
+            raise ValueError('Invalid overflow policy: {}'.format(overflow))
+        self.send_events = send_events
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.lane = lane
+        self.dropped = 0
+        self.published = 0
+        self.failed = 0
+        self.queue = queue.Queue(max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                name = 'events-sourcing-publisher'
+                if self.lane is not None:
+                    name += '-{}'.format(self.lane)
+                thread = threading.Thread(
+                    target=self._run, name=name, daemon=True
+                )
+                thread.start()
+                self._thread = thread
+
+    def submit(self, event):
+        """
+        Queues an event to be published by the background thread.
+        """
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(event)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == OVERFLOW_SYNC:
+            self.send_events([event])
+        elif self.overflow == OVERFLOW_DROP_OLDEST:
+            while True:
+                try:
+                    self._dropped(self.queue.get_nowait())
+                    self.queue.task_done()
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(event)
+                    return
+                except queue.Full:
+                    continue
+        else:
+            try:
+                self.queue.put(event, timeout=self.block_timeout)
+            except queue.Full:
+                self._dropped(event)
+                logger.warning(
+                    'Events publisher queue is full, dropping %s', event
+                )
+
+    def _dropped(self, event):
+        self.dropped += 1
+        instrument = get_instrument()
+        if instrument is not None:
+            instrument.incr(
+                'dropped', service=getattr(event, 'service_name', None),
+                event=getattr(event, 'event_name', None)
+            )
+            if self.lane is not None:
+                instrument.incr('lane_dropped', lane=self.lane)
+
+    def _sent(self, batch, failed):
+        if failed:
+            self.failed += len(batch)
+        else:
+            self.published += len(batch)
+        if self.lane is None:
+            return
+        instrument = get_instrument()
+        if instrument is not None:
+            instrument.incr(
+                'lane_failed' if failed else 'lane_published', len(batch),
+                lane=self.lane
+            )
+
+    def submit_many(self, events):
+        for event in events:
+            self.submit(event)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.send_events(batch)
+                except Exception:
+                    logger.exception(
+                        'Failed to publish %d events', len(batch)
+                    )
+                    self._sent(batch, failed=True)
+                else:
+                    self._sent(batch, failed=False)
+                for _ in batch:
+                    self.queue.task_done()
+            if item is _STOP:
+                self.queue.task_done()
+                return
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued event was handed to the broker.
+
+        :param timeout: Max seconds to wait, None waits forever
+        :return True if the queue was drained
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Publishes the queued events and stops the background thread.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning('Events publisher did not stop in time')
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        """
+        :return dict with the number of queued, published, failed and
+        dropped events
+        """
+        return {
+            'lane': self.lane, 'queued': self.queue.qsize(),
+            'published': self.published, 'failed': self.failed,
+            'dropped': self.dropped,
+        }
+
+
+def partition_key(event):
+    """
+    Returns the bytes hashed to pick the lane of an event: its model and pk,
+    so every event of one object goes through the same lane.
+    """
+    model_config = getattr(event, 'model_config', None)
+    model = model_label(model_config.model) if model_config else ''
+    return '{}:{}'.format(model, getattr(event, 'pk', None)).encode()
+
+
+class PartitionedPublisher:
+    """
+    Publishes events from several lanes, each one a BackgroundPublisher
+    with its own queue and thread.
+
+    Events are assigned to a lane by hashing their model and pk, so the
+    events of one object are published in order by the same thread while
+    different objects are published in parallel. Each lane thread acquires
+    its own producer (connection and channel) from the producers pool, so
+    the kombu pool limit (kombu.pools.set_limit(), 10 by default) should
+    be at least the number of lanes.
+
+    The overflow policies drop_oldest and sync can reorder the events of
+    an object when its lane is full.
+    """
+
+    def __init__(self, send_events, lanes=4, **options):
+        if lanes < 1:
+            raise ValueError('Invalid number of lanes: {}'.format(lanes))
+        self.lanes = [
+            BackgroundPublisher(send_events, lane=lane, **options)
+            for lane in range(lanes)
+        ]
+        self.shutdown_timeout = self.lanes[0].shutdown_timeout
+
+    @property
+    def dropped(self):
+        return sum(lane.dropped for lane in self.lanes)
+
+    def get_lane(self, event):
+        return self.lanes[
+            zlib.crc32(partition_key(event)) % len(self.lanes)
+        ]
+
+    def submit(self, event):
+        self.get_lane(event).submit(event)
+
+    def submit_many(self, events):
+        for event in events:
+            self.submit(event)
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued event of every lane was handed to the
+        broker.
+
+        :param timeout: Max seconds to wait, None waits forever
+        :return True if the lanes were drained
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for lane in self.lanes:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            if not lane.flush(remaining):
+                return False
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Publishes the queued events and stops the lane threads.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for lane in self.lanes:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            lane.stop(remaining)
+
+    def stats(self):
+        """
+        :return list with the stats of each lane
+        """
+        return [lane.stats() for lane in self.lanes]
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher(send_events):
+    """
+    Returns the background publisher of the current process, configured
+    with settings.EVENTS_SOURCING_BACKGROUND_PUBLISHER: a
+    PartitionedPublisher when it has more than one lane.
+
+    :param send_events: Callable that publishes a list of events
+    :return BackgroundPublisher or PartitionedPublisher
+    """
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                options = dict(DEFAULT_PUBLISHER_OPTIONS)
+                options.update(getattr(
+                    settings, 'EVENTS_SOURCING_BACKGROUND_PUBLISHER', {}
+                ))
+                lanes = options.pop('lanes')
+                if lanes > 1:
+                    _publisher = PartitionedPublisher(
+                        send_events, lanes, **options
+                    )
+                else:
+                    _publisher = BackgroundPublisher(send_events, **options)
+    return _publisher
+
+
+def shutdown_publisher():
+    """
+    Flushes and stops the background publisher, if it was started.
+    """
+    global _publisher
+    publisher, _publisher = _publisher, None
+    if publisher is not None:
+        publisher.stop(publisher.shutdown_timeout)
+
+
+def _reset_after_fork():
+    # The publisher thread doesn't survive a fork and the queue may hold
+    # the parent's events, so the child starts with a fresh publisher.
+    global _publisher, _publisher_lock
+    _publisher = None
+    _publisher_lock = threading.Lock()
+
+
+atexit.register(shutdown_publisher)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_publisher(setting, **kwargs):
+    if setting == 'EVENTS_SOURCING_BACKGROUND_PUBLISHER':
+        shutdown_publisher()
@@ -1,13 +1,17 @@
-from collections import defaultdict
-
-import threading
 from django.conf import settings
-from django.db.models.signals import post_save, post_delete
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver
 from django.test.utils import TestContextDecorator
 
 from django_events_sourcing.dispatcher import dispatch_event
+from django_events_sourcing.registry import get_model_config, get_registry
+from django_events_sourcing.suppression import suppress_events, \
+    is_suppressed
+from django_events_sourcing.tracking import take_snapshot
+
+_tracked_models = set()
 
-_disabled_models = defaultdict(set)
 
 def _register_model_to_signals(model):
     """
@@ -63,47 +67,69 @@ def register_models(models_list=None):
         _register_model_to_signals(model_data['model'])
 
 
+def register_change_tracking():
+    """
+    Connects post_init to the registered models that track their field
+    changes (e.g. 'update_payload': 'delta'), and disconnects it from the
+    ones that don't anymore.
+    """
+    for model in _tracked_models:
+        post_init.disconnect(generic_post_init, sender=model)
+    _tracked_models.clear()
+    for model, model_config in get_registry().items():
+        if model_config.track_changes:
+            post_init.connect(generic_post_init, sender=model)
+            _tracked_models.add(model)
+
+
+@receiver(setting_changed)
+def _update_change_tracking(setting, **kwargs):
+    if setting == 'MODELS_CRUD_EVENT':
+        register_change_tracking()
+
+
 class ModelDisabler(TestContextDecorator):
     """
     Decorator that disables any dispatching that would occur for the
-    specified model_list.
+    specified model objects, see suppression.suppress_events.
     """
 
     def __init__(self, models_list, **kwargs):
         if not isinstance(models_list, list):
             models_list = [models_list]
         self.models_list = models_list
+        self._scopes = []
         super().__init__()
 
     def enable(self):
-        global _disabled_models
-        _disabled_models[threading.get_ident()].add(*self.models_list)
+        scope = suppress_events(instances=self.models_list)
+        scope.__enter__()
+        self._scopes.append(scope)
 
     def disable(self):
-        global _disabled_models
-        _disabled_models[threading.get_ident()].remove(*self.models_list)
+        self._scopes.pop().__exit__(None, None, None)
 
 
 def model_obj_is_disabled(model_obj):
-    global _disabled_models
-    disabled_models = _disabled_models[threading.get_ident()]
-    if model_obj in disabled_models:
-        return True
-    return False
+    return is_suppressed(model_obj)
 
 
 disable_model_obj_dispatcher = ModelDisabler
 
 
-def generic_post_save(sender, instance, created, **kwargs):
-    if model_obj_is_disabled(instance):
-        return
+def generic_post_init(sender, instance, **kwargs):
+    model_config = get_model_config(sender)
+    if model_config is not None and model_config.track_changes:
+        take_snapshot(instance, model_config)
 
+
+def generic_post_save(sender, instance, created, **kwargs):
     action = 'created' if created else 'updated'
-    dispatch_event(instance, action=action)
+    dispatch_event(
+        instance, action=action, using=kwargs.get('using'),
+        update_fields=kwargs.get('update_fields')
+    )
 
 
 def generic_post_delete(sender, instance, **kwargs):
-    if model_obj_is_disabled(instance):
-        return
-    dispatch_event(instance, action='deleted')
\ No newline at end of file
+    dispatch_event(instance, action='deleted', using=kwargs.get('using'))
\ No newline at end of file
@@ -0,0 +1,312 @@
+import re
+from operator import attrgetter
+from types import MappingProxyType
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+from django_events_sourcing.coalescing import get_coalesce_rules
+from django_events_sourcing.compiler import SERIALIZER_DRF, \
+    SERIALIZER_COMPILED, compile_serializer
+from django_events_sourcing.encoding import ENCODING_JSON, \
+    DEFAULT_COMPRESSION_THRESHOLD, get_encoder
+from django_events_sourcing.senders.kombu import get_exchange, \
+    DELIVERY_CONFIRM, DELIVERY_MODES
+from django_events_sourcing.tracking import PAYLOAD_FULL, PAYLOAD_DELTA, \
+    map_serializer_fields
+
+# Settings that invalidate the compiled registry when overridden.
+REGISTRY_SETTINGS = {
+    'MODELS_CRUD_EVENT', 'SERVICE_NAME', 'EVENTS_SOURCING_WARM_SERIALIZERS',
+    'EVENTS_SOURCING_DISPATCH_ON_COMMIT', 'EVENTS_SOURCING_BACKEND',
+    'EVENTS_SOURCING_SERIALIZER_BACKEND', 'REST_FRAMEWORK',
+    'EVENTS_SOURCING_ENCODING', 'EVENTS_SOURCING_COMPRESSION',
+    'EVENTS_SOURCING_COMPRESSION_THRESHOLD', 'EVENTS_SOURCING_DELIVERY_MODE',
+}
+
+BACKEND_SYNC = 'sync'
+BACKEND_BACKGROUND = 'background'
+BACKEND_OUTBOX = 'outbox'
+
+_registry = MappingProxyType({})
+
+
+def build_model_serializer(model):
+    """
+    Creates a ModelSerializer class with all fields for a model that has no
+    serializer configured.
+
+    :param model: Django Model class
+    :return ModelSerializer class
+    """
+    return type('NoClassSerializer', (serializers.ModelSerializer,),
+                {'Meta': type('Meta', (), {'model': model,
+                                           'fields': '__all__'})})
+
+
+def slug_model_name(model):
+    """
+    Converts a model class name from CamelCase to snake_case.
+
+    :param model: Django Model class
+    :return str
+    """
+    return re.sub('(?<!^)(?=[A-Z])', '_', model.__name__).lower()
+
+
+class ModelConfig:
+    """
+    Compiled version of one MODELS_CRUD_EVENT entry.
+
+    Everything that can be resolved ahead of time (model class, serializer
+    class, event names, status accessor and exchange) is computed once
+    when the registry is built, so dispatching an event only needs a
+    dictionary lookup.
+    """
+    __slots__ = (
+        'model', 'data', 'serializer_class', 'cache_serializer',
+        '_serializer', 'event_name_prefix',
+        'created_event', 'updated_event', 'deleted_event', 'status_field',
+        'get_status', 'service_name', 'exchange', 'dispatch_on_commit',
+        'backend', 'coalesce', 'update_payload', 'track_changes',
+        'tracked_attnames', 'attname_by_name', '_delta_fields',
+        'serializer_backend', 'compiled_serializer', 'encoder',
+        'delivery_mode', 'conflate_ms', 'watched_attnames',
+        'ignored_attnames', 'select_related', 'prefetch_related',
+        '_list_serializer',
+    )
+
+    def __init__(self, model, model_data):
+        self.model = model
+        self.data = model_data
+
+        serializer_path = model_data.get('serializer')
+        self.serializer_class = (
+            import_string(serializer_path) if serializer_path
+            else build_model_serializer(model)
+        )
+        # Custom serializers may read self.instance, self.context or keep
+        # per-call state, so only the generated ones are shared by default.
+        self.cache_serializer = model_data.get(
+            'cache_serializer', not serializer_path
+        )
+        self._serializer = None
+        self._list_serializer = None
+        # Relations loaded for a group of instances serialized together.
+        self.select_related = tuple(model_data.get('select_related', ()))
+        self.prefetch_related = tuple(
+            model_data.get('prefetch_related', ())
+        )
+
+        prefix = model_data.get('event_name_prefix')
+        if prefix is None:
+            prefix = slug_model_name(model)
+        self.event_name_prefix = prefix
+        self.created_event = prefix + '__created'
+        self.updated_event = prefix + '__updated'
+        self.deleted_event = prefix + '__deleted'
+
+        self.status_field = model_data.get('status_field')
+        self.get_status = (
+            attrgetter(self.status_field) if self.status_field else None
+        )
+
+        self.service_name = model_data.get(
+            'service_name', settings.SERVICE_NAME
+        )
+        self.exchange = get_exchange(self.service_name)
+        self.dispatch_on_commit = model_data.get(
+            'dispatch_on_commit',
+            getattr(settings, 'EVENTS_SOURCING_DISPATCH_ON_COMMIT', False)
+        )
+        self.backend = model_data.get(
+            'backend', getattr(settings, 'EVENTS_SOURCING_BACKEND', BACKEND_SYNC)
+        )
+        self.coalesce = get_coalesce_rules(model_data)
+        self.conflate_ms = model_data.get('conflate_ms')
+        if self.conflate_ms is not None and (
+                self.conflate_ms <= 0 or self.backend == BACKEND_OUTBOX):
+            # Held updates live in memory, the outbox must write them in
+            # the transaction of the change.
+            raise ValueError('Invalid conflate_ms for {}: {}'.format(
+                model_data['model'], self.conflate_ms))
+        self.delivery_mode = model_data.get(
+            'delivery_mode',
+            getattr(settings, 'EVENTS_SOURCING_DELIVERY_MODE',
+                    DELIVERY_CONFIRM)
+        )
+        if self.delivery_mode not in DELIVERY_MODES:
+            raise ValueError('Invalid delivery_mode for {}: {}'.format(
+                model_data['model'], self.delivery_mode))
+        self.encoder = get_encoder(
+            model_data.get('encoding', getattr(
+                settings, 'EVENTS_SOURCING_ENCODING', ENCODING_JSON)),
+            model_data.get('compression', getattr(
+                settings, 'EVENTS_SOURCING_COMPRESSION', None)),
+            model_data.get('compression_threshold', getattr(
+                settings, 'EVENTS_SOURCING_COMPRESSION_THRESHOLD',
+                DEFAULT_COMPRESSION_THRESHOLD)),
+        )
+
+        self.update_payload = model_data.get('update_payload', PAYLOAD_FULL)
+        if self.update_payload not in (PAYLOAD_FULL, PAYLOAD_DELTA):
+            raise ValueError('Invalid update_payload for {}: {}'.format(
+                model_data['model'], self.update_payload))
+        concrete_fields = model._meta.concrete_fields
+        self.tracked_attnames = tuple(
+            field.attname for field in concrete_fields
+        )
+        self.attname_by_name = {
+            field.name: field.attname for field in concrete_fields
+        }
+        self._delta_fields = None
+
+        self.watched_attnames = self._get_attnames(
+            model_data, 'watch_fields'
+        )
+        self.ignored_attnames = self._get_attnames(
+            model_data, 'ignore_fields'
+        )
+        if self.watched_attnames is not None:
+            if self.ignored_attnames is not None:
+                raise ValueError(
+                    'watch_fields and ignore_fields of {} are exclusive'
+                    .format(model_data['model']))
+            if self.status_field:
+                # Status transitions are always published.
+                self.watched_attnames |= {
+                    self.attname_by_name[self.status_field]
+                }
+        self.track_changes = self.update_payload == PAYLOAD_DELTA or \
+            self.filters_fields
+
+        self.serializer_backend = model_data.get(
+            'serializer_backend',
+            getattr(settings, 'EVENTS_SOURCING_SERIALIZER_BACKEND',
+                    SERIALIZER_DRF)
+        )
+        if self.serializer_backend not in (SERIALIZER_DRF,
+                                           SERIALIZER_COMPILED):
+            raise ValueError('Invalid serializer_backend for {}: {}'.format(
+                model_data['model'], self.serializer_backend))
+        self.compiled_serializer = None
+        if self.serializer_backend == SERIALIZER_COMPILED:
+            # None when the serializer overrides to_representation, those
+            # keep going through DRF.
+            self.compiled_serializer = compile_serializer(
+                model, self.get_serializer()
+            )
+
+    def _get_attnames(self, model_data, key):
+        names = model_data.get(key)
+        if names is None:
+            return None
+        try:
+            return frozenset(self.attname_by_name[name] for name in names)
+        except KeyError as exc:
+            raise ValueError('Invalid {} for {}: {} is not a field'.format(
+                key, model_data['model'], exc))
+
+    @property
+    def filters_fields(self):
+        """
+        Whether updates are only published when some fields changed
+        (watch_fields or ignore_fields).
+        """
+        return self.watched_attnames is not None or \
+            self.ignored_attnames is not None
+
+    @property
+    def batch_serialize(self):
+        """
+        Whether groups of instances are re-fetched with their relations and
+        serialized together (select_related or prefetch_related).
+        """
+        return bool(self.select_related or self.prefetch_related)
+
+    def get_serializer(self):
+        """
+        Returns a serializer instance shared by every event of this model.
+
+        The instance is never bound to an object, it is only used through
+        to_representation(), so its bound fields map is discovered once and
+        then reused.
+        """
+        serializer = self._serializer
+        if serializer is None:
+            serializer = self.serializer_class()
+            serializer.fields  # Discover and bind the fields only once.
+            self._serializer = serializer
+        return serializer
+
+    def get_list_serializer(self):
+        """
+        Returns the many=True serializer shared by the groups of instances
+        of this model, never bound to a list either.
+        """
+        serializer = self._list_serializer
+        if serializer is None:
+            serializer = self.serializer_class(many=True)
+            serializer.child.fields
+            self._list_serializer = serializer
+        return serializer
+
+    def get_delta_fields(self):
+        """
+        Returns the serializer field names backed by each model field
+        attname, used to build delta payloads.
+        """
+        if self._delta_fields is None:
+            self._delta_fields = map_serializer_fields(
+                self.model, self.get_serializer()
+            )
+        return self._delta_fields
+
+    def __repr__(self):
+        return '<ModelConfig: {}>'.format(self.model._meta.label)
+
+
+def build_registry():
+    """
+    Compiles settings.MODELS_CRUD_EVENT into an immutable mapping of
+    Model class -> ModelConfig and installs it as the active registry.
+
+    :return MappingProxyType
+    """
+    global _registry
+    registry = {}
+    for model_data in getattr(settings, 'MODELS_CRUD_EVENT', []):
+        app_label, model_name = model_data['model'].rsplit('.', 1)
+        model = apps.get_app_config(app_label).get_model(model_name)
+        registry[model] = ModelConfig(model, model_data)
+    if getattr(settings, 'EVENTS_SOURCING_WARM_SERIALIZERS', False):
+        for model_config in registry.values():
+            if model_config.cache_serializer:
+                model_config.get_serializer()
+    _registry = MappingProxyType(registry)
+    return _registry
+
+
+def get_registry():
+    return _registry
+
+
+def get_model_config(model):
+    """
+    Returns the compiled configuration of a model or None if the model is
+    not registered.
+
+    :param model: Django Model class
+    :return ModelConfig
+    """
+    return _registry.get(model)
+
+
+@receiver(setting_changed)
+def _rebuild_registry(setting, **kwargs):
+    if setting in REGISTRY_SETTINGS and apps.ready:
+        build_registry()
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django_events_sourcing.dispatcher import send_events, \
+    serialize_models, with_relations
+from django_events_sourcing.events import Event
+
+DEFAULT_REPLAY_CHUNK_SIZE = 2000
+SNAPSHOT_SUFFIX = 'snapshot'
+
+
+class RateLimiter:
+    """
+    Spaces out the events so no more than rate events are published per
+    second, on average.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, events=1):
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + events * self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def iter_chunks(queryset, chunk_size, after_pk=None):
+    """
+    Streams the rows of a queryset in pk order, in lists of chunk_size
+    instances, using QuerySet.iterator() so only one chunk is held in
+    memory (a server side cursor on backends supporting it).
+
+    :param queryset: QuerySet to stream
+    :param chunk_size: Number of instances per chunk
+    :param after_pk: Resume after this pk
+    """
+    if after_pk is not None:
+        queryset = queryset.filter(pk__gt=after_pk)
+    rows = queryset.order_by('pk').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_snapshot_events(instances, model_config, suffix=SNAPSHOT_SUFFIX):
+    """
+    :param instances: list of instances of the model of model_config
+    :param model_config: ModelConfig
+    :param suffix: Event name suffix, after the model event name prefix
+    :return list of Event
+    """
+    event_name = '{}__{}'.format(model_config.event_name_prefix, suffix)
+    return [
+        Event(model_config, event_name, payload, instance.pk, suffix)
+        for instance, payload in zip(
+            instances, serialize_models(instances, model_config)
+        )
+    ]
+
+
+def replay_events(queryset, model_config, chunk_size=DEFAULT_REPLAY_CHUNK_SIZE,
+                  workers=0, rate=None, after_pk=None, suffix=SNAPSHOT_SUFFIX,
+                  on_checkpoint=None):
+    """
+    Publishes the current state of every row of a queryset as snapshot
+    events (e.g. model1__snapshot), to rebuild the projections of a
+    consumer.
+
+    Rows are read (with the select_related and prefetch_related of the
+    model) and serialized in chunks in the calling thread and each
+    chunk is published as one batch, straight to the broker whatever the
+    backend of the model. With workers, up to 2 * workers chunks are
+    published concurrently while the next ones are serialized, so memory
+    stays bounded by the chunk size.
+
+    on_checkpoint is called with the pk of the last row of every chunk
+    once it and all the chunks before it were published, so a replay that
+    failed can resume after it (with after_pk).
+
+    :param queryset: QuerySet of the rows to replay
+    :param model_config: ModelConfig of the queryset model
+    :param chunk_size: Number of rows read, serialized and published at once
+    :param workers: Number of publishing threads, 0 publishes inline
+    :param rate: Max events per second, None for no limit
+    :param after_pk: Resume after this pk
+    :param suffix: Event name suffix
+    :param on_checkpoint: Callable receiving (last pk, events published)
+    :return Number of events published
+    """
+    limiter = RateLimiter(rate) if rate else None
+    published = 0
+
+    def checkpoint(count, last_pk):
+        nonlocal published
+        published += count
+        if on_checkpoint is not None:
+            on_checkpoint(last_pk, published)
+
+    chunks = iter_chunks(
+        with_relations(queryset, model_config), chunk_size, after_pk
+    )
+    if not workers:
+        for instances in chunks:
+            events = build_snapshot_events(instances, model_config, suffix)
+            if limiter is not None:
+                limiter.wait(len(events))
+            send_events(events)
+            checkpoint(len(events), instances[-1].pk)
+        return published
+
+    # Chunks in flight, in pk order: checkpoints only move forward once
+    # every chunk before them was published.
+    in_flight = deque()
+
+    def complete(block):
+        while in_flight and (block or in_flight[0][0].done()):
+            future, count, last_pk = in_flight.popleft()
+            future.result()
+            checkpoint(count, last_pk)
+            block = False
+
+    with ThreadPoolExecutor(
+            workers, thread_name_prefix='events-sourcing-replay') as executor:
+        try:
+            for instances in chunks:
+                events = build_snapshot_events(
+                    instances, model_config, suffix
+                )
+                if limiter is not None:
+                    limiter.wait(len(events))
+                in_flight.append((
+                    executor.submit(send_events, events), len(events),
+                    instances[-1].pk
+                ))
+                complete(block=len(in_flight) >= 2 * workers)
+            while in_flight:
+                complete(block=True)
+        finally:
+            for future, _, _ in in_flight:
+                future.cancel()
+    return published
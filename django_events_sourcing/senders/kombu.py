@@ -1,7 +1,20 @@
-from contextlib import contextmanager
+import atexit
+import logging
+import os
+import socket
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
+from time import perf_counter
 
 import amqp
-from kombu import Exchange, Connection, producers, Producer
+from kombu import Exchange, Connection, Producer, serialization
+from kombu.pools import ProducerPool, get_limit
+
+from django_events_sourcing.instrumentation import get_instrument
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_HEARTBEAT = 60
 DEFAULT_TRANSPORT_OPTIONS = {
@@ -16,16 +29,219 @@ default_transport_options = {
     'confirm_publish': True
 }
 
+DELIVERY_CONFIRM = 'confirm'
+DELIVERY_FIRE_AND_FORGET = 'fire_and_forget'
+DELIVERY_ASYNC_CONFIRM = 'async_confirm'
+DELIVERY_MODES = (
+    DELIVERY_CONFIRM, DELIVERY_FIRE_AND_FORGET, DELIVERY_ASYNC_CONFIRM
+)
+
+FIRE_AND_FORGET_TRANSPORT_OPTIONS = {'confirm_publish': False}
+TRANSIENT_DELIVERY_MODE = 1
+# Max unconfirmed messages of a channel in async_confirm mode, publishing
+# waits for the broker when it is reached.
+ASYNC_CONFIRM_WINDOW = 1000
+# Seconds to wait for the confirms of a window, the messages still
+# unconfirmed then are reported as failed.
+DEFAULT_CONFIRM_TIMEOUT = 30.0
 
+
+@lru_cache(maxsize=None)
 def get_exchange(service_name):
     exchange_name = "%s.events" % service_name
     return Exchange(exchange_name, type='topic', auto_delete=True)
 
 
 
+# Producer pools of this process, keyed by the connection parameters. Pools
+# keep their connections open between publishes.
+_producer_pools = {}
+_producer_pools_lock = threading.Lock()
+
+
+def get_producer_pool(amqp_uri, ssl=None, transport_options=None,
+                      heartbeat=DEFAULT_HEARTBEAT):
+    """
+    Returns the producer pool of a broker, creating it on first use.
+
+    :param amqp_uri: URI to connect to AMQP
+    :param ssl: To use SSL or not
+    :param transport_options: Transport Options dict
+    :param heartbeat: AMQP Heartbeats interval
+    """
+    if transport_options is None:
+        transport_options = default_transport_options
+    key = (
+        amqp_uri, repr(ssl), repr(sorted(transport_options.items())),
+        heartbeat
+    )
+    pool = _producer_pools.get(key)
+    if pool is None:
+        with _producer_pools_lock:
+            pool = _producer_pools.get(key)
+            if pool is None:
+                # kombu stores the retry policy of publish() in the
+                # transport options, they must not be shared.
+                connection = Connection(
+                    amqp_uri, ssl=ssl,
+                    transport_options=dict(transport_options),
+                    heartbeat=heartbeat,
+                )
+                limit = get_limit()
+                pool = _producer_pools[key] = ProducerPool(
+                    connection.Pool(limit=limit), limit=limit
+                )
+    return pool
+
+
+def _check_connection(producer):
+    """
+    Sends the heartbeats due on the producer's connection and re-establishes
+    it if the broker stopped answering while it was idle in the pool.
+    """
+    connection = producer.connection
+    if not connection.heartbeat:
+        return
+    try:
+        connection.heartbeat_check()
+    except connection.recoverable_connection_errors:
+        connection.collect()
+        connection.ensure_connection(max_retries=3)
+        producer.revive(connection.default_channel)
+
+
+@contextmanager
+def acquire_producer(amqp_uri, ssl=None, transport_options=None,
+                     heartbeat=DEFAULT_HEARTBEAT):
+    """
+    Acquires a Producer from the pool of the given broker.
+
+    :param amqp_uri: URI to connect to AMQP
+    :param ssl: To use SSL or not
+    :param transport_options: Transport Options dict
+    :param heartbeat: AMQP Heartbeats interval
+    """
+    pool = get_producer_pool(amqp_uri, ssl, transport_options, heartbeat)
+    with pool.acquire(block=True) as producer:
+        # Channels with async confirms stay locked while checked out, so
+        # flush_confirms() never drains a channel another thread uses.
+        tracker = getattr(
+            producer.channel, '_events_sourcing_async_confirms', None
+        )
+        with nullcontext() if tracker is None else tracker.lock:
+            _check_connection(producer)
+            yield producer
+
+
+def _reset_after_fork():
+    # Connections opened by the parent can't be shared with the child.
+    # Forget them without closing, the parent still uses the sockets.
+    global _producer_pools_lock
+    _producer_pools.clear()
+    _producer_pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def encode_payload(payload, encoder=None):
+    """
+    :param payload: Serializable Payload
+    :param encoder: Encoder or None to let kombu serialize it as json
+    :return (body, dict of Producer.publish() options)
+    """
+    if encoder is None:
+        return payload, {}
+    return encoder.encode(payload)
+
+
+def _count_retry(exc, interval):
+    instrument = get_instrument()
+    if instrument is not None:
+        instrument.incr('retries', **getattr(_publishing, 'labels', {}))
+
+
+_publishing = threading.local()
+INSTRUMENTED_RETRY_POLICY = {'errback': _count_retry}
+
+
+def _body_size(body, content_encoding):
+    if isinstance(body, str):
+        return len(body.encode(content_encoding or 'utf-8'))
+    return len(body)
+
+
+def _publish(producer, body, **options):
+    try:
+        producer.publish(body, **options)
+    except amqp.exceptions.ChannelError:
+        # The broker closed the channel (e.g. 404 on a deleted exchange)
+        # and py-amqp reopened the same object, out of confirm mode.
+        _reset_confirms(producer.channel)
+        raise
+
+
+def publish_message(producer, service_name, exchange, event_name, payload,
+                    encoder=None, properties=None):
+    """
+    Publishes one event with the given producer, reporting its payload
+    size, publish time, retries and failures to the configured instrument.
+
+    :param properties: Extra Producer.publish() arguments
+    """
+    instrument = get_instrument()
+    if instrument is None:
+        body, options = encode_payload(payload, encoder)
+        if properties:
+            options.update(properties)
+        _publish(
+            producer, body, routing_key=event_name, exchange=exchange,
+            retry=True, **options
+        )
+        return
+
+    labels = {'service': service_name, 'event': event_name}
+    if encoder is None:
+        # Serialized here (like kombu would) to measure it.
+        content_type, content_encoding, body = serialization.dumps(
+            payload, 'json'
+        )
+        options = {
+            'content_type': content_type,
+            'content_encoding': content_encoding,
+        }
+    else:
+        body, options = encoder.encode(payload)
+    if properties:
+        options.update(properties)
+    instrument.observe(
+        'payload_size', _body_size(body, options['content_encoding']),
+        **labels
+    )
+    _publishing.labels = labels
+    start = perf_counter()
+    try:
+        _publish(
+            producer, body, routing_key=event_name, exchange=exchange,
+            retry=True, retry_policy=INSTRUMENTED_RETRY_POLICY, **options
+        )
+    except amqp.exceptions.NotFound:
+        instrument.incr('not_found', **labels)
+        raise
+    except Exception:
+        instrument.incr('failed', **labels)
+        raise
+    finally:
+        _publishing.labels = {}
+    instrument.observe('publish', perf_counter() - start, **labels)
+    instrument.incr('published', **labels)
+
+
 def dispatch(
         service_name, event_name, payload, amqp_uri, ssl=None,
-        transport_options=None, heartbeat=60,
+        transport_options=None, heartbeat=DEFAULT_HEARTBEAT, encoder=None,
+        delivery_mode=DELIVERY_CONFIRM, on_confirm=None,
 ):
     """
     Dispatches an event. It mimics Nameko's and Micro-Framework's format of
@@ -38,20 +254,436 @@ def dispatch(
     :param ssl: To use SSL or not
     :param transport_options: Transport Options dict
     :param heartbeat: AMQP Heartbeats interval
+    :param encoder: Encoder of the payload, kombu's json by default
+    :param delivery_mode: confirm, fire_and_forget or async_confirm
+    :param on_confirm: With async_confirm, called with (0, exception or
+        None) once the broker confirmed the message
     """
+    if delivery_mode == DELIVERY_ASYNC_CONFIRM:
+        failed = dispatch_many(
+            service_name, [(event_name, payload)], amqp_uri, ssl=ssl,
+            transport_options=transport_options, heartbeat=heartbeat,
+            encoder=encoder, delivery_mode=delivery_mode,
+            on_confirm=on_confirm
+        )
+        for _, exc in failed:
+            if not isinstance(exc, amqp.exceptions.NotFound):
+                raise exc
+        return
+
+    properties = None
+    if delivery_mode == DELIVERY_FIRE_AND_FORGET:
+        transport_options = FIRE_AND_FORGET_TRANSPORT_OPTIONS
+        properties = {'delivery_mode': TRANSIENT_DELIVERY_MODE}
     try:
         exchange = get_exchange(service_name)
 
-        transport_options = transport_options or default_transport_options
-        with producers[
-            Connection(
-                amqp_uri, ssl=ssl, transport_options=transport_options,
-            )
-        ].acquire(block=True) as producer:
-            producer.publish(
-                payload, routing_key=event_name, exchange=exchange,
-                retry=True
+        with acquire_producer(
+            amqp_uri, ssl=ssl, transport_options=transport_options,
+            heartbeat=heartbeat,
+        ) as producer:
+            publish_message(
+                producer, service_name, exchange, event_name, payload,
+                encoder, properties
             )
 
     except amqp.exceptions.NotFound:
         pass
+
+
+def _select_confirms(channel):
+    """
+    Puts a channel in confirm mode. The broker numbers its messages
+    starting at 1, that counter is kept on the channel itself because
+    pooled channels are reused between batches.
+    """
+    if getattr(channel, '_events_sourcing_delivery_tag', None) is None:
+        channel.confirm_select()
+        channel._confirm_selected = True
+        channel._events_sourcing_delivery_tag = 0
+
+
+def _reset_confirms(channel):
+    """
+    Forgets the confirm mode of a channel the broker closed. py-amqp
+    revives it in place (same object, new channel on the broker), so it
+    has to be put in confirm mode again and its messages are numbered
+    from 1 again.
+    """
+    channel._events_sourcing_delivery_tag = None
+    channel._confirm_selected = False
+
+
+def _confirmed_tags(pending, delivery_tag, multiple):
+    if not multiple:
+        return [delivery_tag] if delivery_tag in pending else []
+    return [tag for tag in pending if tag <= delivery_tag]
+
+
+class PublisherConfirms:
+    """
+    Tracks the messages published on a channel in confirm mode, so that the
+    acks of a whole batch can be waited for at once.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        _select_confirms(channel)
+        self.pending = {}
+        self.failed = []
+        channel.events['basic_ack'].add(self._on_ack)
+        channel.events['basic_nack'].add(self._on_nack)
+
+    def close(self):
+        self.channel.events['basic_ack'].discard(self._on_ack)
+        self.channel.events['basic_nack'].discard(self._on_nack)
+
+    def published(self, index):
+        self.channel._events_sourcing_delivery_tag += 1
+        self.pending[self.channel._events_sourcing_delivery_tag] = index
+
+    def _on_ack(self, delivery_tag, multiple):
+        for tag in _confirmed_tags(self.pending, delivery_tag, multiple):
+            del self.pending[tag]
+
+    def _on_nack(self, delivery_tag, multiple):
+        for tag in _confirmed_tags(self.pending, delivery_tag, multiple):
+            self.failed.append(
+                (self.pending.pop(tag), amqp.exceptions.MessageNacked())
+            )
+
+    def fail_pending(self, error):
+        for tag in sorted(self.pending):
+            self.failed.append((self.pending[tag], error))
+        self.pending.clear()
+
+    def channel_closed(self, error):
+        """
+        Fails the unconfirmed messages of a channel the broker closed, they
+        will never be confirmed.
+        """
+        self.fail_pending(error)
+        _reset_confirms(self.channel)
+
+    def wait(self, timeout=None):
+        """
+        Waits until every published message was acked or nacked. Messages
+        still unconfirmed after the timeout are reported as failed.
+        """
+        deadline = None if timeout is None else perf_counter() + timeout
+        try:
+            while self.pending:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        raise socket.timeout('confirms timed out')
+                self.channel.connection.drain_events(timeout=remaining)
+        except socket.timeout as exc:
+            self.fail_pending(exc)
+        except amqp.exceptions.ChannelError as exc:
+            self.channel_closed(exc)
+
+
+def _run_callback(callback, exc):
+    try:
+        callback(exc)
+    except Exception:
+        logger.exception('Delivery callback failed')
+
+
+class AsyncConfirms:
+    """
+    Tracks the messages published in async_confirm mode on a channel. Their
+    callbacks are called with None when the broker acks them, or with the
+    error when it nacks them or the channel is lost.
+
+    The acks are read when the channel is used again (and by
+    flush_confirms()), publishing never waits for them unless
+    ASYNC_CONFIRM_WINDOW messages are outstanding.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        _select_confirms(channel)
+        self.pending = {}
+        self.lock = threading.RLock()
+        channel.events['basic_ack'].add(self._on_ack)
+        channel.events['basic_nack'].add(self._on_nack)
+
+    @classmethod
+    def for_channel(cls, channel):
+        tracker = getattr(channel, '_events_sourcing_async_confirms', None)
+        if tracker is None:
+            tracker = channel._events_sourcing_async_confirms = cls(channel)
+            _async_confirms.add(tracker)
+        return tracker
+
+    def published(self, callback):
+        self.channel._events_sourcing_delivery_tag += 1
+        self.pending[self.channel._events_sourcing_delivery_tag] = callback
+
+    def _on_ack(self, delivery_tag, multiple):
+        for tag in _confirmed_tags(self.pending, delivery_tag, multiple):
+            callback = self.pending.pop(tag)
+            if callback is not None:
+                _run_callback(callback, None)
+
+    def _on_nack(self, delivery_tag, multiple):
+        for tag in _confirmed_tags(self.pending, delivery_tag, multiple):
+            callback = self.pending.pop(tag)
+            if callback is not None:
+                _run_callback(callback, amqp.exceptions.MessageNacked())
+
+    def fail_all(self, error):
+        pending, self.pending = self.pending, {}
+        for tag in sorted(pending):
+            if pending[tag] is not None:
+                _run_callback(pending[tag], error)
+
+    def channel_closed(self, error):
+        self.fail_all(error)
+        _reset_confirms(self.channel)
+
+    def poll(self):
+        """
+        Reads the confirms already received, without waiting.
+        """
+        self.wait(0)
+
+    def wait(self, timeout=None):
+        """
+        Reads the confirms until none is outstanding or the timeout expires.
+
+        :return True if every message was confirmed
+        """
+        try:
+            while self.pending:
+                self.channel.connection.drain_events(timeout=timeout)
+        except socket.timeout:
+            pass
+        except amqp.exceptions.ChannelError as exc:
+            self.channel_closed(exc)
+        except Exception as exc:
+            self.fail_all(exc)
+        return not self.pending
+
+
+_async_confirms = weakref.WeakSet()
+
+
+def flush_confirms(timeout=None):
+    """
+    Waits for the confirms of the messages published in async_confirm mode
+    by this process, running their callbacks. Only the channels idle in
+    the pools (or checked out by the calling thread) are drained, the
+    others are left to the thread using them.
+
+    :param timeout: Max seconds to wait for each channel
+    :return True if every message was confirmed
+    """
+    confirmed = True
+    for tracker in list(_async_confirms):
+        if not tracker.lock.acquire(blocking=False):
+            confirmed = confirmed and not tracker.pending
+            continue
+        try:
+            confirmed = tracker.wait(timeout) and confirmed
+        finally:
+            tracker.lock.release()
+    return confirmed
+
+
+atexit.register(flush_confirms, 5)
+
+
+def _publish_async_confirms(producer, service_name, exchange, events,
+                            encoder, on_confirm, confirm_timeout):
+    failed = []
+    tracker = None
+    if hasattr(producer.channel, 'confirm_select'):
+        tracker = AsyncConfirms.for_channel(producer.channel)
+        tracker.lock.acquire()
+    try:
+        if tracker is not None:
+            tracker.poll()
+        for index, (event_name, payload) in enumerate(events):
+            if tracker is not None and \
+                    tracker.channel is not producer.channel:
+                # The channel was revived, unconfirmed messages are lost.
+                tracker.fail_all(amqp.exceptions.RecoverableChannelError(
+                    'channel closed before confirming'))
+                tracker.lock.release()
+                tracker = AsyncConfirms.for_channel(producer.channel)
+                tracker.lock.acquire()
+            callback = None if on_confirm is None else partial(
+                on_confirm, index
+            )
+            if tracker is not None:
+                # Again in confirm mode after the broker closed it.
+                _select_confirms(tracker.channel)
+            try:
+                publish_message(
+                    producer, service_name, exchange, event_name, payload,
+                    encoder
+                )
+            except Exception as exc:
+                failed.append((index, exc))
+                if callback is not None:
+                    _run_callback(callback, exc)
+                if tracker is not None and \
+                        isinstance(exc, amqp.exceptions.ChannelError):
+                    tracker.channel_closed(exc)
+                continue
+
+            if tracker is None:
+                # The transport has no confirms (e.g. memory://).
+                if callback is not None:
+                    _run_callback(callback, None)
+                continue
+            tracker.published(callback)
+            if len(tracker.pending) >= ASYNC_CONFIRM_WINDOW and \
+                    not tracker.wait(confirm_timeout):
+                tracker.fail_all(socket.timeout('confirms timed out'))
+        if tracker is not None:
+            tracker.poll()
+    finally:
+        if tracker is not None:
+            tracker.lock.release()
+    return failed
+
+
+def wait_confirms(confirms, timeout, service_name):
+    instrument = get_instrument()
+    if instrument is None:
+        confirms.wait(timeout)
+        return
+    start = perf_counter()
+    confirms.wait(timeout)
+    instrument.observe(
+        'confirm_wait', perf_counter() - start, service=service_name
+    )
+
+
+def count_unconfirmed(failures, events, service_name):
+    """
+    Reports the messages nacked or not confirmed by the broker as failed.
+    """
+    instrument = get_instrument()
+    if instrument is not None:
+        for index, _ in failures:
+            instrument.incr(
+                'failed', service=service_name, event=events[index][0]
+            )
+
+
+def dispatch_many(
+        service_name, events, amqp_uri, ssl=None, transport_options=None,
+        heartbeat=DEFAULT_HEARTBEAT, confirm_window=None,
+        confirm_timeout=DEFAULT_CONFIRM_TIMEOUT, encoder=None,
+        delivery_mode=DELIVERY_CONFIRM,
+        on_confirm=None,
+):
+    """
+    Dispatches a list of events over a single channel. When publisher
+    confirms are enabled, the confirms are waited for once per batch (or
+    once every confirm_window messages) instead of once per message.
+
+    With the fire_and_forget delivery mode messages are transient and not
+    confirmed. With async_confirm the confirms are not waited for, instead
+    on_confirm(index, exception or None) is called once the broker
+    confirmed (or rejected) each message.
+
+    :param service_name: Name of the Service sending the events
+    :param events: Iterable of (event_name, payload) pairs
+    :param amqp_uri: URI to connect to AMQP
+    :param ssl: To use SSL or not
+    :param transport_options: Transport Options dict
+    :param heartbeat: AMQP Heartbeats interval
+    :param confirm_window: Max number of unconfirmed messages in flight
+    :param confirm_timeout: Seconds to wait for the confirms of a window,
+        the messages still unconfirmed are returned as failed
+    :param encoder: Encoder of the payloads, kombu's json by default
+    :param delivery_mode: confirm, fire_and_forget or async_confirm
+    :param on_confirm: Callback of the async_confirm mode
+    :return list of (index, exception) for every message that failed
+    """
+    events = list(events)
+    exchange = get_exchange(service_name)
+    properties = None
+    if delivery_mode == DELIVERY_FIRE_AND_FORGET:
+        transport_options = FIRE_AND_FORGET_TRANSPORT_OPTIONS
+        properties = {'delivery_mode': TRANSIENT_DELIVERY_MODE}
+    transport_options = dict(
+        default_transport_options if transport_options is None
+        else transport_options
+    )
+    # Confirms are handled here, so the channel must not wait for each one.
+    confirm = transport_options.pop('confirm_publish', False)
+    if not confirm and delivery_mode != DELIVERY_ASYNC_CONFIRM:
+        # Keeps the channels without confirms apart from the ones in
+        # confirm mode, whose messages are numbered.
+        transport_options['confirm_publish'] = False
+
+    if delivery_mode == DELIVERY_ASYNC_CONFIRM:
+        with acquire_producer(
+            amqp_uri, ssl=ssl, transport_options=transport_options,
+            heartbeat=heartbeat,
+        ) as producer:
+            return _publish_async_confirms(
+                producer, service_name, exchange, events, encoder,
+                on_confirm, confirm_timeout
+            )
+
+    failed = []
+    with acquire_producer(
+        amqp_uri, ssl=ssl, transport_options=transport_options,
+        heartbeat=heartbeat,
+    ) as producer:
+        confirms = None
+        try:
+            for index, (event_name, payload) in enumerate(events):
+                if confirms is not None and \
+                        confirms.channel is not producer.channel:
+                    # The channel was revived, unconfirmed messages are lost.
+                    confirms.fail_pending(
+                        amqp.exceptions.RecoverableChannelError(
+                            'channel closed before confirming')
+                    )
+                    confirms.close()
+                    failed.extend(confirms.failed)
+                    count_unconfirmed(confirms.failed, events, service_name)
+                    confirms = None
+                if confirm and confirms is None and \
+                        hasattr(producer.channel, 'confirm_select'):
+                    confirms = PublisherConfirms(producer.channel)
+                elif confirms is not None:
+                    # Again in confirm mode after the broker closed it.
+                    _select_confirms(confirms.channel)
+
+                try:
+                    publish_message(
+                        producer, service_name, exchange, event_name,
+                        payload, encoder, properties
+                    )
+                except Exception as exc:
+                    failed.append((index, exc))
+                    if confirms is not None and \
+                            isinstance(exc, amqp.exceptions.ChannelError):
+                        confirms.channel_closed(exc)
+                    continue
+
+                if confirms is not None:
+                    confirms.published(index)
+                    if confirm_window and \
+                            len(confirms.pending) >= confirm_window:
+                        wait_confirms(confirms, confirm_timeout, service_name)
+            if confirms is not None:
+                wait_confirms(confirms, confirm_timeout, service_name)
+        finally:
+            if confirms is not None:
+                confirms.close()
+                failed.extend(confirms.failed)
+                count_unconfirmed(confirms.failed, events, service_name)
+    failed.sort(key=lambda failure: failure[0])
+    return failed
@@ -0,0 +1,473 @@
+import logging
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from itertools import groupby
+
+import amqp
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from kombu.utils import json
+
+from django_events_sourcing.encoding import get_encoder
+from django_events_sourcing.senders.kombu import dispatch_many, \
+    DELIVERY_CONFIRM, DELIVERY_ASYNC_CONFIRM
+
+logger = logging.getLogger(__name__)
+
+SENDER_KOMBU = 'kombu'
+SENDER_SIDECAR = 'sidecar'
+
+ACK_FIRE_AND_FORGET = 'fire_and_forget'
+ACK_ENQUEUE = 'enqueue'
+
+DEFAULT_SIDECAR_OPTIONS = {
+    # In a directory only the current user can access.
+    'path': os.path.join(
+        tempfile.gettempdir(), 'events_sourcing-{}'.format(os.getuid()),
+        'events.sock'
+    ),
+    'ack': ACK_ENQUEUE,
+    'timeout': 5.0,
+    # events_publisher options
+    'connections': 2,
+    'batch_size': 500,
+    'max_queue_size': 100000,
+    # 0o660 lets the workers of the socket group connect too.
+    'socket_mode': 0o600,
+}
+
+# A frame is its body length (4 bytes big endian) and flags (1 byte)
+# followed by a JSON list of events. With FLAG_ACK, the publisher answers
+# with one byte once the events were queued.
+HEADER = struct.Struct('>IB')
+FLAG_ACK = 1
+REPLY_QUEUED = b'\x01'
+REPLY_FULL = b'\x00'
+
+
+class SidecarError(ConnectionError):
+    pass
+
+
+def encode_frame(events, ack=False):
+    """
+    :param events: list of Event
+    :param ack: Whether the publisher must answer once the events are queued
+    :return bytes
+    """
+    records = []
+    for event in events:
+        encoder = event.encoder
+        records.append({
+            'service': event.service_name, 'event': event.event_name,
+            'payload': event.payload,
+            'key': '{}:{}'.format(event.model_config.model._meta.label,
+                                  event.pk),
+            'encoder': None if encoder is None else [
+                encoder.encoding, encoder.compression,
+                encoder.compression_threshold
+            ],
+            'delivery_mode': event.delivery_mode,
+        })
+    body = json.dumps(records).encode()
+    return HEADER.pack(len(body), FLAG_ACK if ack else 0) + body
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class SidecarClient:
+    """
+    Sends events to the events_publisher daemon of the host through a Unix
+    socket instead of publishing them to the broker.
+
+    Each thread keeps its own socket. With the enqueue ack mode, send()
+    waits until the daemon queued the events, and raises SidecarError if
+    its queue is full. With fire_and_forget it returns once the frame was
+    written to the socket.
+    """
+
+    def __init__(self, path, ack=ACK_ENQUEUE, timeout=5.0, **options):
+        if ack not in (ACK_FIRE_AND_FORGET, ACK_ENQUEUE):
+            raise ValueError('Invalid sidecar ack mode: {}'.format(ack))
+        self.path = path
+        self.ack = ack == ACK_ENQUEUE
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get_socket(self):
+        sock = getattr(self._local, 'socket', None)
+        if sock is not None and self._local.pid == os.getpid():
+            return sock
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.socket = sock
+        self._local.pid = os.getpid()
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, 'socket', None)
+        self._local.socket = None
+        if sock is not None:
+            sock.close()
+
+    def send(self, events):
+        """
+        :param events: list of Event
+        """
+        frame = encode_frame(events, self.ack)
+        try:
+            sock = self._get_socket()
+            sock.sendall(frame)
+            if not self.ack:
+                return
+            reply = _recv_exactly(sock, 1)
+        except OSError as exc:
+            self.close()
+            raise SidecarError(
+                'Events publisher unavailable at {}: {}'.format(
+                    self.path, exc)
+            ) from exc
+        if reply is None:
+            self.close()
+            raise SidecarError('Events publisher closed the connection')
+        if reply != REPLY_QUEUED:
+            raise SidecarError('Events publisher queue is full')
+
+
+def _delivery_mode(record):
+    # The daemon retries the events itself, async_confirm ones are
+    # confirmed like the others.
+    delivery_mode = record.get('delivery_mode', DELIVERY_CONFIRM)
+    if delivery_mode == DELIVERY_ASYNC_CONFIRM:
+        return DELIVERY_CONFIRM
+    return delivery_mode
+
+
+class _FrameHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.publisher
+        while True:
+            header = _recv_exactly(self.request, HEADER.size)
+            if header is None:
+                return
+            length, flags = HEADER.unpack(header)
+            body = _recv_exactly(self.request, length)
+            if body is None:
+                return
+            queued = server.enqueue(json.loads(body), block=not (
+                flags & FLAG_ACK))
+            if flags & FLAG_ACK:
+                self.request.sendall(REPLY_QUEUED if queued else REPLY_FULL)
+
+
+class _UnixServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SidecarPublisher:
+    """
+    Receives the event frames of the local workers on a Unix socket and
+    publishes them in large batches over a few broker connections.
+
+    Events are spread over `connections` lanes by model and pk, each one
+    publishing from its own thread and pooled connection, so the events of
+    one object keep their order. Batches that fail are retried until they
+    are published, events sent to an exchange that doesn't exist are
+    dropped. Events are published with the delivery mode of their model,
+    async_confirm ones are confirmed since the daemon retries them.
+    """
+
+    def __init__(self, path, amqp_uri, connections=2, batch_size=500,
+                 max_queue_size=100000, retry_interval=1.0,
+                 socket_mode=0o600, **options):
+        self.path = path
+        self.socket_mode = socket_mode
+        self.amqp_uri = amqp_uri
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        # The lanes are not bounded by the queues themselves: room is
+        # reserved in _queued before putting records, so a full lane never
+        # blocks while a lock is held.
+        self.lane_size = max(1, max_queue_size // connections)
+        self.queues = [queue.Queue() for _ in range(connections)]
+        self._queued = [0] * connections
+        self._room = threading.Condition()
+        self.received = 0
+        self.published = 0
+        self.rejected = 0
+        self._stopping = threading.Event()
+        self._threads = []
+        self._server = None
+        self._lock = threading.Lock()
+
+    def _lane(self, record):
+        return zlib.crc32(record['key'].encode()) % len(self.queues)
+
+    def _has_room(self, needed):
+        # A frame larger than a lane is let in once the lane is empty.
+        return all(
+            not self._queued[lane] or
+            self._queued[lane] + count <= self.lane_size
+            for lane, count in needed.items()
+        )
+
+    def enqueue(self, records, block=True):
+        """
+        Queues the records of a frame, all of them or none: without block,
+        nothing is queued when a lane doesn't have room for its records.
+        With block, waits until every lane has room.
+
+        :return False if the records were not queued
+        """
+        lanes = [self._lane(record) for record in records]
+        needed = {}
+        for lane in lanes:
+            needed[lane] = needed.get(lane, 0) + 1
+        with self._room:
+            while not self._has_room(needed):
+                if not block:
+                    with self._lock:
+                        self.rejected += len(records)
+                    return False
+                self._room.wait()
+            for lane, count in needed.items():
+                self._queued[lane] += count
+        for lane, record in zip(lanes, records):
+            self.queues[lane].put_nowait(record)
+        with self._lock:
+            self.received += len(records)
+        return True
+
+    def _release(self, lane, count):
+        with self._room:
+            self._queued[lane] -= count
+            self._room.notify_all()
+
+    def _publish(self, records):
+        """
+        Publishes records in order, stopping at the first group whose
+        publication failed.
+
+        :return list of the records left to publish: the failed ones of
+        that group followed by the records after it
+        """
+        start = 0
+        for (service_name, encoder, delivery_mode), group in groupby(
+                records, key=lambda record: (
+                    record['service'], record['encoder'],
+                    _delivery_mode(record))):
+            group = list(group)
+            kwargs = {}
+            if encoder is not None:
+                kwargs['encoder'] = get_encoder(*encoder)
+            if delivery_mode != DELIVERY_CONFIRM:
+                kwargs['delivery_mode'] = delivery_mode
+            try:
+                failed = dispatch_many(
+                    service_name,
+                    [(record['event'], record['payload'])
+                     for record in group],
+                    self.amqp_uri, **kwargs
+                )
+            except Exception:
+                logger.exception(
+                    'Failed to publish %d events, retrying',
+                    len(records) - start
+                )
+                return records[start:]
+            start += len(group)
+            retry = [
+                (group[index], exc) for index, exc in failed
+                if not isinstance(exc, amqp.exceptions.NotFound)
+            ]
+            if retry:
+                logger.error(
+                    'Failed to publish %d events, retrying: %s',
+                    len(retry), retry[0][1]
+                )
+                return [record for record, _ in retry] + records[start:]
+        return []
+
+    def _run_lane(self, index):
+        lane = self.queues[index]
+        while True:
+            try:
+                batch = [lane.get(timeout=0.1)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(lane.get_nowait())
+                except queue.Empty:
+                    break
+            self._release(index, len(batch))
+            # Only the records that were not published are retried.
+            pending = self._publish(batch)
+            while pending:
+                time.sleep(self.retry_interval)
+                pending = self._publish(pending)
+            with self._lock:
+                self.published += len(batch)
+            for _ in batch:
+                lane.task_done()
+
+    def _prepare_path(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_mode & stat.S_IWOTH:
+            raise SidecarError(
+                'The directory of {} is writable by every user'.format(
+                    self.path)
+            )
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            # Left by a publisher that didn't stop cleanly.
+            os.unlink(self.path)
+        else:
+            raise SidecarError(
+                'An events publisher is already listening on {}'.format(
+                    self.path)
+            )
+        finally:
+            probe.close()
+
+    def _bind(self):
+        # The socket is created without the permissions it must not have.
+        umask = os.umask(0o777 & ~self.socket_mode)
+        try:
+            server = _UnixServer(self.path, _FrameHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, self.socket_mode)
+        return server
+
+    def start(self):
+        """
+        Starts the lane threads and listens on the socket from a thread.
+        Raises SidecarError when another publisher listens on the socket.
+        """
+        self._prepare_path()
+        self._server = self._bind()
+        self._server.publisher = self
+        for index in range(len(self.queues)):
+            thread = threading.Thread(
+                target=self._run_lane, args=(index,),
+                name='events-publisher-{}'.format(index), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(
+            target=self._server.serve_forever, name='events-publisher-socket',
+            daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued event was published.
+
+        :return True if the queues were drained
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for lane in self.queues:
+            with lane.all_tasks_done:
+                while lane.unfinished_tasks:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                    lane.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Stops accepting frames, publishes the queued events and stops.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        flushed = self.flush(timeout)
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        return flushed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'received': self.received, 'published': self.published,
+                'rejected': self.rejected,
+                'queued': sum(lane.qsize() for lane in self.queues),
+            }
+
+
+def get_sidecar_options():
+    options = dict(DEFAULT_SIDECAR_OPTIONS)
+    options.update(getattr(settings, 'EVENTS_SOURCING_SIDECAR', {}))
+    return options
+
+
+_client = None
+_client_configured = False
+
+
+def get_sidecar_client():
+    """
+    Returns the SidecarClient when settings.EVENTS_SOURCING_SENDER is
+    'sidecar', None when events are published with kombu.
+
+    :return SidecarClient
+    """
+    global _client, _client_configured
+    if not _client_configured:
+        sender = getattr(settings, 'EVENTS_SOURCING_SENDER', SENDER_KOMBU)
+        if sender not in (SENDER_KOMBU, SENDER_SIDECAR):
+            raise ValueError('Invalid EVENTS_SOURCING_SENDER: {}'.format(
+                sender))
+        _client = None
+        if sender == SENDER_SIDECAR:
+            _client = SidecarClient(**get_sidecar_options())
+        _client_configured = True
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_sidecar_client(setting, **kwargs):
+    global _client, _client_configured
+    if setting in ('EVENTS_SOURCING_SENDER', 'EVENTS_SOURCING_SIDECAR'):
+        _client = None
+        _client_configured = False
@@ -1,3 +1,9 @@
+from django.dispatch import Signal
 
+# Sent when the broker confirmed an event of a model using the
+# async_confirm delivery mode. Arguments: sender (model class), event.
+event_confirmed = Signal()
 
-
+# Sent when an event of a model using the async_confirm delivery mode was
+# rejected by the broker or lost. Arguments: sender, event, exception.
+event_failed = Signal()
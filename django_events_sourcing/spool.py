@@ -0,0 +1,437 @@
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from kombu.utils import json
+
+from django_events_sourcing.breaker import CircuitBreaker
+from django_events_sourcing.events import Event
+from django_events_sourcing.instrumentation import get_instrument
+from django_events_sourcing.registry import get_model_config
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+
+DEFAULT_CIRCUIT_BREAKER_OPTIONS = {
+    'failure_threshold': 5,
+    'reset_timeout': 30.0,
+    'fsync': FSYNC_ALWAYS,
+    'fsync_interval': 1.0,
+    'drain_interval': 1.0,
+    'drain_batch_size': 500,
+}
+
+# Every record is its length as a 4 bytes big endian integer followed by
+# the JSON encoded record.
+HEADER = struct.Struct('>I')
+
+
+@contextmanager
+def _file_lock(file, blocking=True):
+    """
+    Locks a file against the other processes sharing the spool. Yields
+    False when blocking is False and the lock is taken.
+    """
+    if fcntl is None:
+        yield True
+        return
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(file.fileno(), flags)
+    except BlockingIOError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class Spool:
+    """
+    Append-only file of length-prefixed records, read back in order.
+
+    The position of the first record not read yet is kept in a
+    <path>.offset file, and the spool is truncated once every record was
+    read. Appends are fsync'ed according to the fsync policy: always,
+    every fsync_interval seconds (interval) or never (left to the OS).
+    """
+
+    def __init__(self, path, fsync=FSYNC_ALWAYS, fsync_interval=1.0):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError('Invalid fsync policy: {}'.format(fsync))
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._synced_at = 0
+        self._lock = threading.Lock()
+        self._pending = self.size() > self.read_offset()
+
+    @property
+    def pending(self):
+        """
+        Whether records appended by this process (or found when it
+        started) were not read yet.
+        """
+        return self._pending
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def read_offset(self):
+        try:
+            with open(self.offset_path) as offset_file:
+                return int(offset_file.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, offset):
+        tmp_path = self.offset_path + '.tmp'
+        with open(tmp_path, 'w') as offset_file:
+            offset_file.write(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def _get_file(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def append(self, records):
+        """
+        :param records: list of JSON serializable records
+        """
+        data = b''.join(
+            HEADER.pack(len(body)) + body
+            for body in (json.dumps(record).encode() for record in records)
+        )
+        with self._lock:
+            file = self._get_file()
+            with _file_lock(file):
+                file.write(data)
+                file.flush()
+                now = time.monotonic()
+                if self.fsync == FSYNC_ALWAYS or (
+                        self.fsync == FSYNC_INTERVAL and
+                        now - self._synced_at >= self.fsync_interval):
+                    os.fsync(file.fileno())
+                    self._synced_at = now
+            self._pending = True
+
+    def read(self, max_records, offset=None):
+        """
+        Reads the records following offset. A record still being written
+        by another process is left for the next read.
+
+        :param max_records: Max number of records to read
+        :param offset: Position to read from, the saved offset by default
+        :return (list of records, offset following them)
+        """
+        if offset is None:
+            offset = self.read_offset()
+        records = []
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return records, offset
+        with file:
+            file.seek(offset)
+            while len(records) < max_records:
+                header = file.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, = HEADER.unpack(header)
+                body = file.read(length)
+                if len(body) < length:
+                    break
+                records.append(json.loads(body))
+                offset += HEADER.size + length
+        return records, offset
+
+    def commit(self, offset):
+        """
+        Marks the records before offset as read, truncating the spool when
+        every record was read.
+
+        :return True if the spool is empty
+        """
+        with self._lock:
+            file = self._get_file()
+            with _file_lock(file):
+                if offset < self.size():
+                    self._write_offset(offset)
+                    return False
+                file.truncate(0)
+                if os.path.exists(self.offset_path):
+                    os.remove(self.offset_path)
+                self._pending = False
+                return True
+
+    @contextmanager
+    def drain_lock(self):
+        """
+        Yields True if the current process may read the spool, so one
+        process drains it at a time.
+        """
+        with open(self.path + '.lock', 'a') as lock_file:
+            with _file_lock(lock_file, blocking=False) as locked:
+                yield locked
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def spool_record(event):
+    return {
+        'model': event.model_config.model._meta.label,
+        'event': event.event_name, 'payload': event.payload,
+        'pk': event.pk, 'action': event.action,
+    }
+
+
+def spooled_event(record):
+    """
+    :return the Event of a spool record, None if its model is not in
+    MODELS_CRUD_EVENT anymore
+    """
+    try:
+        model_config = get_model_config(apps.get_model(record['model']))
+    except LookupError:
+        model_config = None
+    if model_config is None:
+        return None
+    return Event(
+        model_config, record['event'], record['payload'], record['pk'],
+        record['action']
+    )
+
+
+class BrokerGuard:
+    """
+    Keeps the broker behind a CircuitBreaker and writes the events that
+    can't be published to a local Spool.
+
+    Events are spooled when publishing them failed, while the circuit is
+    open and while the spool holds events, so they keep their order. A
+    daemon thread drains the spool in batches once the broker is healthy
+    again (each batch is the probe of a half open circuit). Spooled events
+    are delivered at least once: a batch that failed is retried as a whole.
+
+    :param send_events: Callable publishing a list of events with the same
+        service, encoder and delivery mode, returning the list of
+        (event, exception) that failed
+    :param group_events: Callable splitting a list of events into those
+        groups
+    """
+
+    def __init__(self, send_events, group_events, spool_path=None,
+                 failure_threshold=5, reset_timeout=30.0, fsync=FSYNC_ALWAYS,
+                 fsync_interval=1.0, drain_interval=1.0,
+                 drain_batch_size=500):
+        if not spool_path:
+            raise ValueError(
+                'EVENTS_SOURCING_CIRCUIT_BREAKER requires a spool_path'
+            )
+        self.send_events = send_events
+        self.group_events = group_events
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.spool = Spool(spool_path, fsync, fsync_interval)
+        self.drain_interval = drain_interval
+        self.drain_batch_size = drain_batch_size
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        if self.spool.pending:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(
+                    target=self._run, name='events-sourcing-spool',
+                    daemon=True
+                )
+                thread.start()
+                self._thread = thread
+
+    def _failed(self, exc):
+        if self.breaker.record_failure():
+            logger.warning(
+                'Broker circuit opened, spooling events to %s: %s',
+                self.spool.path, exc
+            )
+            instrument = get_instrument()
+            if instrument is not None:
+                instrument.incr('circuit_opened')
+
+    def _spool(self, events):
+        self.spool.append([spool_record(event) for event in events])
+        self._ensure_started()
+        instrument = get_instrument()
+        if instrument is not None:
+            for event in events:
+                instrument.incr(
+                    'spooled', service=event.service_name,
+                    event=event.event_name
+                )
+
+    def publish(self, events):
+        """
+        Publishes a list of events, spooling the ones that can't be
+        published now. It never raises broker errors.
+        """
+        spooled = []
+        for group in self.group_events(events):
+            if spooled or self.breaker.is_open or self.spool.pending:
+                spooled.extend(group)
+                continue
+            try:
+                failed = self.send_events(group)
+            except Exception as exc:
+                self._failed(exc)
+                spooled.extend(group)
+                continue
+            if failed:
+                self._failed(failed[0][1])
+                spooled.extend(event for event, _ in failed)
+            else:
+                self.breaker.record_success()
+        if spooled:
+            self._spool(spooled)
+
+    def drain(self):
+        """
+        Publishes the spooled events in order, in batches, until the spool
+        is empty or publishing fails.
+
+        :return Number of events published
+        """
+        published = 0
+        if not self.spool.pending and not self.spool.size():
+            return published
+        with self.spool.drain_lock() as locked:
+            if not locked:
+                return published
+            offset = None
+            while self.breaker.allow():
+                records, next_offset = self.spool.read(
+                    self.drain_batch_size, offset
+                )
+                events = [
+                    event for event in map(spooled_event, records)
+                    if event is not None
+                ]
+                if events:
+                    try:
+                        failed = [
+                            failure for group in self.group_events(events)
+                            for failure in self.send_events(group)
+                        ]
+                    except Exception as exc:
+                        failed = [(None, exc)]
+                    if failed:
+                        self._failed(failed[0][1])
+                        break
+                    self.breaker.record_success()
+                    published += len(events)
+                if self.spool.commit(next_offset) or not records:
+                    break
+                offset = next_offset
+        return published
+
+    def _run(self):
+        while not self._stop.wait(self.drain_interval):
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Failed to drain the events spool')
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self.spool.close()
+
+
+_guard = None
+_guard_configured = False
+_guard_lock = threading.Lock()
+
+
+def get_broker_guard(send_events, group_events):
+    """
+    Returns the BrokerGuard of the current process configured with
+    settings.EVENTS_SOURCING_CIRCUIT_BREAKER, None when it is not set.
+
+    :param send_events: Callable publishing a group of events
+    :param group_events: Callable splitting a list of events into groups
+    :return BrokerGuard
+    """
+    global _guard, _guard_configured
+    if not _guard_configured:
+        with _guard_lock:
+            if not _guard_configured:
+                options = getattr(
+                    settings, 'EVENTS_SOURCING_CIRCUIT_BREAKER', None
+                )
+                if options is not None:
+                    options = dict(DEFAULT_CIRCUIT_BREAKER_OPTIONS, **options)
+                    _guard = BrokerGuard(send_events, group_events, **options)
+                _guard_configured = True
+    return _guard
+
+
+def shutdown_broker_guard():
+    """
+    Stops the spool drainer, if the circuit breaker was enabled.
+    """
+    global _guard, _guard_configured
+    guard, _guard, _guard_configured = _guard, None, False
+    if guard is not None:
+        guard.stop(guard.drain_interval)
+
+
+def _reset_after_fork():
+    # The drainer thread doesn't survive a fork, the child opens its own
+    # spool file.
+    global _guard, _guard_configured, _guard_lock
+    _guard = None
+    _guard_configured = False
+    _guard_lock = threading.Lock()
+
+
+atexit.register(shutdown_broker_guard)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_broker_guard(setting, **kwargs):
+    if setting == 'EVENTS_SOURCING_CIRCUIT_BREAKER':
+        shutdown_broker_guard()
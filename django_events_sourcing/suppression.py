@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+
+# Suppression active in the current context, None when nothing is
+# suppressed so the dispatch path only pays for one lookup.
+_suppressed = ContextVar('events_sourcing_suppressed', default=None)
+
+
+def _resolve_model(model):
+    if isinstance(model, str):
+        model = apps.get_model(model)
+    return model._meta.concrete_model
+
+
+def _instance_key(instance):
+    if instance.pk is None:
+        # Not saved yet, identified by the object itself.
+        return id(instance)
+    return type(instance)._meta.concrete_model, instance.pk
+
+
+class Suppression:
+    """
+    Set of models and instances whose events are not dispatched. Models
+    are matched with their concrete model, so proxies are suppressed too,
+    and instances by model and pk.
+    """
+    __slots__ = ('everything', 'models', 'instances')
+
+    def __init__(self, everything=False, models=frozenset(),
+                 instances=frozenset()):
+        self.everything = everything
+        self.models = models
+        self.instances = instances
+
+    def union(self, other):
+        if other is None:
+            return self
+        return Suppression(
+            self.everything or other.everything, self.models | other.models,
+            self.instances | other.instances
+        )
+
+    def suppresses_model(self, model):
+        return self.everything or model._meta.concrete_model in self.models
+
+    def suppresses(self, instance):
+        if self.suppresses_model(type(instance)):
+            return True
+        if not self.instances:
+            return False
+        return _instance_key(instance) in self.instances or \
+            id(instance) in self.instances
+
+
+@contextmanager
+def suppress_events(models=None, instances=None):
+    """
+    Context manager (or decorator) that stops the events of the given
+    models and instances from being dispatched inside it, everything when
+    neither is given. Bulk operations of suppressed models skip the queries
+    that collect their events.
+
+    The scope is stored in a context variable, so it applies to the
+    current thread or asyncio task (and the tasks it creates) only, and
+    nested scopes add up.
+
+    :param models: Model classes or 'app_label.Model' labels
+    :param instances: Model instances
+    """
+    if models is None and instances is None:
+        suppression = Suppression(everything=True)
+    else:
+        suppression = Suppression(
+            models=frozenset(_resolve_model(model) for model in models or ()),
+            instances=frozenset(
+                _instance_key(instance) for instance in instances or ()
+            )
+        )
+    token = _suppressed.set(suppression.union(_suppressed.get()))
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def is_suppressed(instance):
+    """
+    :return True if the events of the instance must not be dispatched
+    """
+    suppression = _suppressed.get()
+    return suppression is not None and suppression.suppresses(instance)
+
+
+def is_model_suppressed(model):
+    """
+    :return True if the events of every instance of the model must not be
+    dispatched
+    """
+    suppression = _suppressed.get()
+    return suppression is not None and suppression.suppresses_model(model)
@@ -0,0 +1,155 @@
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+SNAPSHOT_ATTR = '_events_sourcing_snapshot'
+PAYLOAD_FULL = 'full'
+PAYLOAD_DELTA = 'delta'
+
+_MISSING = object()
+
+
+def take_snapshot(instance, model_config):
+    """
+    Stores the loaded values of the tracked fields as a tuple on the
+    instance. Values are not copied, so in-place changes of mutable values
+    (e.g. a dict in a JSONField) are only seen when the field is listed in
+    save(update_fields=...).
+    """
+    values = instance.__dict__
+    values[SNAPSHOT_ATTR] = tuple([
+        values.get(attname, _MISSING)
+        for attname in model_config.tracked_attnames
+    ])
+
+
+def get_changed_fields(instance, model_config, update_fields=None):
+    """
+    Returns the attnames of the tracked fields changed since the instance
+    was loaded (or last saved), or None if the instance has no snapshot.
+
+    When update_fields is given, the fields saved are the changed ones.
+
+    :param instance: Model instance
+    :param model_config: ModelConfig
+    :param update_fields: update_fields passed to save()
+    :return list of str
+    """
+    if update_fields is not None:
+        names = model_config.attname_by_name
+        return [names.get(name, name) for name in update_fields]
+    snapshot = instance.__dict__.get(SNAPSHOT_ATTR)
+    if snapshot is None:
+        return None
+    values = instance.__dict__
+    return [
+        attname for attname, old in zip(
+            model_config.tracked_attnames, snapshot
+        )
+        if values.get(attname, _MISSING) != old
+    ]
+
+
+def has_relevant_changes(instance, model_config, update_fields=None):
+    """
+    Tells if an update changed a field of the model watch_fields, or any
+    field outside of its ignore_fields. Updates whose changes are unknown
+    (no snapshot nor update_fields) are relevant.
+
+    :param instance: Model instance, may be None when update_fields is given
+    :param model_config: ModelConfig
+    :param update_fields: update_fields passed to save()
+    :return bool
+    """
+    changed_fields = get_changed_fields(instance, model_config, update_fields)
+    if changed_fields is None:
+        return True
+    watched = model_config.watched_attnames
+    if watched is not None:
+        return not watched.isdisjoint(changed_fields)
+    ignored = model_config.ignored_attnames
+    return any(attname not in ignored for attname in changed_fields)
+
+
+def refresh_snapshot(instance, model_config, update_fields=None):
+    """
+    Updates the snapshot after a save. With update_fields only those fields
+    were written, the others keep their previous (database) value.
+    """
+    values = instance.__dict__
+    snapshot = values.get(SNAPSHOT_ATTR)
+    if update_fields is None or snapshot is None:
+        values[SNAPSHOT_ATTR] = tuple([
+            values.get(attname, _MISSING)
+            for attname in model_config.tracked_attnames
+        ])
+        return
+    saved = set(get_changed_fields(instance, model_config, update_fields))
+    values[SNAPSHOT_ATTR] = tuple([
+        values.get(attname, _MISSING) if attname in saved else old
+        for attname, old in zip(model_config.tracked_attnames, snapshot)
+    ])
+
+
+def serialize_delta(instance, model_config, changed_fields):
+    """
+    Serializes only the serializer fields backed by the changed model
+    fields, plus the primary key.
+
+    :param instance: Model instance
+    :param model_config: ModelConfig
+    :param changed_fields: list of attnames
+    :return dict
+    """
+    if model_config.cache_serializer:
+        fields = model_config.get_serializer().fields
+    else:
+        fields = model_config.serializer_class(instance=instance).fields
+    by_attname = model_config.get_delta_fields()
+    pk = model_config.model._meta.pk
+
+    ret = {}
+    names = list(by_attname.get(pk.attname, ()))
+    if not names:
+        # The serializer doesn't expose the primary key.
+        ret[pk.name] = instance.pk
+    for attname in changed_fields:
+        names.extend(by_attname.get(attname, ()))
+
+    for name in names:
+        if name in ret:
+            continue
+        field = fields[name]
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            continue
+        check_for_none = attribute.pk if isinstance(
+            attribute, PKOnlyObject) else attribute
+        if check_for_none is None:
+            ret[name] = None
+        else:
+            ret[name] = field.to_representation(attribute)
+    return ret
+
+
+def map_serializer_fields(model, serializer):
+    """
+    Maps model field attnames to the names of the readable serializer
+    fields whose source is that model field.
+
+    :return dict
+    """
+    attnames = {}
+    for field in model._meta.concrete_fields:
+        attnames[field.name] = field.attname
+        attnames[field.attname] = field.attname
+    attnames['pk'] = model._meta.pk.attname
+
+    by_attname = {}
+    for name, field in serializer.fields.items():
+        if field.write_only or field.source == '*':
+            continue
+        attname = attnames.get(field.source.split('.', 1)[0])
+        if attname is not None:
+            by_attname.setdefault(attname, []).append(name)
+    return by_attname
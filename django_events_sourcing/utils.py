@@ -1,18 +1,14 @@
-from django.apps import apps
-from django.conf import settings
+from django_events_sourcing.registry import get_model_config
 
 
 def load_model_configurations(sender):
     """
-    Iterates through setting MODELS_CRUD_EVENT searching for the sender
-    model configurations.
+    Returns the MODELS_CRUD_EVENT entry of the sender model, looked up in
+    the compiled registry.
     :param sender: Django Model
     :return dict
     """
-    for model_config in settings.MODELS_CRUD_EVENT:
-        model = model_config['model']
-        app, model = model.rsplit('.', 1)
-        model = apps.get_app_config(app).get_model(model)
-        if sender == model:
-            return model_config
-    return None # Not found.
+    model_config = get_model_config(sender)
+    if model_config is None:
+        return None # Not found.
+    return model_config.data
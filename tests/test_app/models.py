@@ -1,5 +1,7 @@
 from django.db import models
 
+from django_events_sourcing.managers import EventsManager
+
 # Create your models here.
 class ModelNoEvent(models.Model):
     int_field = models.IntegerField()
@@ -14,6 +16,17 @@ class Model1(models.Model):
     uuid_field = models.UUIDField()
     dt_field = models.DateTimeField()
 
+    objects = EventsManager()
+
+
+class Model1Child(models.Model):
+    model1 = models.ForeignKey(
+        Model1, related_name='children', on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=100)
+
+    objects = EventsManager()
+
 
 class StatusModel(models.Model):
     STATUS_CHOICES = (('created', 'Created'),
@@ -27,6 +40,8 @@ class StatusModel(models.Model):
     uuid_field = models.UUIDField()
     dt_field = models.DateTimeField()
 
+    objects = EventsManager()
+
 
 class StatusModel2(models.Model):
     STATUS_CHOICES = (('created', 'Created'),
@@ -38,4 +53,42 @@ class StatusModel2(models.Model):
     int_field = models.IntegerField()
     char_field = models.CharField(max_length=100)
     uuid_field = models.UUIDField()
-    dt_field = models.DateTimeField()
\ No newline at end of file
+    dt_field = models.DateTimeField()
+
+
+class WideModel(models.Model):
+    PRIORITY_CHOICES = ((1, 'Low'), (2, 'High'))
+    KIND_CHOICES = (('a', 'A'), ('b', 'B'))
+
+    model1 = models.ForeignKey(
+        Model1, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    int_field = models.IntegerField()
+    big_int_field = models.BigIntegerField()
+    small_int_field = models.SmallIntegerField()
+    positive_int_field = models.PositiveIntegerField()
+    priority = models.IntegerField(choices=PRIORITY_CHOICES)
+    float_field = models.FloatField()
+    decimal_field = models.DecimalField(max_digits=10, decimal_places=3)
+    bool_field = models.BooleanField(default=False)
+    null_bool_field = models.BooleanField(null=True)
+    char_field = models.CharField(max_length=100)
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    text_field = models.TextField(blank=True)
+    email_field = models.EmailField(blank=True)
+    slug_field = models.SlugField(blank=True)
+    url_field = models.URLField(blank=True)
+    ip_field = models.GenericIPAddressField(null=True)
+    uuid_field = models.UUIDField()
+    dt_field = models.DateTimeField()
+    null_dt_field = models.DateTimeField(null=True)
+    date_field = models.DateField()
+    time_field = models.TimeField()
+    duration_field = models.DurationField()
+    json_field = models.JSONField(default=dict)
+
+
+class Model1Projection(models.Model):
+    id = models.IntegerField(primary_key=True)
+    int_field = models.IntegerField(default=0)
+    char_field = models.CharField(max_length=100, default='')
@@ -1,9 +1,53 @@
 from rest_framework import serializers
 
-from tests.test_app.models import Model1
+from tests.test_app.models import Model1, Model1Child
 
 
 class Model1Serializer(serializers.ModelSerializer):
     class Meta:
         model = Model1
         fields = ('id', 'int_field', 'char_field', )
+
+
+class Model1MethodSerializer(serializers.ModelSerializer):
+    double = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Model1
+        fields = ('id', 'int_field', 'double', )
+
+    def get_double(self, obj):
+        return obj.int_field * 2
+
+
+class Model1OverriddenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Model1
+        fields = ('id', 'int_field', )
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        ret['extra'] = True
+        return ret
+
+
+class Model1ChildNameSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Model1Child
+        fields = ('id', 'name', )
+
+
+class Model1NestedSerializer(serializers.ModelSerializer):
+    children = Model1ChildNameSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Model1
+        fields = ('id', 'int_field', 'children', )
+
+
+class Model1ChildSerializer(serializers.ModelSerializer):
+    model1 = Model1Serializer(read_only=True)
+
+    class Meta:
+        model = Model1Child
+        fields = ('id', 'name', 'model1', )
@@ -0,0 +1,132 @@
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from kombu import Connection, Queue
+
+from django_events_sourcing import dispatcher
+from django_events_sourcing.aio import AsyncPublisher, get_async_publisher, \
+    get_calling_event_loop
+from django_events_sourcing.dispatcher import adispatch_event
+from django_events_sourcing.senders.kombu import get_exchange
+from tests.test_app.models import Model1, ModelNoEvent
+from tests.test_app.tests.utils import create_model1
+
+
+class MemoryQueueMixin:
+    def setUp(self):
+        self.connection = Connection('memory://')
+        self.addCleanup(self.connection.release)
+        self.queue = Queue(
+            'test_aio', exchange=get_exchange('test_service'),
+            routing_key='#'
+        )
+        self.queue(self.connection.default_channel).declare()
+        self.addCleanup(
+            self.queue(self.connection.default_channel).delete
+        )
+
+    def consume(self, count):
+        messages = []
+        with self.connection.Consumer(self.queue, callbacks=[
+            lambda body, message: messages.append(
+                (message.delivery_info['routing_key'], body))
+        ]):
+            for _ in range(count):
+                self.connection.drain_events(timeout=1)
+        return messages
+
+    def record_threads(self):
+        threads = []
+        dispatch_many = dispatcher.dispatch_many
+
+        def record(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return dispatch_many(*args, **kwargs)
+        patcher = patch.object(dispatcher, 'dispatch_many', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return threads
+
+
+@override_settings(AMQP_URI='memory://')
+class TestAdispatchEvent(MemoryQueueMixin, TestCase):
+    async def test_publish(self):
+        threads = self.record_threads()
+        m1 = await sync_to_async(Model1.objects.create)(
+            int_field=1, char_field='a', uuid_field='12345678-1234-5678-1234-567812345678',
+            dt_field='2019-01-01T00:00:00'
+        )
+        await sync_to_async(self.consume)(1)
+        await adispatch_event(m1, 'updated')
+        messages = await sync_to_async(self.consume)(1)
+        self.assertEqual(messages, [
+            ('model1__updated',
+             {'id': m1.id, 'int_field': 1, 'char_field': 'a'}),
+        ])
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('events-sourcing-async'))
+
+    async def test_not_registered(self):
+        threads = self.record_threads()
+        await adispatch_event(ModelNoEvent(int_field=1), 'created')
+        self.assertEqual(threads, [])
+
+    async def test_calling_event_loop(self):
+        self.assertIsNone(get_calling_event_loop())
+        self.assertIsNotNone(await sync_to_async(get_calling_event_loop)())
+
+
+@override_settings(AMQP_URI='memory://', EVENTS_SOURCING_ASYNC_OFFLOAD=True)
+class TestAsyncOffload(MemoryQueueMixin, TestCase):
+    async def test_asave_offloaded(self):
+        threads = self.record_threads()
+        m1 = Model1(
+            int_field=1, char_field='a',
+            uuid_field='12345678-1234-5678-1234-567812345678',
+            dt_field='2019-01-01T00:00:00'
+        )
+        await m1.asave()
+        await m1.adelete()
+        self.assertTrue(get_async_publisher(None).flush(timeout=5))
+        messages = await sync_to_async(self.consume)(2)
+        self.assertEqual(
+            [name for name, _ in messages],
+            ['model1__created', 'model1__deleted']
+        )
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(
+            name.startswith('events-sourcing-async') for name in threads
+        ))
+
+    @patch('django_events_sourcing.dispatcher.dispatch')
+    def test_sync_not_offloaded(self, dispatch):
+        create_model1()
+        dispatch.assert_called_once()
+
+
+class TestAsyncPublisher(TestCase):
+    def test_submit_logs_failures(self):
+        def fail(events):
+            raise ValueError()
+        publisher = AsyncPublisher(fail)
+        with self.assertLogs('django_events_sourcing.aio', 'ERROR'):
+            publisher.submit([]).exception()
+            publisher.flush()
+        publisher.shutdown()
+
+    def test_flush(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def send_events(events):
+            started.set()
+            release.wait()
+        publisher = AsyncPublisher(send_events)
+        publisher.submit([])
+        started.wait()
+        self.assertFalse(publisher.flush(timeout=0.01))
+        release.set()
+        self.assertTrue(publisher.flush(timeout=5))
+        publisher.shutdown()
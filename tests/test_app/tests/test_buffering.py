@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from tests.test_app.models import StatusModel
+from tests.test_app.tests.utils import create_model1, ProducerMockMixin
+
+
+@override_settings(EVENTS_SOURCING_DISPATCH_ON_COMMIT=True)
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestOnCommitDispatch(ProducerMockMixin, TestCase):
+    def test_events_sent_after_commit_in_one_batch(self, dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                m1 = create_model1()
+                m1.int_field = 20
+                m1.save()
+                status = StatusModel.objects.create(
+                    int_field=1, char_field='a', uuid_field=uuid.uuid4(),
+                    dt_field=datetime(2019, 1, 1), status='created'
+                )
+            self.assertEqual(self.producer.publish.call_count, 0)
+
+        dispatch.assert_not_called()
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(self.published(), [
+            ('model1__created',
+             {'id': m1.id, 'int_field': 10, 'char_field': 'test'}),
+            ('model1__updated',
+             {'id': m1.id, 'int_field': 20, 'char_field': 'test'}),
+            ('status_model__created', {
+                'id': status.id, 'status': 'created', 'int_field': 1,
+                'char_field': 'a', 'uuid_field': str(status.uuid_field),
+                'dt_field': '2019-01-01T00:00:00'}),
+        ])
+        for c in self.producer.publish.call_args_list:
+            self.assertEqual(c.kwargs['exchange'].name, 'test_service.events')
+
+    def test_rolled_back_savepoint_discarded(self, dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            m1 = create_model1(int_field=1)
+            try:
+                with transaction.atomic():
+                    create_model1(int_field=2)
+                    raise ValueError()
+            except ValueError:
+                pass
+            with transaction.atomic():
+                m3 = create_model1(int_field=3)
+
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(
+            [payload['id'] for _, payload in self.published()],
+            [m1.id, m3.id]
+        )
+
+    def test_last_savepoint_rolled_back(self, dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            m1 = create_model1(int_field=1)
+            try:
+                with transaction.atomic():
+                    create_model1(int_field=2)
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(
+            [payload['id'] for _, payload in self.published()], [m1.id]
+        )
+
+    @override_settings(MODELS_CRUD_EVENT=[
+        {'model': 'test_app.Model1', 'dispatch_on_commit': False,
+         'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    ])
+    def test_model_opt_out(self, dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_model1()
+        dispatch.assert_called_once()
+        self.producer.publish.assert_not_called()
+
+
+@override_settings(EVENTS_SOURCING_DISPATCH_ON_COMMIT=True)
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestOnCommitTransactions(ProducerMockMixin, TransactionTestCase):
+    def test_rollback_discards_events(self, dispatch):
+        try:
+            with transaction.atomic():
+                create_model1()
+                raise ValueError()
+        except ValueError:
+            pass
+        with transaction.atomic():
+            m1 = create_model1(int_field=5)
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(
+            [payload['id'] for _, payload in self.published()], [m1.id]
+        )
+
+    def test_nested_savepoints_committed_in_one_batch(self, dispatch):
+        with transaction.atomic():
+            with transaction.atomic():
+                m1 = create_model1(int_field=1)
+            try:
+                with transaction.atomic():
+                    create_model1(int_field=2)
+                    raise ValueError()
+            except ValueError:
+                pass
+            with transaction.atomic():
+                m3 = create_model1(int_field=3)
+                try:
+                    with transaction.atomic():
+                        create_model1(int_field=4)
+                        raise ValueError()
+                except ValueError:
+                    pass
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(
+            [payload['id'] for _, payload in self.published()],
+            [m1.id, m3.id]
+        )
+
+    def test_autocommit_dispatches_immediately(self, dispatch):
+        create_model1()
+        dispatch.assert_called_once()
+        self.producer.publish.assert_not_called()
@@ -0,0 +1,173 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from django_events_sourcing.coalescing import coalesce_events
+from django_events_sourcing.dispatcher import event_batch
+from django_events_sourcing.events import Event
+from django_events_sourcing.registry import get_model_config
+from tests.test_app.models import Model1, StatusModel
+from tests.test_app.tests.utils import create_model1, ProducerMockMixin
+
+COALESCE_SETTINGS = [
+    {'model': 'test_app.Model1', 'coalesce': True,
+     'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    {'model': 'test_app.StatusModel', 'status_field': 'status',
+     'coalesce': True},
+]
+
+
+@override_settings(MODELS_CRUD_EVENT=COALESCE_SETTINGS)
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestCoalescing(ProducerMockMixin, TestCase):
+    def create_status_model(self):
+        return StatusModel.objects.create(
+            int_field=1, char_field='a', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1), status='created'
+        )
+
+    def test_updates_absorbed_into_created(self, dispatch):
+        with event_batch():
+            m1 = create_model1()
+            m1.int_field = 20
+            m1.save()
+            m1.int_field = 30
+            m1.save()
+        dispatch.assert_not_called()
+        self.assertEqual(self.published(), [
+            ('model1__created',
+             {'id': m1.id, 'int_field': 30, 'char_field': 'test'}),
+        ])
+
+    def test_updates_collapsed(self, dispatch):
+        m1 = create_model1()
+        m2 = create_model1()
+        with event_batch():
+            for value in (1, 2):
+                m1.int_field = value
+                m1.save()
+                m2.int_field = value
+                m2.save()
+        self.assertEqual(self.published(), [
+            ('model1__updated',
+             {'id': m1.id, 'int_field': 2, 'char_field': 'test'}),
+            ('model1__updated',
+             {'id': m2.id, 'int_field': 2, 'char_field': 'test'}),
+        ])
+
+    def test_update_then_delete(self, dispatch):
+        m1 = create_model1()
+        m1_id = m1.id
+        with event_batch():
+            m1.int_field = 1
+            m1.save()
+            m1.delete()
+        self.assertEqual(self.published(), [
+            ('model1__deleted',
+             {'id': m1_id, 'int_field': 1, 'char_field': 'test'}),
+        ])
+
+    @override_settings(MODELS_CRUD_EVENT=[
+        {'model': 'test_app.Model1',
+         'coalesce': {'drop_transient': True, 'absorb_updates': False},
+         'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    ])
+    def test_custom_rules(self, dispatch):
+        with event_batch():
+            m1 = create_model1()
+            m1.int_field = 1
+            m1.save()
+            m1.int_field = 2
+            m1.save()
+            transient = create_model1()
+            transient.delete()
+        self.assertEqual(
+            [(name, payload['int_field']) for name, payload in
+             self.published()],
+            [('model1__created', 10), ('model1__updated', 2)]
+        )
+
+    def test_status_transitions_kept(self, dispatch):
+        with event_batch():
+            status = self.create_status_model()
+            status.int_field = 2
+            status.save()
+            status.status = 'modified'
+            status.save()
+            status.int_field = 3
+            status.save()
+            status.status = 'finished'
+            status.save()
+        self.assertEqual(
+            [(name, payload['int_field']) for name, payload in
+             self.published()],
+            [('status_model__created', 2), ('status_model__modified', 3),
+             ('status_model__finished', 3)]
+        )
+
+    @override_settings(MODELS_CRUD_EVENT=[
+        {'model': 'test_app.Model1',
+         'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    ])
+    def test_not_configured(self, dispatch):
+        with event_batch():
+            m1 = create_model1()
+            m1.save()
+        self.assertEqual(
+            [name for name, _ in self.published()],
+            ['model1__created', 'model1__updated']
+        )
+
+    def test_batch_discarded_on_error(self, dispatch):
+        with self.assertRaises(ValueError):
+            with event_batch():
+                create_model1()
+                raise ValueError()
+        self.producer.publish.assert_not_called()
+
+    @override_settings(EVENTS_SOURCING_DISPATCH_ON_COMMIT=True)
+    def test_coalesced_on_commit(self, dispatch):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                m1 = create_model1()
+                m1.int_field = 20
+                m1.save()
+        self.assertEqual(self.published(), [
+            ('model1__created',
+             {'id': m1.id, 'int_field': 20, 'char_field': 'test'}),
+        ])
+
+    def test_merged_event_takes_the_last_position(self, dispatch):
+        m1 = create_model1()
+        with event_batch():
+            m1.int_field = 1
+            m1.save()
+            m2 = create_model1()
+            m1.int_field = m2.id
+            m1.save()
+        self.assertEqual(
+            [(name, payload['id']) for name, payload in self.published()],
+            [('model1__created', m2.id), ('model1__updated', m1.id)]
+        )
+
+    def test_full_payload_replaces_delta(self, dispatch):
+        model_config = get_model_config(Model1)
+        events = coalesce_events([
+            Event(model_config, 'model1__updated', {'id': 1, 'a': 1}, 1,
+                  'updated', delta=True),
+            Event(model_config, 'model1__updated', {'id': 1, 'a': 2, 'b': 2},
+                  1, 'updated'),
+        ])
+        self.assertEqual(len(events), 1)
+        self.assertFalse(events[0].delta)
+        events = coalesce_events([
+            Event(model_config, 'model1__updated', {'id': 1, 'a': 1}, 1,
+                  'updated', delta=True),
+            Event(model_config, 'model1__updated', {'id': 1, 'b': 2}, 1,
+                  'updated', delta=True),
+        ])
+        self.assertTrue(events[0].delta)
+        self.assertEqual(events[0].payload, {'id': 1, 'a': 1, 'b': 2})
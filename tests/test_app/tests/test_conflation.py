@@ -0,0 +1,207 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+
+from django_events_sourcing.conflation import Conflator, \
+    shutdown_conflator
+from django_events_sourcing.dispatcher import adispatch_event
+from django_events_sourcing.events import Event
+from django_events_sourcing.registry import get_model_config
+from tests.test_app.models import Model1, StatusModel
+from tests.test_app.tests.utils import create_model1
+
+CONFLATED_MODELS = [
+    {'model': 'test_app.Model1', 'conflate_ms': 50,
+     'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    {'model': 'test_app.StatusModel', 'status_field': 'status',
+     'conflate_ms': 50},
+]
+
+
+class Publisher:
+    def __init__(self):
+        self.published = []
+        self.condition = threading.Condition()
+
+    def __call__(self, events):
+        with self.condition:
+            self.published.extend(events)
+            self.condition.notify_all()
+
+    def wait(self, size, timeout=5):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: len(self.published) >= size, timeout
+            )
+        return [(event.event_name, event.payload) for event in self.published]
+
+
+@override_settings(MODELS_CRUD_EVENT=CONFLATED_MODELS)
+class TestConflator(TestCase):
+    def setUp(self):
+        self.publisher = Publisher()
+        self.conflator = Conflator(self.publisher)
+        self.addCleanup(self.conflator.stop, 1)
+
+    def event(self, action='updated', pk=1, model=Model1, name=None,
+              delta=False, **payload):
+        model_config = get_model_config(model)
+        name = name or '{}__{}'.format(model_config.event_name_prefix, action)
+        return Event(model_config, name, payload, pk, action, delta)
+
+    def test_latest_update_published_when_window_expires(self):
+        first = self.event(value=0)
+        self.assertEqual(self.conflator.conflate([first]), [first])
+        for value in range(1, 4):
+            self.assertEqual(
+                self.conflator.conflate([self.event(value=value)]), []
+            )
+        other = self.event(pk=2, value=10)
+        self.assertEqual(self.conflator.conflate([other]), [other])
+        self.assertEqual(self.conflator.stats()['held'], 1)
+        self.assertEqual(
+            self.publisher.wait(1), [('model1__updated', {'value': 3})]
+        )
+        self.assertEqual(self.conflator.stats()['conflated'], 2)
+
+    def test_windows_are_closed_when_idle(self):
+        self.conflator.conflate([self.event()])
+        self.assertEqual(self.conflator.stats()['keys'], 1)
+        self.conflator.conflate([self.event(pk=2)])
+        self.conflator.conflate([self.event(pk=2)])
+        self.publisher.wait(1)
+        deadline = time.monotonic() + 5
+        while self.conflator.stats()['keys'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.conflator.stats()['keys'], 0)
+
+    def test_delete_bypasses_conflation(self):
+        self.conflator.conflate([self.event(value=0)])
+        self.conflator.conflate([self.event(value=1)])
+        events = self.conflator.conflate([self.event('deleted', value=2)])
+        # Returned to the caller, after the held update.
+        self.assertEqual(
+            [(event.event_name, event.payload) for event in events],
+            [('model1__updated', {'value': 1}),
+             ('model1__deleted', {'value': 2})]
+        )
+        self.assertEqual(self.conflator.stats()['keys'], 0)
+        self.assertEqual(self.publisher.published, [])
+
+    def test_bypass_waits_for_the_thread(self):
+        publishing = threading.Event()
+        release = threading.Event()
+
+        def publish(events):
+            publishing.set()
+            release.wait(5)
+            self.publisher(events)
+
+        conflator = Conflator(publish)
+        self.addCleanup(conflator.stop, 1)
+        conflator.conflate([self.event(value=0)])
+        conflator.conflate([self.event(value=1)])
+        # The window expires and the thread publishes the held update.
+        self.assertTrue(publishing.wait(5))
+        threading.Timer(0.05, release.set).start()
+        events = conflator.conflate([self.event('deleted', value=2)])
+        self.assertEqual(
+            self.publisher.wait(1), [('model1__updated', {'value': 1})]
+        )
+        self.assertEqual(
+            [event.event_name for event in events], ['model1__deleted']
+        )
+
+    def test_status_transition_bypasses_conflation(self):
+        self.conflator.conflate([
+            self.event(model=StatusModel, name='status_model__created')
+        ])
+        held = self.event(
+            model=StatusModel, name='status_model__created', value=1
+        )
+        transition = self.event(
+            model=StatusModel, name='status_model__paid', value=2
+        )
+        self.assertEqual(
+            self.conflator.conflate([held, transition]), [held, transition]
+        )
+        # The following updates are conflated under the new status
+        self.conflator.conflate([
+            self.event(model=StatusModel, name='status_model__paid'),
+        ])
+        self.assertEqual(self.conflator.stats()['held'], 1)
+
+    def test_delta_updates_are_merged(self):
+        self.conflator.conflate([self.event(value=0)])
+        self.conflator.conflate([self.event(a=1, b=1)])
+        self.conflator.conflate([self.event(delta=True, b=2)])
+        self.conflator.flush()
+        self.assertEqual(
+            self.publisher.published[0].payload, {'a': 1, 'b': 2}
+        )
+        self.assertFalse(self.publisher.published[0].delta)
+
+    def test_max_keys(self):
+        conflator = Conflator(self.publisher, max_keys=1)
+        self.addCleanup(conflator.stop, 1)
+        conflator.conflate([self.event(pk=1)])
+        events = [self.event(pk=2), self.event(pk=2)]
+        self.assertEqual(conflator.conflate(events), events)
+        self.assertEqual(conflator.stats()['overflow'], 2)
+        self.assertEqual(conflator.stats()['keys'], 1)
+
+    def test_invalid_config(self):
+        for model_data in ({'conflate_ms': 0},
+                           {'conflate_ms': 10, 'backend': 'outbox'}):
+            with self.assertRaises(ValueError):
+                with self.settings(MODELS_CRUD_EVENT=[
+                        dict(model_data, model='test_app.Model1')]):
+                    pass
+
+
+@override_settings(MODELS_CRUD_EVENT=CONFLATED_MODELS)
+@patch('django_events_sourcing.dispatcher.dispatch_many', return_value=[])
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestConflatedModels(TestCase):
+    def test_hot_row(self, dispatch, dispatch_many):
+        self.addCleanup(shutdown_conflator)
+        m = create_model1()
+        for value in range(1, 6):
+            m.int_field = value
+            m.save()
+        StatusModel.objects.create(
+            status='created', int_field=10, char_field='test',
+            uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+        )
+        shutdown_conflator()
+        dispatch.assert_not_called()
+        self.assertEqual(
+            [c.args[1] for c in dispatch_many.call_args_list],
+            [[('model1__created',
+               {'id': m.id, 'int_field': 10, 'char_field': 'test'})],
+             [('status_model__created', dispatch_many.call_args_list[1]
+               .args[1][0][1])],
+             [('model1__updated',
+               {'id': m.id, 'int_field': 5, 'char_field': 'test'})]]
+        )
+
+    async def test_adispatch_event_is_conflated(self, dispatch,
+                                                dispatch_many):
+        self.addCleanup(shutdown_conflator)
+        m = await sync_to_async(create_model1)()
+        for value in (1, 2, 3):
+            m.int_field = value
+            await adispatch_event(m, 'updated')
+        await sync_to_async(shutdown_conflator)()
+        self.assertEqual(
+            [c.args[1] for c in dispatch_many.call_args_list],
+            [[('model1__created',
+               {'id': m.id, 'int_field': 10, 'char_field': 'test'})],
+             [('model1__updated',
+               {'id': m.id, 'int_field': 3, 'char_field': 'test'})]]
+        )
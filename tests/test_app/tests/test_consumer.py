@@ -0,0 +1,173 @@
+from unittest.mock import patch
+
+import amqp
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from kombu import Connection, Producer
+
+from django_events_sourcing.consumer import Projection, ProjectionConsumer, \
+    get_projections
+from django_events_sourcing.senders.kombu import get_exchange
+from django_events_sourcing.suppression import suppress_events
+from tests.test_app.models import Model1, Model1Projection
+from tests.test_app.tests.utils import create_model1
+
+
+class TestProjection(TestCase):
+    def setUp(self):
+        self.projection = Projection(
+            'test_app.Model1Projection', 'test_service', 'model1',
+            fields={'name': 'char_field'}
+        )
+
+    def test_routing_keys(self):
+        self.assertEqual(
+            sorted(self.projection.routing_keys),
+            ['model1__created', 'model1__deleted', 'model1__snapshot',
+             'model1__updated']
+        )
+
+    def test_status_routing_keys(self):
+        projection = Projection(
+            Model1Projection, 'test_service', 'status_model',
+            statuses=('finished',)
+        )
+        self.assertIn('status_model__finished', projection.routing_keys)
+
+    def test_reduce_keeps_the_last_state(self):
+        upserts, deletes = self.projection.reduce([
+            ('model1__created', {'id': 1, 'int_field': 1, 'name': 'a'}),
+            ('model1__updated', {'id': 1, 'int_field': 2}),
+            ('model1__created', {'id': 2, 'int_field': 1}),
+            ('model1__deleted', {'id': 2}),
+            ('model1__deleted', {'id': 3}),
+            ('model1__created', {'id': 3, 'int_field': 3, 'unknown': 1}),
+        ])
+        self.assertEqual(upserts, {
+            1: {'id': 1, 'int_field': 2, 'char_field': 'a'},
+            3: {'id': 3, 'int_field': 3},
+        })
+        self.assertEqual(deletes, {2})
+
+    def test_apply(self):
+        Model1Projection.objects.create(id=1, int_field=1, char_field='a')
+        Model1Projection.objects.create(id=2, int_field=1, char_field='b')
+        with self.assertNumQueries(3):
+            self.projection.apply([
+                ('model1__updated', {'id': 1, 'int_field': 5}),
+                ('model1__deleted', {'id': 2}),
+                ('model1__created', {'id': 3, 'int_field': 3, 'name': 'c'}),
+            ])
+        self.assertEqual(
+            list(Model1Projection.objects.order_by('id').values_list(
+                'id', 'int_field', 'char_field')),
+            [(1, 5, 'a'), (3, 3, 'c')]
+        )
+
+    def test_transform_skips_events(self):
+        projection = Projection(
+            Model1Projection, 'test_service', 'model1',
+            transform=lambda payload: payload if payload['id'] > 1 else None
+        )
+        projection.apply([
+            ('model1__created', {'id': 1}), ('model1__created', {'id': 2}),
+        ])
+        self.assertEqual(
+            list(Model1Projection.objects.values_list('id', flat=True)), [2]
+        )
+
+    @override_settings(EVENTS_SOURCING_PROJECTIONS=[{
+        'model': 'test_app.Model1Projection', 'service_name': 'test_service',
+        'event_name_prefix': 'model1',
+    }])
+    def test_get_projections(self):
+        projection, = get_projections()
+        self.assertIs(projection.model, Model1Projection)
+
+    def test_partial_rows_only_update(self):
+        with suppress_events():
+            m1 = create_model1()
+        projection = Projection(Model1, 'test_service', 'model1')
+        with self.assertLogs('django_events_sourcing.consumer', 'WARNING'):
+            projection.apply([
+                ('model1__updated', {'id': m1.pk, 'int_field': 5}),
+                ('model1__updated', {'id': m1.pk + 1, 'int_field': 6}),
+            ])
+        self.assertEqual(
+            list(Model1.objects.values_list('id', 'int_field')),
+            [(m1.pk, 5)]
+        )
+
+
+class TestProjectionConsumer(TestCase):
+    def setUp(self):
+        self.connection = Connection('memory://')
+        self.addCleanup(self.connection.release)
+        self.consumer = ProjectionConsumer(
+            [Projection(Model1Projection, 'test_service', 'model1')],
+            'memory://', 'test_projection_{}'.format(self._testMethodName),
+            batch_size=10, batch_timeout=0.2
+        )
+        channel = self.connection.default_channel
+        for queue in self.consumer.get_queues():
+            queue(channel).declare()
+        self.producer = Producer(channel, get_exchange('test_service'))
+
+    def publish(self, event_name, payload):
+        self.producer.publish(payload, routing_key=event_name)
+
+    def test_batch_applied_and_acked(self):
+        self.publish('model1__created', {'id': 1, 'int_field': 1})
+        self.publish('model1__updated', {'id': 1, 'int_field': 2})
+        self.publish('model1__created', {'id': 2, 'int_field': 3})
+        self.publish('model2__created', {'id': 3, 'int_field': 3})
+        self.assertEqual(self.consumer.run(max_batches=1), 3)
+        self.assertEqual(
+            list(Model1Projection.objects.order_by('id').values_list(
+                'id', 'int_field')),
+            [(1, 2), (2, 3)]
+        )
+        self.assertEqual(self.consumer.run(max_batches=1), 3)
+
+    def test_batch_requeued_on_database_errors(self):
+        self.publish('model1__created', {'id': 1, 'int_field': 1})
+        with patch.object(Projection, 'apply', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.consumer.run(max_batches=1)
+        self.assertFalse(Model1Projection.objects.exists())
+        self.assertEqual(self.consumer.run(max_batches=1), 1)
+        self.assertTrue(Model1Projection.objects.filter(id=1).exists())
+
+    def test_poison_messages_rejected(self):
+        self.publish('model1__created', {'id': 1, 'int_field': 1})
+        self.publish('model1__created', {'id': 2, 'int_field': 'invalid'})
+        self.publish('model1__created', {'id': 3, 'int_field': 3})
+        with self.assertLogs('django_events_sourcing.consumer', 'ERROR'):
+            self.assertEqual(self.consumer.run(max_batches=1), 2)
+        self.assertEqual(self.consumer.rejected, 1)
+        self.assertEqual(
+            list(Model1Projection.objects.order_by('id').values_list(
+                'id', flat=True)),
+            [1, 3]
+        )
+        # Nothing is redelivered.
+        self.assertEqual(self.consumer.run(max_batches=1), 2)
+
+    def test_reconnects(self):
+        self.publish('model1__created', {'id': 1, 'int_field': 1})
+        self.consumer.reconnect_interval = 0
+        consume_batch = self.consumer.consume_batch
+        calls = []
+
+        def flaky(connection):
+            calls.append(connection)
+            if len(calls) == 1:
+                raise amqp.exceptions.ConnectionError('lost')
+            return consume_batch(connection)
+
+        with patch.object(self.consumer, 'consume_batch', flaky):
+            with self.assertLogs('django_events_sourcing.consumer',
+                                 'WARNING'):
+                self.assertEqual(self.consumer.run(max_batches=1), 1)
+        self.assertEqual(len(calls), 2)
+        self.assertIsNot(calls[0], calls[1])
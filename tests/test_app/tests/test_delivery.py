@@ -0,0 +1,221 @@
+import socket
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+import amqp
+from django.test import SimpleTestCase, TestCase, override_settings
+from kombu import Connection, Queue
+
+from django_events_sourcing.senders.kombu import dispatch, dispatch_many, \
+    flush_confirms, get_exchange
+from django_events_sourcing.signals import event_confirmed, event_failed
+from tests.test_app.models import Model1
+from tests.test_app.tests.utils import create_model1
+
+
+class FakeAsyncChannel:
+    """Confirm mode channel that confirms on drain_events once released."""
+
+    def __init__(self, nack=()):
+        self.events = defaultdict(set)
+        self.connection = self
+        self.nack = set(nack)
+        self.published = 0
+        self.confirmed = 0
+        self.release = True
+
+    def confirm_select(self):
+        pass
+
+    def drain_events(self, timeout=None):
+        if not self.release or self.confirmed == self.published:
+            raise socket.timeout()
+        for tag in range(self.confirmed + 1, self.published + 1):
+            name = 'basic_nack' if tag in self.nack else 'basic_ack'
+            for callback in list(self.events[name]):
+                callback(tag, False)
+        self.confirmed = self.published
+
+
+class TestDeliveryModes(SimpleTestCase):
+    def patch_producer(self, channel):
+        producer = MagicMock()
+        producer.channel = channel
+        self.acquired_options = []
+
+        def publish(*args, **kwargs):
+            channel.published += 1
+        producer.publish.side_effect = publish
+
+        @contextmanager
+        def acquire_producer(amqp_uri, **kwargs):
+            self.acquired_options.append(kwargs['transport_options'])
+            yield producer
+
+        patcher = patch(
+            'django_events_sourcing.senders.kombu.acquire_producer',
+            acquire_producer
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return producer
+
+    def test_fire_and_forget(self):
+        producer = self.patch_producer(FakeAsyncChannel())
+        failed = dispatch_many(
+            'svc', [('a', {}), ('b', {})], 'amqp://',
+            delivery_mode='fire_and_forget'
+        )
+        dispatch('svc', 'c', {}, 'amqp://', delivery_mode='fire_and_forget')
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            [c.kwargs['delivery_mode'] for c in
+             producer.publish.call_args_list], [1, 1, 1]
+        )
+        self.assertEqual(
+            self.acquired_options, [{'confirm_publish': False}] * 2
+        )
+        self.assertIsNone(
+            getattr(producer.channel, '_events_sourcing_delivery_tag', None)
+        )
+
+    def test_confirm_is_default(self):
+        producer = self.patch_producer(FakeAsyncChannel())
+        dispatch('svc', 'a', {}, 'amqp://')
+        self.assertNotIn('delivery_mode', producer.publish.call_args.kwargs)
+        self.assertEqual(self.acquired_options, [None])
+
+    def test_async_confirm(self):
+        channel = FakeAsyncChannel(nack={2})
+        channel.release = False
+        self.patch_producer(channel)
+        confirmed = []
+        failed = dispatch_many(
+            'svc', [('a', {}), ('b', {})], 'amqp://',
+            delivery_mode='async_confirm',
+            on_confirm=lambda index, exc: confirmed.append((index, exc))
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(confirmed, [])
+        self.assertEqual(self.acquired_options, [{}])
+
+        channel.release = True
+        # The confirms are read when the channel is used again.
+        dispatch(
+            'svc', 'c', {}, 'amqp://', delivery_mode='async_confirm',
+            on_confirm=lambda index, exc: confirmed.append(('c', exc))
+        )
+        self.assertEqual(confirmed[0], (0, None))
+        self.assertEqual(confirmed[1][0], 1)
+        self.assertIsInstance(confirmed[1][1], amqp.exceptions.MessageNacked)
+        self.assertEqual(confirmed[2], ('c', None))
+
+    def test_flush_confirms(self):
+        channel = FakeAsyncChannel()
+        channel.release = False
+        self.patch_producer(channel)
+        confirmed = []
+        dispatch_many(
+            'svc', [('a', {})], 'amqp://', delivery_mode='async_confirm',
+            on_confirm=lambda index, exc: confirmed.append(index)
+        )
+        self.assertFalse(flush_confirms(timeout=0))
+        channel.release = True
+        self.assertTrue(flush_confirms(timeout=0))
+        self.assertEqual(confirmed, [0])
+
+    def test_flush_confirms_skips_channels_in_use(self):
+        channel = FakeAsyncChannel()
+        channel.release = False
+        self.patch_producer(channel)
+        dispatch_many(
+            'svc', [('a', {})], 'amqp://', delivery_mode='async_confirm'
+        )
+        channel.release = True
+        tracker = channel._events_sourcing_async_confirms
+        in_use = threading.Event()
+        done = threading.Event()
+
+        def use_channel():
+            with tracker.lock:
+                in_use.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=use_channel)
+        thread.start()
+        in_use.wait(5)
+        try:
+            self.assertFalse(flush_confirms(timeout=0))
+            self.assertEqual(channel.confirmed, 0)
+        finally:
+            done.set()
+            thread.join(5)
+        self.assertTrue(flush_confirms(timeout=0))
+        self.assertEqual(channel.confirmed, 1)
+
+    def test_publish_error_calls_back(self):
+        producer = self.patch_producer(FakeAsyncChannel())
+        producer.publish.side_effect = ValueError()
+        confirmed = []
+        failed = dispatch_many(
+            'svc', [('a', {})], 'amqp://', delivery_mode='async_confirm',
+            on_confirm=lambda index, exc: confirmed.append((index, exc))
+        )
+        self.assertEqual(len(failed), 1)
+        self.assertIsInstance(confirmed[0][1], ValueError)
+
+    def test_async_confirm_memory_transport(self):
+        with Connection('memory://') as conn:
+            queue = Queue(
+                'test_delivery', exchange=get_exchange('svc'),
+                routing_key='#'
+            )
+            queue(conn.default_channel).declare()
+            confirmed = []
+            dispatch_many(
+                'svc', [('a', {'id': 1})], 'memory://',
+                delivery_mode='async_confirm',
+                on_confirm=lambda index, exc: confirmed.append((index, exc))
+            )
+            self.assertEqual(confirmed, [(0, None)])
+            message = queue(conn.default_channel).get(no_ack=True)
+            self.assertEqual(message.payload, {'id': 1})
+
+
+@override_settings(MODELS_CRUD_EVENT=[
+    {'model': 'test_app.Model1', 'delivery_mode': 'async_confirm',
+     'serializer': 'tests.test_app.serializers.Model1Serializer'},
+])
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestModelDeliveryMode(TestCase):
+    def test_signals(self, dispatch):
+        confirmed = []
+        failures = []
+
+        def on_confirmed(sender, event, **kwargs):
+            confirmed.append((sender, event.event_name))
+
+        def on_failed(sender, event, exception, **kwargs):
+            failures.append((sender, exception))
+        event_confirmed.connect(on_confirmed)
+        event_failed.connect(on_failed)
+        self.addCleanup(event_confirmed.disconnect, on_confirmed)
+        self.addCleanup(event_failed.disconnect, on_failed)
+
+        create_model1()
+        kwargs = dispatch.call_args.kwargs
+        self.assertEqual(kwargs['delivery_mode'], 'async_confirm')
+        kwargs['on_confirm'](0, None)
+        error = amqp.exceptions.MessageNacked()
+        kwargs['on_confirm'](0, error)
+        self.assertEqual(confirmed, [(Model1, 'model1__created')])
+        self.assertEqual(failures, [(Model1, error)])
+
+    def test_invalid(self, dispatch):
+        with self.assertRaises(ValueError):
+            with self.settings(MODELS_CRUD_EVENT=[
+                {'model': 'test_app.Model1', 'delivery_mode': 'other'}
+            ]):
+                pass
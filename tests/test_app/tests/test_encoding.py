@@ -0,0 +1,103 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from kombu import Connection, Queue
+
+from django_events_sourcing.encoding import Encoder, get_encoder
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.senders.kombu import dispatch_many, get_exchange
+from tests.test_app.models import Model1
+from tests.test_app.tests.utils import create_model1
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PAYLOAD = {'id': 1, 'text': 'x' * 2000}
+
+
+class TestEncoder(SimpleTestCase):
+    def test_default_is_kombu_json(self):
+        self.assertIsNone(get_encoder())
+        self.assertIs(get_encoder('compact_json'), get_encoder('compact_json'))
+
+    def test_compact_json(self):
+        body, options = Encoder('compact_json').encode({'id': 1, 'a': [1]})
+        self.assertEqual(body, '{"id":1,"a":[1]}')
+        self.assertEqual(options, {
+            'content_type': 'application/json', 'content_encoding': 'utf-8'
+        })
+
+    def test_compression_threshold(self):
+        encoder = Encoder('json', 'zlib', compression_threshold=100)
+        _, options = encoder.encode({'id': 1})
+        self.assertNotIn('compression', options)
+        _, options = encoder.encode(PAYLOAD)
+        self.assertEqual(options['compression'], 'zlib')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            get_encoder('unknown')
+        with self.assertRaises(ValueError):
+            get_encoder('json', 'unknown')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        body, options = Encoder('msgpack').encode(PAYLOAD)
+        self.assertEqual(options['content_type'], 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(body), PAYLOAD)
+
+    def consume(self, encoder, events):
+        with Connection('memory://') as conn:
+            queue = Queue(
+                'test_encoding', exchange=get_exchange('svc'),
+                routing_key='#'
+            )
+            queue(conn.default_channel).declare()
+            failed = dispatch_many('svc', events, 'memory://', encoder=encoder)
+            self.assertEqual(failed, [])
+            messages = []
+            with conn.Consumer(queue, callbacks=[
+                lambda body, message: messages.append((message, body))
+            ]):
+                for _ in events:
+                    conn.drain_events(timeout=1)
+        return messages
+
+    def test_consumer_decodes(self):
+        encoder = Encoder('compact_json', 'zlib', compression_threshold=100)
+        messages = self.consume(encoder, [
+            ('a__created', {'id': 1}), ('a__updated', PAYLOAD)
+        ])
+        self.assertEqual(
+            [body for _, body in messages], [{'id': 1}, PAYLOAD]
+        )
+        small, big = [message for message, _ in messages]
+        self.assertEqual(small.content_type, 'application/json')
+        self.assertNotIn('compression', small.headers)
+        self.assertEqual(big.headers['compression'], 'application/x-gzip')
+
+
+@override_settings(MODELS_CRUD_EVENT=[
+    {'model': 'test_app.Model1', 'encoding': 'compact_json',
+     'compression': 'zlib', 'compression_threshold': 10},
+])
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestModelEncoding(TestCase):
+    def test_dispatch_encoder(self, dispatch):
+        create_model1()
+        encoder = get_model_config(Model1).encoder
+        self.assertEqual(encoder.encoding, 'compact_json')
+        self.assertEqual(encoder.compression, 'zlib')
+        self.assertIs(dispatch.call_args[1]['encoder'], encoder)
+
+    @override_settings(EVENTS_SOURCING_ENCODING='compact_json',
+                       EVENTS_SOURCING_COMPRESSION='lzma')
+    def test_global_settings(self, dispatch):
+        with self.settings(MODELS_CRUD_EVENT=[{'model': 'test_app.Model1'}]):
+            encoder = get_model_config(Model1).encoder
+        self.assertEqual(encoder.encoding, 'compact_json')
+        self.assertEqual(encoder.compression, 'lzma')
+        self.assertEqual(encoder.compression_threshold, 1024)
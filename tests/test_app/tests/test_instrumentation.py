@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+import amqp
+from django.core.management import call_command, CommandError
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from django_events_sourcing.instrumentation import Histogram, \
+    StatsInstrument, get_instrument, DURATION_BOUNDS
+from django_events_sourcing.senders.kombu import dispatch_many
+from tests.test_app.tests.utils import create_model1, ProducerMockMixin
+
+STATS_INSTRUMENT = 'django_events_sourcing.instrumentation.StatsInstrument'
+
+
+def find(entries, metric, **labels):
+    return [
+        entry for entry in entries
+        if entry['metric'] == metric and
+        all(entry['labels'].get(k) == v for k, v in labels.items())
+    ]
+
+
+class TestHistogram(SimpleTestCase):
+    def test_percentiles(self):
+        histogram = Histogram(DURATION_BOUNDS)
+        for _ in range(98):
+            histogram.observe(0.0015)
+        histogram.observe(0.3)
+        histogram.observe(0.4)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.percentile(50), 0.002)
+        self.assertEqual(histogram.percentile(99), 0.4)
+        self.assertEqual(histogram.max, 0.4)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram(DURATION_BOUNDS).percentile(99))
+
+    def test_merge(self):
+        histogram = Histogram(DURATION_BOUNDS)
+        histogram.observe(0.3)
+        other = Histogram(DURATION_BOUNDS)
+        other.observe(0.001)
+        histogram.merge(other.get_state())
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual((histogram.min, histogram.max), (0.001, 0.3))
+        self.assertEqual(histogram.percentile(50), 0.001)
+
+
+@override_settings(EVENTS_SOURCING_INSTRUMENT=STATS_INSTRUMENT)
+class TestStatsInstrument(ProducerMockMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_instrument().reset()
+
+    def test_dispatch_measured(self):
+        create_model1()
+        stats = get_instrument().snapshot()
+        self.assertEqual(find(stats['counters'], 'published'), [{
+            'metric': 'published', 'value': 1,
+            'labels': {'service': 'test_service', 'event': 'model1__created'}
+        }])
+        for metric in ('lookup', 'serialize'):
+            histogram, = find(
+                stats['histograms'], metric, model='test_app.Model1'
+            )
+            self.assertEqual(histogram['count'], 1)
+        size, = find(stats['histograms'], 'payload_size')
+        self.assertEqual(
+            size['max'], len(self.producer.publish.call_args[0][0])
+        )
+        self.assertEqual(
+            self.producer.publish.call_args[1]['content_type'],
+            'application/json'
+        )
+
+    def test_not_found_and_failures(self):
+        self.producer.publish.side_effect = [
+            amqp.exceptions.NotFound(), ValueError(), None
+        ]
+        failed = dispatch_many(
+            'svc', [('a', {}), ('b', {}), ('c', {})], 'amqp://'
+        )
+        self.assertEqual(len(failed), 2)
+        counters = get_instrument().snapshot()['counters']
+        self.assertEqual(
+            [(c['metric'], c['labels']['event']) for c in counters],
+            [('failed', 'b'), ('not_found', 'a'), ('published', 'c')]
+        )
+
+    def test_command(self):
+        create_model1()
+        out = StringIO()
+        call_command('events_stats', '--json', '--reset', stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertTrue(find(stats['histograms'], 'publish'))
+        self.assertEqual(
+            get_instrument().snapshot(), {'counters': [], 'histograms': []}
+        )
+        out = StringIO()
+        create_model1()
+        call_command('events_stats', stdout=out)
+        self.assertIn('model1__created', out.getvalue())
+
+
+class TestExportedStats(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'stats')
+
+    def test_export_throttled(self):
+        instrument = StatsInstrument(path=self.path, interval=60)
+        instrument.incr('published', event='a')
+        self.assertFalse(os.path.exists(self.path))
+        instrument._next_export = 0
+        instrument.observe('publish', 0.01, event='a')
+        exported = os.path.join(self.path, '{}.json'.format(os.getpid()))
+        with open(exported) as stats_file:
+            self.assertEqual(
+                json.load(stats_file)['counters'],
+                [['published', {'event': 'a'}, 1]]
+            )
+
+    def test_command_merges_processes(self):
+        os.makedirs(self.path)
+        for pid, value in ((1, 2), (2, 3)):
+            instrument = StatsInstrument(path=self.path)
+            instrument.incr('published', value, event='a')
+            instrument.observe('publish', value / 1000, event='a')
+            with open(os.path.join(self.path, '{}.json'.format(pid)),
+                      'w') as stats_file:
+                json.dump(instrument.get_state(), stats_file)
+        out = StringIO()
+        # No instrument is configured in the process of the command.
+        with self.settings(EVENTS_SOURCING_STATS={'path': self.path}):
+            call_command('events_stats', '--json', stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual(stats['counters'], [{
+            'metric': 'published', 'labels': {'event': 'a'}, 'value': 5
+        }])
+        histogram, = stats['histograms']
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(histogram['max'], 0.003)
+
+    def test_command_errors(self):
+        with self.assertRaises(CommandError):
+            call_command('events_stats', '--path', self.path)
+        os.makedirs(self.path)
+        with self.assertRaises(CommandError):
+            call_command('events_stats', '--path', self.path, '--reset')
+
+
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestNoInstrument(TestCase):
+    def test_disabled_by_default(self, dispatch):
+        self.assertIsNone(get_instrument())
+        create_model1()
+        dispatch.assert_called_once()
+
+    def test_command_disabled(self, dispatch):
+        with self.assertRaises(CommandError):
+            call_command('events_stats')
+
+    def test_instance_setting(self, dispatch):
+        instrument = StatsInstrument()
+        with self.settings(EVENTS_SOURCING_INSTRUMENT=instrument):
+            self.assertIs(get_instrument(), instrument)
@@ -0,0 +1,140 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from django.db import NotSupportedError
+from django.test import TestCase, override_settings
+
+from django_events_sourcing import managers
+from django_events_sourcing.suppression import suppress_events
+from tests.test_app.models import Model1, StatusModel
+from tests.test_app.tests.utils import create_model1, ProducerMockMixin
+
+
+def new_model1(int_field):
+    return Model1(
+        int_field=int_field, char_field='test', uuid_field=uuid.uuid4(),
+        dt_field=datetime(2019, 1, 1)
+    )
+
+
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestBulkOperations(ProducerMockMixin, TestCase):
+    def test_bulk_create(self, dispatch):
+        objs = Model1.objects.bulk_create([new_model1(i) for i in range(3)])
+        dispatch.assert_not_called()
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(self.published(), [
+            ('model1__created',
+             {'id': obj.id, 'int_field': i, 'char_field': 'test'})
+            for i, obj in enumerate(objs)
+        ])
+
+    @override_settings(EVENTS_SOURCING_BULK_CHUNK_SIZE=2)
+    def test_bulk_create_chunks(self, dispatch):
+        Model1.objects.bulk_create([new_model1(i) for i in range(5)])
+        self.assertEqual(self.acquired, 3)
+        self.assertEqual(self.producer.publish.call_count, 5)
+
+    def test_bulk_create_conflicts_refused(self, dispatch):
+        obj = create_model1()
+        for options in ({'ignore_conflicts': True}, {
+                'update_conflicts': True, 'unique_fields': ['id'],
+                'update_fields': ['int_field']}):
+            self.producer.publish.reset_mock()
+            duplicate = new_model1(5)
+            duplicate.pk = obj.pk
+            with self.assertRaises(ValueError):
+                Model1.objects.bulk_create([duplicate], **options)
+            self.producer.publish.assert_not_called()
+            with suppress_events():
+                Model1.objects.bulk_create([duplicate], **options)
+        self.assertEqual(Model1.objects.count(), 1)
+
+    def test_bulk_update(self, dispatch):
+        objs = [create_model1(int_field=i) for i in range(2)]
+        dispatch.reset_mock()
+        for obj in objs:
+            obj.int_field += 10
+        Model1.objects.bulk_update(objs, ['int_field'])
+        dispatch.assert_not_called()
+        self.assertEqual(self.published(), [
+            ('model1__updated',
+             {'id': obj.id, 'int_field': obj.int_field, 'char_field': 'test'})
+            for obj in objs
+        ])
+
+    def test_queryset_update(self, dispatch):
+        objs = [create_model1(int_field=i) for i in range(3)]
+        rows = Model1.objects.filter(int_field__gte=1).update(int_field=50)
+        self.assertEqual(rows, 2)
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(self.published(), [
+            ('model1__updated',
+             {'id': obj.id, 'int_field': 50, 'char_field': 'test'})
+            for obj in objs[1:]
+        ])
+
+    def test_queryset_update_only_rows_read(self, dispatch):
+        objs = [create_model1(int_field=i) for i in range(2)]
+        chunked = managers.chunked
+
+        def insert_matching_row(items, size):
+            # Inserted after the pks were read.
+            with suppress_events():
+                create_model1(int_field=1)
+            return chunked(items, size)
+
+        with patch.object(managers, 'chunked', insert_matching_row):
+            rows = Model1.objects.filter(int_field__gte=0).update(
+                int_field=50
+            )
+        self.assertEqual(rows, 2)
+        self.assertEqual(
+            [payload['id'] for _, payload in self.published()],
+            [obj.id for obj in objs]
+        )
+        self.assertEqual(Model1.objects.filter(int_field=50).count(), 2)
+
+    def test_sliced_queryset_update_refused(self, dispatch):
+        create_model1()
+        create_model1()
+        with self.assertRaises(TypeError):
+            Model1.objects.order_by('pk')[:1].update(int_field=50)
+        self.assertFalse(Model1.objects.filter(int_field=50).exists())
+        self.producer.publish.reset_mock()
+        with self.assertRaises(NotSupportedError):
+            Model1.objects.filter(pk=1).union(
+                Model1.objects.filter(pk=2)).update(int_field=50)
+        self.producer.publish.assert_not_called()
+
+    def test_queryset_update_status(self, dispatch):
+        status = StatusModel.objects.create(
+            int_field=1, char_field='a', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1), status='created'
+        )
+        StatusModel.objects.filter(pk=status.pk).update(status='finished')
+        self.assertEqual(
+            [name for name, _ in self.published()], ['status_model__finished']
+        )
+
+    def test_queryset_delete(self, dispatch):
+        objs = [create_model1(int_field=i) for i in range(3)]
+        dispatch.reset_mock()
+        deleted, _ = Model1.objects.all().delete()
+        self.assertEqual(deleted, 3)
+        dispatch.assert_not_called()
+        self.assertEqual(self.acquired, 1)
+        self.assertEqual(
+            sorted(self.published(), key=lambda event: event[1]['id']),
+            [('model1__deleted',
+              {'id': obj.id, 'int_field': obj.int_field, 'char_field': 'test'})
+             for obj in objs]
+        )
+
+    @override_settings(MODELS_CRUD_EVENT=[])
+    def test_not_registered(self, dispatch):
+        Model1.objects.bulk_create([new_model1(1)])
+        Model1.objects.update(int_field=2)
+        Model1.objects.all().delete()
+        self.producer.publish.assert_not_called()
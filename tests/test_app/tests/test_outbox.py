@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from kombu import Connection, Queue
+
+from django_events_sourcing.models import EventOutbox
+from django_events_sourcing.outbox import prune_outbox
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.senders.kombu import get_exchange
+from tests.test_app.models import Model1
+
+
+@override_settings(EVENTS_SOURCING_BACKEND='outbox', AMQP_URI='memory://')
+class TestOutbox(TestCase):
+    def create_model1(self):
+        return Model1.objects.create(
+            int_field=10, char_field='test', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1)
+        )
+
+    @patch('django_events_sourcing.dispatcher.dispatch')
+    def test_event_written_to_outbox(self, dispatch):
+        m = self.create_model1()
+        dispatch.assert_not_called()
+        row = EventOutbox.objects.get()
+        self.assertEqual(row.service_name, 'test_service')
+        self.assertEqual(row.event_name, 'model1__created')
+        self.assertIsNone(row.sent_at)
+        self.assertIn('"id": {}'.format(m.id), row.payload)
+
+    def test_relay_publishes_pending_rows(self):
+        m = self.create_model1()
+        m.int_field = 20
+        m.save()
+        with Connection('memory://') as conn:
+            queue = Queue(
+                'test_outbox', exchange=get_exchange('test_service'),
+                routing_key='#'
+            )
+            queue(conn.default_channel).declare()
+            call_command(
+                'relay_events', '--once', '--batch-size', '1',
+                stdout=StringIO()
+            )
+            messages = []
+            with conn.Consumer(queue, callbacks=[
+                lambda body, message: messages.append(
+                    (message.delivery_info['routing_key'], body['int_field']))
+            ]):
+                conn.drain_events(timeout=1)
+                conn.drain_events(timeout=1)
+        self.assertEqual(
+            messages, [('model1__created', 10), ('model1__updated', 20)]
+        )
+        self.assertFalse(
+            EventOutbox.objects.filter(sent_at__isnull=True).exists()
+        )
+
+    @patch('django_events_sourcing.outbox.dispatch_many')
+    def test_failed_rows_stay_pending(self, dispatch_many):
+        dispatch_many.return_value = [(1, OSError())]
+        self.create_model1()
+        m = self.create_model1()
+        m.save()
+        call_command('relay_events', '--once', stdout=StringIO())
+        # The batch stops at the failed row, the following one is retried
+        # after it.
+        self.assertEqual(
+            list(EventOutbox.objects.filter(sent_at__isnull=True).order_by(
+                'pk').values_list('event_name', flat=True)),
+            ['model1__created', 'model1__updated']
+        )
+        pending = EventOutbox.objects.filter(sent_at__isnull=True).first()
+        self.assertIn('"id": {}'.format(m.id), pending.payload)
+
+    @override_settings(MODELS_CRUD_EVENT=[
+        {'model': 'test_app.Model1', 'compression': 'zlib',
+         'delivery_mode': 'fire_and_forget'},
+    ])
+    @patch('django_events_sourcing.outbox.dispatch_many', return_value=[])
+    def test_rows_published_with_model_options(self, dispatch_many):
+        self.create_model1()
+        EventOutbox.objects.create(
+            service_name='test_service', event_name='old', payload='{}'
+        )
+        call_command('relay_events', '--once', stdout=StringIO())
+        first, second = dispatch_many.call_args_list
+        self.assertIs(
+            first.kwargs['encoder'], get_model_config(Model1).encoder
+        )
+        self.assertEqual(first.kwargs['delivery_mode'], 'fire_and_forget')
+        self.assertEqual(second.args[1], [('old', {})])
+        self.assertIsNone(second.kwargs['encoder'])
+        self.assertEqual(second.kwargs['delivery_mode'], 'confirm')
+
+    def test_prune(self):
+        now = timezone.now()
+        EventOutbox.objects.bulk_create([
+            EventOutbox(service_name='s', event_name='old', payload='{}',
+                        sent_at=now - timedelta(hours=2)),
+            EventOutbox(service_name='s', event_name='recent', payload='{}',
+                        sent_at=now),
+            EventOutbox(service_name='s', event_name='pending', payload='{}'),
+        ])
+        self.assertEqual(prune_outbox(3600), 1)
+        self.assertEqual(
+            set(EventOutbox.objects.values_list('event_name', flat=True)),
+            {'recent', 'pending'}
+        )
@@ -0,0 +1,173 @@
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from django_events_sourcing import publisher
+from django_events_sourcing.instrumentation import StatsInstrument
+from django_events_sourcing.publisher import BackgroundPublisher, \
+    PartitionedPublisher, get_publisher, shutdown_publisher
+from tests.test_app.models import Model1
+
+
+class BlockingSender:
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+
+    def __call__(self, events):
+        self.release.wait(5)
+        self.sent.append(list(events))
+
+
+class TestBackgroundPublisher(SimpleTestCase):
+    def test_events_published_in_batches(self):
+        sender = BlockingSender()
+        pub = BackgroundPublisher(sender, batch_size=3)
+        self.addCleanup(pub.stop, 1)
+        for i in range(7):
+            pub.submit(i)
+        sender.release.set()
+        self.assertTrue(pub.flush(5))
+        self.assertEqual(sum(sender.sent, []), list(range(7)))
+        self.assertTrue(all(len(batch) <= 3 for batch in sender.sent))
+
+    def test_drop_oldest(self):
+        sender = BlockingSender()
+        pub = BackgroundPublisher(
+            sender, max_queue_size=2, overflow='drop_oldest'
+        )
+        self.addCleanup(pub.stop, 1)
+        pub.submit(0)
+        # Wait for the thread to pick the first event and block on it.
+        while pub.queue.qsize():
+            pass
+        for i in range(1, 5):
+            pub.submit(i)
+        sender.release.set()
+        pub.flush(5)
+        self.assertEqual(sum(sender.sent, []), [0, 3, 4])
+        self.assertEqual(pub.dropped, 2)
+
+    def test_sync_fallback(self):
+        sender = BlockingSender()
+        pub = BackgroundPublisher(sender, max_queue_size=1, overflow='sync')
+        self.addCleanup(pub.stop, 1)
+        sender.release.set()
+        with patch.object(pub.queue, 'put_nowait',
+                          side_effect=publisher.queue.Full):
+            pub.submit('sync')
+        self.assertEqual(sender.sent, [['sync']])
+
+    def test_block_timeout_drops(self):
+        sender = BlockingSender()
+        pub = BackgroundPublisher(
+            sender, max_queue_size=1, block_timeout=0.01
+        )
+        self.addCleanup(pub.stop, 1)
+        with patch.object(pub, '_ensure_started'), \
+                self.assertLogs('django_events_sourcing.publisher'):
+            pub.submit(1)
+            pub.submit(2)
+        self.assertEqual(pub.dropped, 1)
+
+    def test_stop_flushes_queue(self):
+        sender = BlockingSender()
+        sender.release.set()
+        pub = BackgroundPublisher(sender)
+        pub.submit(1)
+        pub.submit(2)
+        pub.stop(5)
+        self.assertEqual(sum(sender.sent, []), [1, 2])
+
+    def test_reset_after_fork(self):
+        get_publisher(lambda events: None)
+        publisher._reset_after_fork()
+        self.assertIsNone(publisher._publisher)
+
+
+FakeEvent = namedtuple('FakeEvent', ['pk', 'seq'])
+
+
+class LaneSender:
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, events):
+        with self.lock:
+            self.sent.extend(
+                (threading.current_thread().name, event) for event in events
+            )
+
+
+class TestPartitionedPublisher(SimpleTestCase):
+    def test_events_of_an_object_stay_ordered(self):
+        sender = LaneSender()
+        pub = PartitionedPublisher(sender, lanes=4, batch_size=5)
+        self.addCleanup(pub.stop, 1)
+        for seq in range(200):
+            pub.submit(FakeEvent(seq % 20, seq))
+        self.assertTrue(pub.flush(5))
+
+        self.assertEqual(len(sender.sent), 200)
+        threads = {}
+        for thread, event in sender.sent:
+            threads.setdefault(event.pk, set()).add(thread)
+        self.assertTrue(all(len(names) == 1 for names in threads.values()))
+        self.assertGreater(len(set.union(*threads.values())), 1)
+        for pk in range(20):
+            self.assertEqual(
+                [event.seq for _, event in sender.sent if event.pk == pk],
+                list(range(pk, 200, 20))
+            )
+
+    def test_lane_stats(self):
+        instrument = StatsInstrument()
+        pub = PartitionedPublisher(lambda events: None, lanes=2)
+        self.addCleanup(pub.stop, 1)
+        with patch('django_events_sourcing.publisher.get_instrument',
+                   return_value=instrument):
+            pub.submit_many([FakeEvent(pk, 0) for pk in range(10)])
+            self.assertTrue(pub.flush(5))
+        stats = pub.stats()
+        self.assertEqual([lane['lane'] for lane in stats], [0, 1])
+        self.assertEqual(sum(lane['published'] for lane in stats), 10)
+        self.assertEqual(sum(
+            counter['value']
+            for counter in instrument.snapshot()['counters']
+            if counter['metric'] == 'lane_published'
+        ), 10)
+
+    def test_invalid_lanes(self):
+        with self.assertRaises(ValueError):
+            PartitionedPublisher(lambda events: None, lanes=0)
+
+    @override_settings(EVENTS_SOURCING_BACKGROUND_PUBLISHER={'lanes': 3})
+    def test_get_publisher(self):
+        self.addCleanup(shutdown_publisher)
+        pub = get_publisher(lambda events: None)
+        self.assertIsInstance(pub, PartitionedPublisher)
+        self.assertEqual(len(pub.lanes), 3)
+
+
+@override_settings(EVENTS_SOURCING_BACKEND='background')
+class TestBackgroundBackend(TestCase):
+    def tearDown(self) -> None:
+        shutdown_publisher()
+
+    @patch('django_events_sourcing.dispatcher.dispatch')
+    @patch('django_events_sourcing.dispatcher.send_events')
+    def test_save_submitted_to_background_thread(self, send_events, dispatch):
+        m = Model1.objects.create(
+            int_field=10, char_field='test', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1)
+        )
+        get_publisher(send_events).flush(5)
+        dispatch.assert_not_called()
+        events = send_events.call_args.args[0]
+        self.assertEqual(events[0].event_name, 'model1__created')
+        self.assertEqual(events[0].payload['id'], m.id)
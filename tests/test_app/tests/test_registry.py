@@ -0,0 +1,74 @@
+from django.test import TestCase, override_settings
+
+from django.conf import settings
+
+from django_events_sourcing.dispatcher import get_event_name, \
+    serialize_model, as_model_config
+from django_events_sourcing.registry import get_model_config, get_registry
+from django_events_sourcing.utils import load_model_configurations
+from tests.test_app.models import Model1, ModelNoEvent, StatusModel, \
+    StatusModel2
+from tests.test_app.serializers import Model1Serializer
+
+
+class TestModelRegistry(TestCase):
+    def test_registered_models_compiled(self):
+        self.assertEqual(
+            set(get_registry()), {Model1, StatusModel, StatusModel2}
+        )
+        config = get_model_config(Model1)
+        self.assertIs(config.serializer_class, Model1Serializer)
+        self.assertEqual(config.created_event, 'model1__created')
+        self.assertEqual(config.service_name, 'test_service')
+        self.assertEqual(config.exchange.name, 'test_service.events')
+
+    def test_not_registered_model(self):
+        self.assertIsNone(get_model_config(ModelNoEvent))
+        self.assertIsNone(load_model_configurations(ModelNoEvent))
+
+    def test_status_event_name(self):
+        config = get_model_config(StatusModel)
+        instance = StatusModel(status='finished')
+        self.assertEqual(
+            get_event_name(instance, config, 'updated'),
+            'status_model__finished'
+        )
+        self.assertEqual(
+            get_event_name(instance, config, 'deleted'),
+            'status_model__deleted'
+        )
+
+    def test_model_data_dicts_accepted(self):
+        instance = StatusModel(id=1, status='finished')
+        model_data, = [
+            model_data for model_data in settings.MODELS_CRUD_EVENT
+            if model_data['model'] == 'test_app.StatusModel'
+        ]
+        self.assertEqual(
+            get_event_name(instance, model_data, 'updated'),
+            'status_model__finished'
+        )
+        self.assertEqual(
+            get_event_name(Model1(), {'model': 'test_app.Model1'}, 'created'),
+            'model1__created'
+        )
+        self.assertIs(
+            as_model_config(instance, model_data),
+            get_model_config(StatusModel)
+        )
+        self.assertEqual(
+            serialize_model(instance, model_data),
+            serialize_model(instance, get_model_config(StatusModel))
+        )
+
+    def test_registry_rebuilt_on_override_settings(self):
+        with override_settings(MODELS_CRUD_EVENT=[
+            {'model': 'test_app.ModelNoEvent', 'service_name': 'other',
+             'event_name_prefix': 'no_event'}
+        ]):
+            self.assertIsNone(get_model_config(Model1))
+            config = get_model_config(ModelNoEvent)
+            self.assertEqual(config.updated_event, 'no_event__updated')
+            self.assertEqual(config.exchange.name, 'other.events')
+        self.assertIsNotNone(get_model_config(Model1))
+        self.assertIsNone(get_model_config(ModelNoEvent))
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from kombu import Connection, Queue
+
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.replay import replay_events, RateLimiter
+from django_events_sourcing.senders.kombu import get_exchange
+from tests.test_app.models import Model1
+from tests.test_app.tests.utils import create_model1
+
+
+@override_settings(AMQP_URI='memory://')
+class TestReplayEvents(TestCase):
+    @patch('django_events_sourcing.dispatcher.dispatch')
+    def setUp(self, dispatch):
+        self.instances = [create_model1(int_field=i) for i in range(7)]
+        self.connection = Connection('memory://')
+        self.queue = Queue(
+            'test_replay', exchange=get_exchange('test_service'),
+            routing_key='#'
+        )
+        self.queue(self.connection.default_channel).declare()
+        self.addCleanup(self.connection.release)
+
+    def received(self):
+        messages = []
+        while True:
+            message = self.queue(self.connection.default_channel).get(
+                no_ack=True)
+            if message is None:
+                return messages
+            messages.append((message.delivery_info['routing_key'],
+                             message.payload))
+
+    def test_replay(self):
+        checkpoints = []
+        published = replay_events(
+            Model1.objects.all(), get_model_config(Model1), chunk_size=3,
+            on_checkpoint=lambda pk, count: checkpoints.append((pk, count))
+        )
+        self.assertEqual(published, 7)
+        messages = self.received()
+        self.assertEqual(
+            [payload['id'] for _, payload in messages],
+            [m.id for m in self.instances]
+        )
+        self.assertEqual(
+            {routing_key for routing_key, _ in messages}, {'model1__snapshot'}
+        )
+        self.assertEqual(checkpoints, [
+            (self.instances[2].pk, 3), (self.instances[5].pk, 6),
+            (self.instances[6].pk, 7)
+        ])
+
+    def test_replay_workers(self):
+        checkpoints = []
+        published = replay_events(
+            Model1.objects.all(), get_model_config(Model1), chunk_size=2,
+            workers=2, after_pk=self.instances[0].pk, suffix='backfill',
+            on_checkpoint=lambda pk, count: checkpoints.append(pk)
+        )
+        self.assertEqual(published, 6)
+        messages = self.received()
+        self.assertEqual(
+            sorted(payload['id'] for _, payload in messages),
+            [m.id for m in self.instances[1:]]
+        )
+        self.assertEqual(messages[0][0], 'model1__backfill')
+        self.assertEqual(checkpoints, [m.pk for m in self.instances[2::2]])
+
+    @patch('django_events_sourcing.replay.send_events')
+    def test_failed_chunk_stops_checkpoints(self, send_events):
+        send_events.side_effect = [None, ValueError(), None, None]
+        checkpoints = []
+        with self.assertRaises(ValueError):
+            replay_events(
+                Model1.objects.all(), get_model_config(Model1), chunk_size=2,
+                workers=1,
+                on_checkpoint=lambda pk, count: checkpoints.append(pk)
+            )
+        self.assertEqual(checkpoints, [self.instances[1].pk])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'checkpoint.json')
+            out = StringIO()
+            call_command(
+                'replay_events', 'test_app.Model1', '--chunk-size', '4',
+                '--filter', 'int_field__in=1,2,3', '--since', '2019-01-01',
+                '--since-field', 'dt_field', '--checkpoint', path,
+                stdout=out
+            )
+            self.assertIn('Replayed 3 test_app.Model1 events.',
+                          out.getvalue())
+            with open(path) as checkpoint_file:
+                self.assertEqual(
+                    json.load(checkpoint_file),
+                    {'model': 'test_app.Model1',
+                     'pk': str(self.instances[3].pk), 'published': 3}
+                )
+            self.assertEqual(len(self.received()), 3)
+
+            # Resumes after the checkpoint
+            call_command(
+                'replay_events', 'test_app.Model1', '--checkpoint', path,
+                stdout=out
+            )
+            self.assertEqual(
+                [payload['id'] for _, payload in self.received()],
+                [m.id for m in self.instances[4:]]
+            )
+
+    def test_command_unregistered_model(self):
+        with self.assertRaises(CommandError):
+            call_command('replay_events', 'test_app.ModelNoEvent')
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(100)
+        with patch('django_events_sourcing.replay.time.sleep') as sleep:
+            limiter.wait(10)
+            limiter.wait(10)
+        delay = sleep.call_args[0][0]
+        self.assertGreater(delay, 0.05)
+        self.assertLessEqual(delay, 0.1)
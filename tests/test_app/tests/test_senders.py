@@ -0,0 +1,247 @@
+import socket
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+import amqp
+from django.test import SimpleTestCase
+from kombu import Connection, Queue
+
+from django_events_sourcing.senders import kombu as kombu_sender
+from django_events_sourcing.senders.kombu import dispatch_many, \
+    get_exchange, get_producer_pool, acquire_producer
+
+
+class FakeConfirmChannel:
+    """Channel in confirm mode that acks (or nacks) on drain_events."""
+
+    def __init__(self, nack=()):
+        self.events = defaultdict(set)
+        self.connection = self
+        self.nack = set(nack)
+        self.published = 0
+        self.drains = 0
+
+    def confirm_select(self):
+        pass
+
+    def drain_events(self, timeout=None):
+        self.drains += 1
+        for tag in range(1, self.published + 1):
+            name = 'basic_nack' if tag in self.nack else 'basic_ack'
+            for callback in list(self.events[name]):
+                callback(tag, False)
+
+
+class SilentConfirmChannel(FakeConfirmChannel):
+    """Channel in confirm mode that never confirms (e.g. was revived)."""
+
+    def drain_events(self, timeout=None):
+        self.drains += 1
+        time.sleep(min(timeout, 0.01))
+
+
+class ClosingConfirmChannel(FakeConfirmChannel):
+    """
+    Channel the broker closes with a 404 after a publish to a missing
+    exchange. Like py-amqp, it is revived in place out of confirm mode and
+    raises NotFound from drain_events.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.selects = 0
+        self.closing = False
+
+    def confirm_select(self):
+        self.selects += 1
+        self._confirm_selected = True
+
+    def drain_events(self, timeout=None):
+        if self.closing:
+            self.closing = False
+            self.published = 0
+            self._confirm_selected = False
+            raise amqp.exceptions.NotFound('no exchange')
+        if not self._confirm_selected:
+            # Not in confirm mode, nothing is ever confirmed.
+            self.drains += 1
+            time.sleep(min(timeout, 0.01))
+            return
+        super().drain_events(timeout)
+
+
+class TestDispatchMany(SimpleTestCase):
+    def patch_producer(self, channel, side_effect=None):
+        producer = MagicMock()
+        producer.channel = channel
+
+        def publish(*args, **kwargs):
+            if side_effect:
+                side_effect(*args, **kwargs)
+            channel.published += 1
+        producer.publish.side_effect = publish
+
+        @contextmanager
+        def acquire_producer(amqp_uri, **kwargs):
+            yield producer
+
+        patcher = patch(
+            'django_events_sourcing.senders.kombu.acquire_producer',
+            acquire_producer
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return producer
+
+    def test_memory_transport(self):
+        with Connection('memory://') as conn:
+            queue = Queue(
+                'test_dispatch_many', exchange=get_exchange('svc'),
+                routing_key='#'
+            )
+            queue(conn.default_channel).declare()
+            failed = dispatch_many(
+                'svc', [('a__created', {'id': 1}), ('a__updated', {'id': 1})],
+                'memory://'
+            )
+            self.assertEqual(failed, [])
+            messages = []
+            with conn.Consumer(queue, callbacks=[
+                lambda body, message: messages.append(
+                    (message.delivery_info['routing_key'], body))
+            ]):
+                conn.drain_events(timeout=1)
+                conn.drain_events(timeout=1)
+        self.assertEqual(
+            messages, [('a__created', {'id': 1}), ('a__updated', {'id': 1})]
+        )
+
+    def test_confirms_waited_once_per_batch(self):
+        channel = FakeConfirmChannel()
+        self.patch_producer(channel)
+        failed = dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(10)], 'amqp://'
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(channel.drains, 1)
+
+    def test_confirm_window(self):
+        channel = FakeConfirmChannel()
+        self.patch_producer(channel)
+        dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(10)], 'amqp://',
+            confirm_window=4
+        )
+        self.assertEqual(channel.drains, 3)
+
+    def test_nacked_messages_reported(self):
+        channel = FakeConfirmChannel(nack=[2, 4])
+        self.patch_producer(channel)
+        failed = dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(5)], 'amqp://'
+        )
+        self.assertEqual([index for index, _ in failed], [1, 3])
+        for _, exc in failed:
+            self.assertIsInstance(exc, amqp.exceptions.MessageNacked)
+
+    def test_unconfirmed_messages_reported_after_timeout(self):
+        channel = SilentConfirmChannel()
+        self.patch_producer(channel)
+        failed = dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(3)], 'amqp://',
+            confirm_timeout=0.05
+        )
+        self.assertEqual([index for index, _ in failed], [0, 1, 2])
+        for _, exc in failed:
+            self.assertIsInstance(exc, socket.timeout)
+
+    def test_channel_closed_by_broker(self):
+        channel = ClosingConfirmChannel()
+
+        def side_effect(payload, **kwargs):
+            if payload.get('missing'):
+                channel.closing = True
+        self.patch_producer(channel, side_effect)
+        failed = dispatch_many(
+            'svc', [('e', {'id': 0}), ('e', {'missing': True}),
+                    ('e', {'id': 2}), ('e', {'id': 3})],
+            'amqp://', confirm_window=2, confirm_timeout=1
+        )
+        self.assertEqual([index for index, _ in failed], [0, 1])
+        for _, exc in failed:
+            self.assertIsInstance(exc, amqp.exceptions.NotFound)
+        self.assertEqual(channel.selects, 2)
+
+        # The pooled channel is put in confirm mode again.
+        start = time.monotonic()
+        failed = dispatch_many(
+            'svc', [('e', {'id': 0})], 'amqp://', confirm_timeout=1
+        )
+        self.assertEqual(failed, [])
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_publish_errors_reported(self):
+        channel = FakeConfirmChannel()
+
+        def side_effect(payload, **kwargs):
+            if payload['id'] == 1:
+                raise ValueError()
+        self.patch_producer(channel, side_effect)
+        failed = dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(3)], 'amqp://'
+        )
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0][0], 1)
+        self.assertIsInstance(failed[0][1], ValueError)
+
+    def test_channel_closed_on_publish(self):
+        channel = FakeConfirmChannel()
+
+        def side_effect(payload, **kwargs):
+            if payload['id'] == 1:
+                raise amqp.exceptions.NotFound()
+        self.patch_producer(channel, side_effect)
+        failed = dispatch_many(
+            'svc', [('e', {'id': i}) for i in range(3)], 'amqp://'
+        )
+        # The message published before the channel closed is lost too.
+        self.assertEqual([index for index, _ in failed], [0, 1])
+        for _, exc in failed:
+            self.assertIsInstance(exc, amqp.exceptions.NotFound)
+        # The last message is numbered from 1 on the revived channel.
+        self.assertEqual(channel._events_sourcing_delivery_tag, 1)
+
+
+class TestProducerPools(SimpleTestCase):
+    def test_pool_reused(self):
+        pool = get_producer_pool('memory://')
+        self.assertIs(get_producer_pool('memory://'), pool)
+        self.assertIsNot(
+            get_producer_pool('memory://', transport_options={}), pool
+        )
+        self.assertIsNot(get_producer_pool('memory://', heartbeat=10), pool)
+        with pool.acquire() as producer:
+            self.assertEqual(producer.connection.heartbeat, 60)
+
+    def test_connection_kept_between_publishes(self):
+        with acquire_producer('memory://') as producer:
+            connection = producer.connection.connection
+        with acquire_producer('memory://') as producer:
+            self.assertIs(producer.connection.connection, connection)
+
+    def test_reset_after_fork(self):
+        pool = get_producer_pool('memory://')
+        kombu_sender._reset_after_fork()
+        self.assertIsNot(get_producer_pool('memory://'), pool)
+
+    def test_dead_connection_revived(self):
+        producer = MagicMock()
+        connection = producer.connection
+        connection.recoverable_connection_errors = (OSError,)
+        connection.heartbeat_check.side_effect = OSError()
+        kombu_sender._check_connection(producer)
+        connection.collect.assert_called_once()
+        connection.ensure_connection.assert_called_once()
+        producer.revive.assert_called_once_with(connection.default_channel)
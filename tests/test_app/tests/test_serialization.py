@@ -0,0 +1,135 @@
+import uuid
+from datetime import datetime
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from django_events_sourcing.dispatcher import serialize_model, \
+    serialize_models, build_events
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.suppression import suppress_events
+from tests.test_app.models import Model1, Model1Child, StatusModel
+from tests.test_app.tests.utils import ProducerMockMixin, create_model1
+
+
+class TestSerializerCache(TestCase):
+    def setUp(self) -> None:
+        self.instance = StatusModel(
+            id=1, status='created', int_field=10, char_field='test',
+            uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+        )
+
+    def test_serializer_reused_between_events(self):
+        config = get_model_config(StatusModel)
+        first = serialize_model(self.instance, config)
+        serializer = config.get_serializer()
+        self.instance.status = 'failed'
+        second = serialize_model(self.instance, config)
+        self.assertIs(config.get_serializer(), serializer)
+        self.assertEqual(first['status'], 'created')
+        self.assertEqual(second, {
+            'id': 1,
+            'status': 'failed',
+            'int_field': 10,
+            'char_field': 'test',
+            'uuid_field': str(self.instance.uuid_field),
+            'dt_field': '2019-01-01T00:00:00',
+        })
+
+    def test_cache_disabled_for_custom_serializers(self):
+        config = get_model_config(Model1)
+        m = Model1(id=3, int_field=1, char_field='a')
+        data = serialize_model(m, config)
+        self.assertIsNone(config._serializer)
+        self.assertEqual(data, {'id': 3, 'int_field': 1, 'char_field': 'a'})
+
+    @override_settings(MODELS_CRUD_EVENT=[
+        {'model': 'test_app.Model1', 'cache_serializer': True,
+         'serializer': 'tests.test_app.serializers.Model1Serializer'}
+    ])
+    def test_cache_enabled_for_custom_serializer(self):
+        config = get_model_config(Model1)
+        serialize_model(Model1(id=3, int_field=1, char_field='a'), config)
+        self.assertIsNotNone(config._serializer)
+
+    @override_settings(EVENTS_SOURCING_WARM_SERIALIZERS=True)
+    def test_serializers_warmed(self):
+        self.assertIsNone(get_model_config(Model1)._serializer)
+        self.assertIsNotNone(get_model_config(StatusModel)._serializer)
+
+
+@override_settings(MODELS_CRUD_EVENT=[
+    {'model': 'test_app.Model1', 'prefetch_related': ['children'],
+     'serializer': 'tests.test_app.serializers.Model1NestedSerializer'},
+    {'model': 'test_app.Model1Child', 'select_related': ['model1'],
+     'serializer': 'tests.test_app.serializers.Model1ChildSerializer'},
+])
+class TestBatchSerialization(ProducerMockMixin, TestCase):
+    def create(self, count):
+        with suppress_events():
+            parents = [create_model1(int_field=i) for i in range(count)]
+            for parent in parents:
+                Model1Child.objects.create(model1=parent, name='a')
+                Model1Child.objects.create(model1=parent, name='b')
+        return parents
+
+    def test_prefetch_related(self):
+        parents = [
+            Model1.objects.get(pk=parent.pk) for parent in self.create(5)
+        ]
+        config = get_model_config(Model1)
+        # One query re-fetches the instances, one prefetches the children.
+        with self.assertNumQueries(2):
+            events = build_events(parents, config, 'updated')
+        self.assertEqual(events[0].event_name, 'model1__updated')
+        self.assertEqual(events[0].pk, parents[0].pk)
+        self.assertEqual(events[0].payload, {
+            'id': parents[0].pk, 'int_field': 0,
+            'children': [
+                {'id': child.pk, 'name': child.name}
+                for child in parents[0].children.order_by('pk')
+            ],
+        })
+
+    def test_select_related(self):
+        self.create(3)
+        children = list(Model1Child.objects.order_by('pk'))
+        config = get_model_config(Model1Child)
+        with self.assertNumQueries(1):
+            events = build_events(children, config, 'created')
+        self.assertEqual(
+            [event.payload['model1']['id'] for event in events],
+            [child.model1_id for child in children]
+        )
+
+    def test_unsaved_instances_prefetched_in_place(self):
+        parent, = self.create(1)
+        child = Model1Child(model1_id=parent.pk, name='c')
+        config = get_model_config(Model1Child)
+        with self.assertNumQueries(1):
+            event, = build_events([child], config, 'created')
+        self.assertEqual(event.payload['model1']['id'], parent.pk)
+
+    def test_update_queries_dont_grow_with_rows(self):
+        self.create(6)
+        counts = []
+        for pks in ([Model1.objects.order_by('pk')[0].pk],
+                    list(Model1.objects.values_list('pk', flat=True))):
+            with CaptureQueriesContext(connection) as queries:
+                Model1.objects.filter(pk__in=pks).update(int_field=7)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        published = self.published()
+        self.assertEqual(len(published), 7)
+        self.assertEqual(len(published[-1][1]['children']), 2)
+
+    def test_cached_list_serializer(self):
+        parent, = self.create(1)
+        config = get_model_config(Model1)
+        config.cache_serializer = True
+        self.addCleanup(setattr, config, 'cache_serializer', False)
+        self.assertEqual(
+            serialize_models([parent], config)[0]['int_field'], 0
+        )
+        self.assertIsNotNone(config._list_serializer)
@@ -0,0 +1,215 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from kombu import Connection, Queue
+
+from django_events_sourcing.senders.kombu import get_exchange
+from django_events_sourcing.senders.sidecar import SidecarPublisher, \
+    SidecarError, get_sidecar_client
+from tests.test_app.tests.utils import create_model1
+
+
+class SidecarTestMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'events.sock')
+        self.connection = Connection('memory://')
+        self.addCleanup(self.connection.release)
+        self.queue = Queue(
+            'test_sidecar', exchange=get_exchange('test_service'),
+            routing_key='#'
+        )
+        self.queue(self.connection.default_channel).declare()
+
+    def start_publisher(self, **options):
+        publisher = SidecarPublisher(self.path, 'memory://', **options)
+        publisher.start()
+        self.addCleanup(publisher.stop, 5)
+        return publisher
+
+    def received(self):
+        messages = []
+        while True:
+            message = self.queue(self.connection.default_channel).get(
+                no_ack=True)
+            if message is None:
+                return messages
+            messages.append((message.delivery_info['routing_key'],
+                             message.payload))
+
+    def sidecar_settings(self, ack='enqueue'):
+        return self.settings(
+            EVENTS_SOURCING_SENDER='sidecar',
+            EVENTS_SOURCING_SIDECAR={'path': self.path, 'ack': ack}
+        )
+
+
+@override_settings(AMQP_URI='amqp://unused')
+class TestSidecar(SidecarTestMixin, TestCase):
+    def test_events_published_by_the_sidecar(self):
+        publisher = self.start_publisher(connections=2)
+        with self.sidecar_settings():
+            m1 = create_model1()
+            m1.int_field = 20
+            m1.save()
+            get_sidecar_client().close()
+        self.assertTrue(publisher.flush(5))
+        self.assertEqual(self.received(), [
+            ('model1__created',
+             {'id': m1.id, 'int_field': 10, 'char_field': 'test'}),
+            ('model1__updated',
+             {'id': m1.id, 'int_field': 20, 'char_field': 'test'}),
+        ])
+        self.assertEqual(publisher.stats()['published'], 2)
+
+    def test_fire_and_forget(self):
+        publisher = self.start_publisher()
+        with self.sidecar_settings(ack='fire_and_forget'):
+            create_model1()
+            create_model1()
+            get_sidecar_client().close()
+        # The frames may still be in the socket.
+        for _ in range(500):
+            if publisher.stats()['received'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertTrue(publisher.flush(5))
+        self.assertEqual(len(self.received()), 2)
+
+    def test_publisher_unavailable(self):
+        with self.sidecar_settings():
+            with self.assertRaises(SidecarError):
+                create_model1()
+
+    def test_queue_full(self):
+        publisher = self.start_publisher()
+        with self.sidecar_settings():
+            with patch.object(publisher, 'enqueue', return_value=False):
+                with self.assertRaises(SidecarError):
+                    create_model1()
+            get_sidecar_client().close()
+
+    def test_enqueue_without_blocking(self):
+        publisher = SidecarPublisher(
+            self.path, 'memory://', connections=1, max_queue_size=1
+        )
+        record = {'key': 'test_app.Model1:1'}
+        self.assertTrue(publisher.enqueue([record], block=False))
+        self.assertFalse(publisher.enqueue([record, record], block=False))
+        # Nothing is queued when the frame doesn't fit.
+        self.assertEqual(publisher.stats()['rejected'], 2)
+        self.assertEqual(publisher.stats()['queued'], 1)
+        publisher.queues[0].get_nowait()
+        publisher._release(0, 1)
+        # Frames larger than a lane are taken once it is empty.
+        self.assertTrue(publisher.enqueue([record, record], block=False))
+        self.assertEqual(publisher.stats()['queued'], 2)
+
+    def test_blocked_frame_does_not_stall_others(self):
+        publisher = SidecarPublisher(
+            self.path, 'memory://', connections=1, max_queue_size=1
+        )
+        record = {'key': 'test_app.Model1:1'}
+        publisher.enqueue([record])
+        blocked = threading.Thread(
+            target=publisher.enqueue, args=([record],), daemon=True
+        )
+        blocked.start()
+        blocked.join(0.05)
+        self.assertTrue(blocked.is_alive())
+        # Ack mode frames are answered right away.
+        start = time.monotonic()
+        self.assertFalse(publisher.enqueue([record], block=False))
+        self.assertLess(time.monotonic() - start, 0.5)
+        publisher.queues[0].get_nowait()
+        publisher._release(0, 1)
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(publisher.stats()['queued'], 1)
+
+    def test_delivery_mode_kept(self):
+        publisher = SidecarPublisher(self.path, 'memory://')
+        records = [
+            {'service': 'a', 'encoder': None, 'event': event,
+             'payload': {}, 'key': event, 'delivery_mode': delivery_mode}
+            for event, delivery_mode in (
+                ('a1', 'fire_and_forget'), ('a2', 'async_confirm'),
+                ('a3', 'confirm'))
+        ]
+        calls = []
+
+        def dispatch_many(service_name, events, amqp_uri, **kwargs):
+            calls.append(
+                ([name for name, _ in events], kwargs.get('delivery_mode'))
+            )
+            return []
+
+        with patch('django_events_sourcing.senders.sidecar.dispatch_many',
+                   dispatch_many):
+            self.assertEqual(publisher._publish(records), [])
+        self.assertEqual(
+            calls, [(['a1'], 'fire_and_forget'), (['a2', 'a3'], None)]
+        )
+
+    def test_kombu_sender_by_default(self):
+        self.assertIsNone(get_sidecar_client())
+        with self.settings(EVENTS_SOURCING_SENDER='other'):
+            with self.assertRaises(ValueError):
+                get_sidecar_client()
+
+    def test_only_failed_records_retried(self):
+        publisher = SidecarPublisher(
+            self.path, 'memory://', retry_interval=0
+        )
+        records = [
+            {'service': service, 'encoder': None, 'event': event,
+             'payload': {}, 'key': event}
+            for service, event in (('a', 'a1'), ('b', 'b1'), ('b', 'b2'),
+                                   ('b', 'b3'), ('a', 'a2'))
+        ]
+        calls = []
+
+        def dispatch_many(service_name, events, amqp_uri, **kwargs):
+            calls.append([name for name, _ in events])
+            if len(calls) == 2:
+                return [(1, ConnectionError('boom'))]
+            return []
+
+        with patch('django_events_sourcing.senders.sidecar.dispatch_many',
+                   dispatch_many):
+            with self.assertLogs(
+                    'django_events_sourcing.senders.sidecar', 'ERROR'):
+                pending = publisher._publish(records)
+            self.assertEqual(
+                [record['event'] for record in pending], ['b2', 'a2']
+            )
+            self.assertEqual(publisher._publish(pending), [])
+        self.assertEqual(
+            calls, [['a1'], ['b1', 'b2', 'b3'], ['b2'], ['a2']]
+        )
+
+    def test_socket_is_private(self):
+        self.start_publisher()
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_running_publisher_not_replaced(self):
+        self.start_publisher()
+        with self.assertRaises(SidecarError):
+            SidecarPublisher(self.path, 'memory://').start()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_stale_socket_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        self.start_publisher()
+        with self.sidecar_settings():
+            create_model1()
+            get_sidecar_client().close()
@@ -0,0 +1,192 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from django_events_sourcing import spool
+from django_events_sourcing.breaker import CircuitBreaker
+from django_events_sourcing.dispatcher import send_event_group, group_events
+from django_events_sourcing.events import Event
+from django_events_sourcing.registry import get_model_config
+from django_events_sourcing.spool import Spool, BrokerGuard, \
+    get_broker_guard, shutdown_broker_guard
+from tests.test_app.models import Model1
+from tests.test_app.tests.utils import create_model1
+
+
+class TempDirMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'events.spool')
+
+
+class TestSpool(TempDirMixin, SimpleTestCase):
+    def test_append_read_commit(self):
+        s = Spool(self.path)
+        self.addCleanup(s.close)
+        self.assertFalse(s.pending)
+        s.append([{'a': 1}, {'a': 2}])
+        s.append([{'a': 3}])
+        self.assertTrue(s.pending)
+
+        records, offset = s.read(2)
+        self.assertEqual(records, [{'a': 1}, {'a': 2}])
+        self.assertFalse(s.commit(offset))
+        self.assertEqual(s.read(10)[0], [{'a': 3}])
+
+        # A new spool resumes from the saved offset
+        self.assertTrue(Spool(self.path).pending)
+        records, offset = s.read(10)
+        self.assertTrue(s.commit(offset))
+        self.assertFalse(s.pending)
+        self.assertEqual(s.size(), 0)
+        self.assertFalse(os.path.exists(s.offset_path))
+
+    def test_partial_record_is_not_read(self):
+        s = Spool(self.path)
+        self.addCleanup(s.close)
+        s.append([{'a': 1}])
+        with open(self.path, 'ab') as spool_file:
+            spool_file.write(spool.HEADER.pack(100) + b'{"a"')
+        records, offset = s.read(10)
+        self.assertEqual(records, [{'a': 1}])
+        self.assertFalse(s.commit(offset))
+
+    def test_fsync_policy(self):
+        with patch('django_events_sourcing.spool.os.fsync') as fsync:
+            s = Spool(self.path, fsync='never')
+            s.append([{}])
+            s.close()
+            fsync.assert_not_called()
+            s = Spool(self.path, fsync='interval', fsync_interval=60)
+            s.append([{}])
+            s.append([{}])
+            s.close()
+            self.assertEqual(fsync.call_count, 1)
+            s = Spool(self.path)
+            s.append([{}])
+            s.append([{}])
+            s.close()
+            self.assertEqual(fsync.call_count, 3)
+
+    def test_invalid_fsync(self):
+        with self.assertRaises(ValueError):
+            Spool(self.path, fsync='sometimes')
+
+
+class TestCircuitBreaker(SimpleTestCase):
+    @patch('django_events_sourcing.breaker.time.monotonic')
+    def test_states(self, monotonic):
+        monotonic.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+        monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow())
+        # A failed probe opens it again
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+
+        monotonic.return_value = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertFalse(breaker.is_open)
+
+
+class TestBrokerGuard(TempDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.model_config = get_model_config(Model1)
+        self.sent = []
+        self.broker_down = True
+
+        def send(events):
+            if self.broker_down:
+                raise ConnectionError('broker down')
+            self.sent.extend(event.event_name for event in events)
+            return []
+
+        self.guard = BrokerGuard(
+            send, lambda events: [events] if events else [],
+            spool_path=self.path, failure_threshold=2, drain_interval=60,
+            drain_batch_size=2
+        )
+        self.addCleanup(self.guard.stop, 1)
+
+    def event(self, name):
+        return Event(self.model_config, name, {'name': name}, 1, 'updated')
+
+    def test_spools_and_drains_in_order(self):
+        self.guard.publish([self.event('e1')])
+        self.assertFalse(self.guard.breaker.is_open)
+        # Events wait behind the spooled ones
+        self.broker_down = False
+        self.guard.publish([self.event('e2')])
+        self.assertEqual(self.sent, [])
+        self.broker_down = True
+        with self.assertLogs('django_events_sourcing.spool', 'WARNING'):
+            self.assertEqual(self.guard.drain(), 0)
+        self.assertTrue(self.guard.breaker.is_open)
+        self.guard.publish([self.event('e3')])
+
+        self.broker_down = False
+        self.guard.breaker.opened_at -= 60
+        self.assertEqual(self.guard.drain(), 3)
+        self.assertEqual(self.sent, ['e1', 'e2', 'e3'])
+        self.assertFalse(self.guard.spool.pending)
+        self.assertFalse(self.guard.breaker.is_open)
+
+        self.guard.publish([self.event('e4')])
+        self.assertEqual(self.sent, ['e1', 'e2', 'e3', 'e4'])
+
+    def test_only_failed_events_are_spooled(self):
+        def send(events):
+            return [(events[1], ValueError())]
+        self.guard.send_events = send
+        self.guard.publish([self.event('e1'), self.event('e2')])
+        records, _ = self.guard.spool.read(10)
+        self.assertEqual([record['event'] for record in records], ['e2'])
+
+
+@override_settings(AMQP_URI='memory://')
+class TestCircuitBreakerSetting(TempDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(shutdown_broker_guard)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_broker_guard(send_event_group, group_events))
+
+    def test_save_during_outage(self):
+        with self.settings(EVENTS_SOURCING_CIRCUIT_BREAKER={
+                'spool_path': self.path, 'drain_interval': 60}):
+            guard = get_broker_guard(send_event_group, group_events)
+            with patch('django_events_sourcing.dispatcher.dispatch_many',
+                       side_effect=ConnectionError('broker down')):
+                m = create_model1()
+            records, _ = guard.spool.read(10)
+            self.assertEqual(records[0]['model'], 'test_app.Model1')
+            self.assertEqual(records[0]['event'], 'model1__created')
+            self.assertEqual(records[0]['payload']['id'], m.id)
+
+            with patch('django_events_sourcing.dispatcher.dispatch_many',
+                       return_value=[]) as dispatch_many:
+                self.assertEqual(guard.drain(), 1)
+            self.assertEqual(
+                dispatch_many.call_args.args[1][0][0], 'model1__created'
+            )
+            self.assertFalse(guard.spool.pending)
+
+    def test_spool_path_required(self):
+        with self.settings(EVENTS_SOURCING_CIRCUIT_BREAKER={}):
+            with self.assertRaises(ValueError):
+                get_broker_guard(send_event_group, group_events)
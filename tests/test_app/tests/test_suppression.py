@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from django_events_sourcing.register import disable_model_obj_dispatcher
+from django_events_sourcing.suppression import suppress_events, \
+    is_suppressed, is_model_suppressed
+from tests.test_app.models import Model1, StatusModel
+from tests.test_app.tests.utils import create_model1
+
+
+def create_status_model():
+    return StatusModel.objects.create(
+        status='created', int_field=10, char_field='test',
+        uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+    )
+
+
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestSuppressEvents(TestCase):
+    @patch('django_events_sourcing.dispatcher.dispatch')
+    def setUp(self, dispatch):
+        self.m1 = create_model1()
+        self.m2 = create_model1()
+
+    def event_names(self, dispatch):
+        return [c.args[1] for c in dispatch.call_args_list]
+
+    def test_everything(self, dispatch):
+        with suppress_events():
+            create_model1()
+            create_status_model()
+            self.m1.delete()
+        dispatch.assert_not_called()
+        create_model1()
+        dispatch.assert_called_once()
+
+    def test_models(self, dispatch):
+        with suppress_events(models=['test_app.StatusModel']):
+            create_status_model()
+            create_model1()
+        with suppress_events(models=[Model1]):
+            create_model1()
+            create_status_model()
+        self.assertEqual(
+            self.event_names(dispatch),
+            ['model1__created', 'status_model__created']
+        )
+
+    def test_instances(self, dispatch):
+        with suppress_events(instances=[self.m1, self.m2]):
+            self.m1.save()
+            self.m2.save()
+            self.assertTrue(is_suppressed(Model1.objects.get(pk=self.m1.pk)))
+            self.assertFalse(is_model_suppressed(Model1))
+        dispatch.assert_not_called()
+        self.m1.save()
+        dispatch.assert_called_once()
+
+    def test_nested_scopes_add_up(self, dispatch):
+        with suppress_events(instances=[self.m1]):
+            with suppress_events(models=[StatusModel]):
+                self.assertTrue(is_suppressed(self.m1))
+                self.assertTrue(is_model_suppressed(StatusModel))
+            self.assertTrue(is_suppressed(self.m1))
+            self.assertFalse(is_model_suppressed(StatusModel))
+        self.assertFalse(is_suppressed(self.m1))
+
+    def test_decorator(self, dispatch):
+        @suppress_events(models=[Model1])
+        def migrate():
+            create_model1()
+        migrate()
+        migrate()
+        dispatch.assert_not_called()
+
+    def test_bulk_operations_skip_collection(self, dispatch):
+        with suppress_events(models=[Model1]):
+            with self.assertNumQueries(1):
+                Model1.objects.update(int_field=5)
+            Model1.objects.bulk_update([self.m1], ['int_field'])
+            Model1.objects.all().delete()
+        dispatch.assert_not_called()
+
+    def test_scope_is_local_to_thread(self, dispatch):
+        results = []
+
+        def other_thread():
+            results.append(is_suppressed(self.m1))
+
+        with suppress_events():
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+        self.assertEqual(results, [False])
+
+    def test_scope_is_local_to_task(self, dispatch):
+        async def check(event):
+            await event.wait()
+            return is_suppressed(self.m1)
+
+        async def suppressed(event):
+            with suppress_events():
+                inner = asyncio.create_task(check(event))
+                event.set()
+                return await inner
+
+        async def main():
+            event = asyncio.Event()
+            outer = asyncio.create_task(check(event))
+            return await asyncio.gather(suppressed(event), outer)
+
+        self.assertEqual(asyncio.run(main()), [True, False])
+
+    def test_model_disabler_list(self, dispatch):
+        with disable_model_obj_dispatcher([self.m1, self.m2]):
+            self.m1.save()
+            self.m2.save()
+        dispatch.assert_not_called()
+        self.assertFalse(is_suppressed(self.m1))
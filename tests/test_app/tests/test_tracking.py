@@ -0,0 +1,218 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from django_events_sourcing.dispatcher import event_batch
+from tests.test_app.models import Model1, StatusModel
+from tests.test_app.tests.utils import create_model1, ProducerMockMixin
+
+DELTA_SETTINGS = [
+    {'model': 'test_app.Model1', 'update_payload': 'delta',
+     'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    {'model': 'test_app.StatusModel', 'status_field': 'status',
+     'update_payload': 'delta', 'coalesce': True},
+]
+
+
+def sent_payloads(dispatch):
+    return [(c[0][1], c[0][2]) for c in dispatch.call_args_list]
+
+
+@override_settings(MODELS_CRUD_EVENT=DELTA_SETTINGS)
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestDeltaPayloads(ProducerMockMixin, TestCase):
+    def test_created_is_full(self, dispatch):
+        m1 = create_model1()
+        self.assertEqual(sent_payloads(dispatch), [
+            ('model1__created',
+             {'id': m1.id, 'int_field': 10, 'char_field': 'test'}),
+        ])
+
+    def test_updated_has_only_changed_fields(self, dispatch):
+        m1 = create_model1()
+        m1.int_field = 20
+        m1.save()
+        self.assertEqual(sent_payloads(dispatch)[1], (
+            'model1__updated', {'id': m1.id, 'int_field': 20}
+        ))
+
+    def test_loaded_instance_tracked(self, dispatch):
+        m1 = Model1.objects.get(pk=create_model1().pk)
+        m1.char_field = 'changed'
+        m1.save()
+        m1.int_field = 1
+        m1.save()
+        self.assertEqual(sent_payloads(dispatch)[1:], [
+            ('model1__updated', {'id': m1.id, 'char_field': 'changed'}),
+            ('model1__updated', {'id': m1.id, 'int_field': 1}),
+        ])
+
+    def test_unchanged_save(self, dispatch):
+        m1 = create_model1()
+        m1.save()
+        self.assertEqual(sent_payloads(dispatch)[1], (
+            'model1__updated', {'id': m1.id}
+        ))
+
+    def test_update_fields(self, dispatch):
+        m1 = create_model1()
+        m1.int_field = 20
+        m1.char_field = 'not saved'
+        m1.save(update_fields=['int_field'])
+        m1.save(update_fields=['char_field'])
+        self.assertEqual(sent_payloads(dispatch)[1:], [
+            ('model1__updated', {'id': m1.id, 'int_field': 20}),
+            ('model1__updated', {'id': m1.id, 'char_field': 'not saved'}),
+        ])
+
+    def test_deleted_is_full(self, dispatch):
+        m1 = create_model1()
+        m1_id = m1.id
+        m1.int_field = 30
+        m1.delete()
+        self.assertEqual(sent_payloads(dispatch)[1], (
+            'model1__deleted',
+            {'id': m1_id, 'int_field': 30, 'char_field': 'test'}
+        ))
+
+    def test_status_model_delta(self, dispatch):
+        status = StatusModel.objects.create(
+            int_field=1, char_field='a', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1), status='created'
+        )
+        status.status = 'finished'
+        status.save()
+        self.assertEqual(sent_payloads(dispatch)[1], (
+            'status_model__finished', {'id': status.id, 'status': 'finished'}
+        ))
+
+    def test_bulk_update_fields(self, dispatch):
+        m1 = create_model1()
+        m1.int_field = 5
+        m1.char_field = 'not saved'
+        Model1.objects.bulk_update([m1], ['int_field'])
+        self.assertEqual(self.published(), [
+            ('model1__updated', {'id': m1.id, 'int_field': 5}),
+        ])
+
+    def test_queryset_update(self, dispatch):
+        m1 = create_model1()
+        Model1.objects.filter(pk=m1.pk).update(int_field=7)
+        self.assertEqual(self.published(), [
+            ('model1__updated', {'id': m1.id, 'int_field': 7}),
+        ])
+
+    def test_coalesced_deltas_merged(self, dispatch):
+        status = StatusModel.objects.create(
+            int_field=1, char_field='a', uuid_field=uuid.uuid4(),
+            dt_field=datetime(2019, 1, 1), status='modified'
+        )
+        with event_batch():
+            status.int_field = 2
+            status.save()
+            status.char_field = 'b'
+            status.save()
+        self.assertEqual(self.published(), [
+            ('status_model__modified',
+             {'id': status.id, 'int_field': 2, 'char_field': 'b'}),
+        ])
+
+
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestFullPayloadDefault(TestCase):
+    def test_updated_is_full(self, dispatch):
+        m1 = create_model1()
+        m1.int_field = 20
+        m1.save()
+        self.assertEqual(dispatch.call_args[0][2]['int_field'], 20)
+        self.assertIn('char_field', dispatch.call_args[0][2])
+
+    def test_not_tracked(self, dispatch):
+        m1 = create_model1()
+        self.assertNotIn('_events_sourcing_snapshot', m1.__dict__)
+
+
+FILTER_SETTINGS = [
+    {'model': 'test_app.Model1', 'ignore_fields': ['char_field', 'dt_field'],
+     'serializer': 'tests.test_app.serializers.Model1Serializer'},
+    {'model': 'test_app.StatusModel', 'status_field': 'status',
+     'watch_fields': ['int_field']},
+]
+
+
+@override_settings(MODELS_CRUD_EVENT=FILTER_SETTINGS)
+@patch('django_events_sourcing.dispatcher.dispatch')
+class TestFieldFilters(ProducerMockMixin, TestCase):
+    def create_status_model(self):
+        return StatusModel.objects.create(
+            status='created', int_field=10, char_field='test',
+            uuid_field=uuid.uuid4(), dt_field=datetime(2019, 1, 1)
+        )
+
+    def test_ignored_update_fields_skip_serialization(self, dispatch):
+        m1 = create_model1()
+        m1.char_field = 'seen'
+        with patch('django_events_sourcing.dispatcher.serialize_model') \
+                as serialize_model:
+            m1.save(update_fields=['char_field'])
+            serialize_model.assert_not_called()
+        m1.save(update_fields=['char_field', 'int_field'])
+        self.assertEqual(
+            [name for name, _ in sent_payloads(dispatch)],
+            ['model1__created', 'model1__updated']
+        )
+
+    def test_tracked_changes(self, dispatch):
+        m1 = Model1.objects.get(pk=create_model1().pk)
+        m1.char_field = 'seen'
+        m1.save()
+        m1.save()
+        self.assertEqual(dispatch.call_count, 1)
+        m1.int_field = 30
+        m1.save()
+        self.assertEqual(sent_payloads(dispatch)[1][0], 'model1__updated')
+
+    def test_watch_fields_with_status_transitions(self, dispatch):
+        m = self.create_status_model()
+        m.char_field = 'other'
+        m.save()
+        m.status = 'paid'
+        m.save()
+        m.int_field = 20
+        m.save()
+        self.assertEqual(
+            [name for name, _ in sent_payloads(dispatch)],
+            ['status_model__created', 'status_model__paid',
+             'status_model__paid']
+        )
+
+    def test_queryset_update_skips_fetch(self, dispatch):
+        create_model1()
+        with self.assertNumQueries(1):
+            Model1.objects.update(char_field='bulk')
+        self.assertEqual(self.published(), [])
+        Model1.objects.update(int_field=3)
+        self.assertEqual(
+            [name for name, _ in self.published()], ['model1__updated']
+        )
+
+    def test_bulk_update(self, dispatch):
+        m1 = create_model1()
+        m1.char_field = 'bulk'
+        Model1.objects.bulk_update([m1], ['char_field'])
+        self.assertEqual(self.published(), [])
+        Model1.objects.bulk_update([m1], ['char_field', 'int_field'])
+        self.assertEqual(
+            [name for name, _ in self.published()], ['model1__updated']
+        )
+
+    def test_invalid_settings(self, dispatch):
+        for model_data in (
+                {'watch_fields': ['int_field'], 'ignore_fields': ['id']},
+                {'ignore_fields': ['missing']}):
+            with self.assertRaises(ValueError):
+                with self.settings(MODELS_CRUD_EVENT=[
+                        dict(model_data, model='test_app.Model1')]):
+                    pass
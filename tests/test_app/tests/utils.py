@@ -0,0 +1,40 @@
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from tests.test_app.models import Model1
+
+
+def create_model1(**kwargs):
+    return Model1.objects.create(
+        int_field=kwargs.get('int_field', 10),
+        char_field='test',
+        uuid_field=uuid.uuid4(),
+        dt_field=datetime(2019, 1, 1)
+    )
+
+
+class ProducerMockMixin:
+    def setUp(self) -> None:
+        self.producer = MagicMock()
+        self.producer.channel = MagicMock(spec=[])
+        self.acquired = 0
+
+        @contextmanager
+        def acquire_producer(amqp_uri, **kwargs):
+            self.acquired += 1
+            yield self.producer
+
+        patcher = patch(
+            'django_events_sourcing.senders.kombu.acquire_producer',
+            acquire_producer
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [
+            (c.kwargs['routing_key'], c.args[0])
+            for c in self.producer.publish.call_args_list
+        ]